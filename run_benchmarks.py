@@ -0,0 +1,18 @@
+"""
+Micro-benchmarks of the numerical kernels, run without Mantid.
+
+    python run_benchmarks.py                   Runs all cases and stores results under the current commit
+    python run_benchmarks.py <filter>          Runs only cases with <filter> in their name
+    python run_benchmarks.py --compare A B     Compares stored results of commits A and B
+"""
+
+from vesuvio_analysis.benchmarks.runner import runBenchmarks, storeResults, loadResults, compareResults
+import sys
+
+if __name__ == "__main__":
+    if (len(sys.argv) == 4) and (sys.argv[1] == "--compare"):
+        compareResults(loadResults(sys.argv[2]), loadResults(sys.argv[3]))
+    else:
+        assert len(sys.argv) <= 2, __doc__
+        nameFilter = sys.argv[1] if len(sys.argv) == 2 else None
+        storeResults(runBenchmarks(nameFilter))
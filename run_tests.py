@@ -25,6 +25,69 @@ suite.addTests(loader.loadTestsFromModule(bootstrap))
 import vesuvio_analysis.tests.test_jackknife as jackknife
 suite.addTests(loader.loadTestsFromModule(jackknife))
 
+import vesuvio_analysis.tests.test_linear_bootstrap as linearbootstrap
+suite.addTests(loader.loadTestsFromModule(linearbootstrap))
+
+import vesuvio_analysis.tests.test_early_stopping as earlystopping
+suite.addTests(loader.loadTestsFromModule(earlystopping))
+
+import vesuvio_analysis.tests.test_run_times as runtimes
+suite.addTests(loader.loadTestsFromModule(runtimes))
+
+import vesuvio_analysis.tests.test_stream_analysis as streamanalysis
+suite.addTests(loader.loadTestsFromModule(streamanalysis))
+
+import vesuvio_analysis.tests.test_batch_filter as batchfilter
+suite.addTests(loader.loadTestsFromModule(batchfilter))
+
+import vesuvio_analysis.tests.test_residual_corr as residualcorr
+suite.addTests(loader.loadTestsFromModule(residualcorr))
+
+import vesuvio_analysis.tests.test_bootstrap_queue as bootstrapqueue
+suite.addTests(loader.loadTestsFromModule(bootstrapqueue))
+
+import vesuvio_analysis.tests.test_yspace_boot as yspaceboot
+suite.addTests(loader.loadTestsFromModule(yspaceboot))
+
+import vesuvio_analysis.tests.test_profiling as profiling
+suite.addTests(loader.loadTestsFromModule(profiling))
+
+import vesuvio_analysis.tests.test_fit_telemetry as fittelemetry
+suite.addTests(loader.loadTestsFromModule(fittelemetry))
+
+import vesuvio_analysis.tests.test_benchmarks as benchmarks
+suite.addTests(loader.loadTestsFromModule(benchmarks))
+
+import vesuvio_analysis.tests.test_synthetic_data as syntheticdata
+suite.addTests(loader.loadTestsFromModule(syntheticdata))
+
+import vesuvio_analysis.tests.test_input_cache as inputcache
+suite.addTests(loader.loadTestsFromModule(inputcache))
+
+import vesuvio_analysis.tests.test_input_index as inputindex
+suite.addTests(loader.loadTestsFromModule(inputindex))
+
+import vesuvio_analysis.tests.test_input_loading as inputloading
+suite.addTests(loader.loadTestsFromModule(inputloading))
+
+import vesuvio_analysis.tests.test_results_store as resultsstore
+suite.addTests(loader.loadTestsFromModule(resultsstore))
+
+import vesuvio_analysis.tests.test_workspace_manager as workspacemanager
+suite.addTests(loader.loadTestsFromModule(workspacemanager))
+
+import vesuvio_analysis.tests.test_import_time as importtime
+suite.addTests(loader.loadTestsFromModule(importtime))
+
+import vesuvio_analysis.tests.test_plotting as plotting
+suite.addTests(loader.loadTestsFromModule(plotting))
+
+import vesuvio_analysis.tests.test_stage_graph as stagegraph
+suite.addTests(loader.loadTestsFromModule(stagegraph))
+
+import vesuvio_analysis.tests.test_batch_runner as batchrunner
+suite.addTests(loader.loadTestsFromModule(batchrunner))
+
 
 # Initialize a runner, pass it your suite and run it
 runner = unittest.TextTestRunner(verbosity=1)
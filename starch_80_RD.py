@@ -30,6 +30,8 @@ class LoadVesuvioFrontParameters:    # Same as previous class but for forward ws
 class GeneralInitialConditions:
     """Used to define initial conditions shared by both Back and Forward scattering"""
     vertical_width, horizontal_width, thickness = 0.1, 0.1, 0.001     # Sample slab parameters, expressed in meters
+    # useInputCache = True    # Reuse rebinned, scaled and subtracted input stored in input_ws/preprocessed_cache
+    # resultsFormat = "hdf5"    # Store results in chunked, compressed .h5 files instead of .npz
 
 
 class BackwardInitialConditions(GeneralInitialConditions):
@@ -41,6 +43,7 @@ class BackwardInitialConditions(GeneralInitialConditions):
     # Ratio of H peak to chosen mass
     HToMassIdxRatio = 19.0620008206   # Set to None either when H not present or ratio not known 
     massIdx = 0   # Idx of mass to take the ratio with, idx is relative to backward scattering masses
+    # noOfHRatioIterations = None   # Iterations of preliminary procedure to estimate ratio, None asks the user
 
     # Masses, instrument parameters and initial fitting parameters
     masses = np.array([12, 16, 27])
@@ -133,6 +136,25 @@ class UserScriptControls:
     # Choose on which ws to perform the fit in y space
     fitInYSpace = "FORWARD"    # Options: None, "BACKWARD", "FORWARD", "JOINT"
 
+    # Record time and memory of each stage, saved in experiments/<sample>/profiles
+    # profiling = False
+
+    # Delete intermediate workspaces once not needed, keeping at most workspaceMemoryBudget MB of them for inspection
+    # manageWorkspaces = False
+    # workspaceMemoryBudget = None
+
+    # Skip creation of all figures, matplotlib is then never imported
+    # headless = False
+    # Render saved figures in a background thread while the fit continues
+    # backgroundFigures = True
+
+    # Restore stored outputs of stages whose inputs did not change (procedure, y-space reduction and fits, Bootstrap),
+    # saved in experiments/<sample>/stages
+    # reuseStages = False
+
+    # Ask before clearing loaded workspaces, False for unattended runs
+    # confirmClearWS = True
+
 
 class BootstrapInitialConditions:
     runBootstrap = False
@@ -140,9 +162,17 @@ class BootstrapInitialConditions:
     procedure = "BACKWARD"
     fitInYSpace = None #"FORWARD"
 
-    bootstrapType = "BOOT_RESIDUALS"  # Options: "JACKKNIFE", "BOOT_RESIDUALS", "BOOT_GAUSS_ERRS" 
+    bootstrapType = "BOOT_RESIDUALS"  # Options: "JACKKNIFE", "BOOT_RESIDUALS", "BOOT_GAUSS_ERRS", "BOOT_FAST_LINEAR", "BOOT_YSPACE" 
     nSamples = 650                  # Used if running Bootstrap, otherwise code ignores it
+    ySpaceResampling = "SPECTRA"    # "BOOT_YSPACE" only, options: "SPECTRA", "RESIDUALS"
+    earlyStopTolerance = None       # Relative tolerance to stop before nSamples, None runs all samples
+    earlyStopWindow = 50            # No of replicas over which means and stds need to be stable
     skipMSIterations = False        # Each replica runs with no MS or Gamma corrections
+    reuseParentCorrections = False  # Each replica subtracts MS and Gamma corrections of parent, runs no MS iterations
+    jackknifeGroups = None          # Jackknife only: None deletes one bin per replica, int sets no of replicas deleting groups of bins
+    jackknifeGroupMode = "CONTIGUOUS"     # Options: "CONTIGUOUS", "STRIDED"
+    distributed = False             # Share replicas with workers: python -m vesuvio_analysis.bootstrap_worker starch_80_RD
+    claimTimeout = 3600             # Seconds after which replicas claimed by a stopped worker are run again
     userConfirmation = True         # Asks user to confirm procedure, will probably be deleted in the future
 
 
@@ -151,6 +181,10 @@ class BootstrapAnalysis:
 
     # Choose whether to filter averages as done in original procedure
     filterAvg = True      # True discards some unreasonable values of widths and intensities
+
+    # Memory map stored samples and process them in chunks, for files too large to load
+    # streamSamples = False
+    # chunkSize = 1000
     
     # Flags below control the plots to show
     plotRawWidthsIntensities = False
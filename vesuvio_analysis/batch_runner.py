@@ -0,0 +1,200 @@
+"""
+Runs many samples unattended, each described by a config file instead of a script. From the repository:
+
+    python -m vesuvio_analysis.batch_runner <config or directory of configs> ... [--processes N]
+
+Configs are TOML files, or YAML files when PyYAML is installed, with one table for each class
+of the sample scripts, for example [BackwardInitialConditions] or [YSpaceFitInitialConditions].
+GeneralInitialConditions is shared by backward and forward, as in the scripts.
+Name of the sample is the name of the file, unless set with name = "...".
+A config can extend another with extends = "<path relative to config>", tables of both are merged,
+so that a series of samples only sets what changes. Files starting with "_" are skipped in directories.
+Lists are read as arrays, the string "None" is read as None, and ipfile is relative to ip_files.
+Constraints are scipy dicts with lambda functions that configs can not express, only constraints = [] is accepted.
+Distributed Bootstrap is not available, its workers run the <sample>.py script, run these samples from their scripts.
+
+No prompts are shown: workspaces are cleared without asking, Bootstrap runs without confirmation
+and the preliminary procedure for HToMassIdxRatio runs noOfHRatioIterations iterations, set in the config.
+Figures are saved but never shown.
+Samples run one after the other in a single process, sharing imports and caches,
+or across a pool of processes with --processes. A failed sample is reported and the batch continues.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import multiprocessing
+import numpy as np
+import traceback
+import argparse
+import time
+import sys
+import os
+try:
+    import tomllib
+except ImportError:     # Python < 3.11
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+try:
+    import yaml
+except ImportError:     # Only needed for YAML configs
+    yaml = None
+
+repoPath = Path(__file__).absolute().parent.parent
+ipFilesPath = repoPath / "vesuvio_analysis" / "ip_files"
+
+configClasses = [
+    "LoadVesuvioBackParameters", "LoadVesuvioFrontParameters", "GeneralInitialConditions",
+    "BackwardInitialConditions", "ForwardInitialConditions", "YSpaceFitInitialConditions",
+    "UserScriptControls", "BootstrapInitialConditions", "BootstrapAnalysis"
+    ]
+configSuffixes = [".toml", ".yaml", ".yml"]
+
+
+def readConfig(path):
+    """Tables of the config, merged onto the tables of the config it extends."""
+
+    path = Path(path)
+    if path.suffix in [".yaml", ".yml"]:
+        assert yaml is not None, "Package PyYAML needed for YAML configs, install it or use TOML configs."
+        with open(path, "r") as configFile:
+            config = yaml.safe_load(configFile)
+    else:
+        assert tomllib is not None, "Package tomli needed for TOML configs with Python older than 3.11."
+        with open(path, "rb") as configFile:
+            config = tomllib.load(configFile)
+
+    config.setdefault("name", path.stem)
+    if "extends" in config:
+        baseConfig = readConfig(path.parent / config.pop("extends"))
+        for table in configClasses:
+            merged = {**baseConfig.get(table, {}), **config.get(table, {})}
+            if len(merged) > 0:
+                config[table] = merged
+
+    unknownTables = set(config) - set(configClasses) - {"name"}
+    assert len(unknownTables) == 0, f"Tables not recognized in {path.name}: {sorted(unknownTables)}"
+    return config
+
+
+def configValue(field, value):
+    if field == "constraints":
+        assert len(value) == 0, "Constraints can not be set in configs, they need lambda functions. " \
+            "Set constraints = [] or run the sample from its script."
+        return ()
+    if isinstance(value, list):
+        return np.array(value)
+    if value == "None":
+        return None
+    if field == "ipfile":
+        return ipFilesPath / value      # Absolute paths are kept
+    return value
+
+
+def buildSampleClasses(config):
+    """Classes of initial conditions in the same form as defined in the sample scripts."""
+
+    attrs = {}
+    for table in configClasses:
+        attrs[table] = {field: configValue(field, value) for field, value in config.get(table, {}).items()}
+
+    attrs["BootstrapInitialConditions"].setdefault("runBootstrap", False)
+    assert not(attrs["BootstrapInitialConditions"].get("distributed", False)), \
+        f"Distributed Bootstrap needs workers to run the script {config['name']}.py, run the sample from its script."
+    attrs["BootstrapAnalysis"].setdefault("runAnalysis", False)
+
+    general = type("GeneralInitialConditions", (), attrs["GeneralInitialConditions"])
+    classes = {}
+    for table in configClasses:
+        bases = (general,) if table in ["BackwardInitialConditions", "ForwardInitialConditions"] else ()
+        classes[table] = type(table, bases, attrs[table])
+
+    # Prompts replaced by values in the config
+    classes["UserScriptControls"].confirmClearWS = False
+    classes["BootstrapInitialConditions"].userConfirmation = False
+    return classes
+
+
+def runSample(config):
+    """Runs a single sample as its script would."""
+
+    # Configs are read and checked before Mantid is imported
+    from vesuvio_analysis.core_functions.run_script import runScript
+    from vesuvio_analysis.core_functions.bootstrap_analysis import runAnalysisOfStoredBootstrap
+
+    c = buildSampleClasses(config)
+    bckwdIC, fwdIC = c["BackwardInitialConditions"], c["ForwardInitialConditions"]
+    yFitIC, bootIC, userCtr = c["YSpaceFitInitialConditions"], c["BootstrapInitialConditions"], c["UserScriptControls"]
+
+    runScript(userCtr, config["name"], c["LoadVesuvioBackParameters"], c["LoadVesuvioFrontParameters"], bckwdIC, fwdIC, yFitIC, bootIC)
+    runAnalysisOfStoredBootstrap(bckwdIC, fwdIC, yFitIC, bootIC, c["BootstrapAnalysis"], userCtr)
+    return
+
+
+def runSampleReportingErrors(config):
+    """Running time of sample, or None if it failed."""
+
+    print(f"\n\nRunning sample {config['name']} ...\n")
+    t0 = time.time()
+    try:
+        runSample(config)
+    except Exception:
+        traceback.print_exc()
+        print(f"\nSample {config['name']} failed, continuing with next sample.")
+        return None
+    return time.time() - t0
+
+
+def setNonInteractive():
+    """Prompts left in the procedures fail instead of waiting for input, figures are never shown."""
+    sys.stdin = open(os.devnull, "r")
+    os.environ.setdefault("MPLBACKEND", "Agg")
+
+
+def runBatch(configs, processes=1):
+    """Runs all samples and prints a summary, returns names of failed samples."""
+
+    names = [config["name"] for config in configs]
+    assert len(set(names)) == len(names), "Names of samples need to be unique."
+
+    if processes > 1:
+        # Mantid is not safe to fork, each worker imports it once and runs several samples
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context, initializer=setNonInteractive) as executor:
+            futures = [executor.submit(runSampleReportingErrors, config) for config in configs]
+            runTimes = [future.result() for future in futures]
+    else:
+        setNonInteractive()
+        runTimes = [runSampleReportingErrors(config) for config in configs]
+
+    print("\n\nSummary of batch:\n")
+    for name, runTime in zip(names, runTimes):
+        print(f"{name:>30s}: " + ("failed" if runTime is None else f"{runTime:.0f} seconds"))
+    return [name for name, runTime in zip(names, runTimes) if runTime is None]
+
+
+def configPaths(paths):
+    """Config files given directly or found in the directories given, in order."""
+
+    configFiles = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            configFiles.extend(sorted(p for p in path.iterdir() if (p.suffix in configSuffixes) and not(p.name.startswith("_"))))
+        else:
+            assert path.is_file(), f"Config not found: {path}"
+            configFiles.append(path)
+    return configFiles
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs samples described by config files, without prompts.")
+    parser.add_argument("configs", nargs="+", help="Config files or directories of config files")
+    parser.add_argument("--processes", type=int, default=1, help="Number of samples run at the same time")
+    args = parser.parse_args()
+
+    configs = [readConfig(path) for path in configPaths(args.configs)]
+    for config in configs:      # Check all configs before running any sample
+        buildSampleClasses(config)
+    failed = runBatch(configs, args.processes)
+    sys.exit(1 if len(failed) > 0 else 0)
@@ -0,0 +1,2 @@
+from vesuvio_analysis import core_functions
+core_functions.mantidOptional = True     # Cases only run numerical kernels, Mantid not needed
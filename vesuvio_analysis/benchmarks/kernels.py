@@ -0,0 +1,162 @@
+"""
+Benchmark cases of the numerical hot paths of the ncp and y-space fits.
+Synthetic arrays are shaped like real runs, instrument parameters are read from ip2018_3.par.
+None of the cases needs Mantid.
+Each case is a function taking the parameters of the case and returning the callable to time.
+"""
+
+from vesuvio_analysis.core_functions.analysis_functions import calculateNcpSpec, pseudoVoigt, \
+    calcGaussianResolution, numericalThirdDerivative, errorFunction, fitNcpToSingleSpec, prepareArraysFromPars, \
+    kinematicsAtYCenters, loadInstrParsFileIntoArray
+from vesuvio_analysis.core_functions.synthetic_data import generateSyntheticData, SyntheticInitialConditions, \
+    syntheticInstrPars
+from vesuvio_analysis.core_functions.fit_in_yspace import weightedAvgArr, weightedSymArr, weightedAvgXBinsArr, \
+    kMeansClustering, selectModelAndPars
+from pathlib import Path
+import numpy as np
+
+ipFilePath = Path(__file__).absolute().parent.parent / "ip_files" / "ip2018_3.par"
+
+allMasses = np.array([1.0079, 12, 16, 27, 40])
+
+# Shapes of real runs: front and back spectra, front and back TOF binnings
+tofBinnings = {145: "275,1.,420", 320: "110,1.,430"}
+specGrid = [3, 39, 132, 196]
+binsGrid = [145, 320]
+massesGrid = [1, 3, 5]
+yModels = ["SINGLE_GAUSSIAN", "GC_C4_C6", "GC_C4", "GC_C6", "DOUBLE_WELL", "ANSIO_GAUSSIAN", "MULTIVARIATE_GAUSSIAN"]
+
+
+def specArgs(nBins, nMasses):
+    """Single synthetic spectrum and the arguments of the ncp kernels."""
+    dataX, dataY, dataE, fitArgs, truePars = generateSyntheticData(
+        allMasses[:nMasses], np.ones(nMasses), np.full(nMasses, 10.), ipFilePath=ipFilePath,
+        firstSpec=3, lastSpec=3, tofBinning=tofBinnings[nBins]
+        )
+    resolutionPars, instrPars, kinematicArrays, ySpacesForEachMass = fitArgs
+    ic = SyntheticInitialConditions(allMasses[:nMasses])
+    return ic, dataY[0], dataE[0], ySpacesForEachMass[0], resolutionPars[0], instrPars[0], kinematicArrays[0]
+
+
+def benchCalculateNcpSpec(nBins, nMasses):
+    ic, dataY, dataE, ySpaces, resPars, instrPars, kinArrays = specArgs(nBins, nMasses)
+    return lambda: calculateNcpSpec(ic, ic.initPars, ySpaces, resPars, instrPars, kinArrays)
+
+
+def benchPseudoVoigt(nBins, nMasses):
+    ic, dataY, dataE, ySpaces, resPars, instrPars, kinArrays = specArgs(nBins, nMasses)
+    sigma = np.full((nMasses, 1), 10.)
+    gamma = np.full((nMasses, 1), 2.)
+    return lambda: pseudoVoigt(ySpaces, sigma, gamma, ic)
+
+
+def benchCalcGaussianResolution(nBins, nMasses):
+    ic, dataY, dataE, ySpaces, resPars, instrPars, kinArrays = specArgs(nBins, nMasses)
+    masses, intensities, widths, centers = prepareArraysFromPars(ic, ic.initPars)
+    v0, E0, deltaE, deltaQ = kinematicsAtYCenters(ySpaces, centers, kinArrays)
+    return lambda: calcGaussianResolution(masses, v0, E0, deltaE, deltaQ, resPars, instrPars)
+
+
+def benchNumericalThirdDerivative(nBins, nMasses):
+    ic, dataY, dataE, ySpaces, resPars, instrPars, kinArrays = specArgs(nBins, nMasses)
+    JOfY = np.exp(-ySpaces**2 / 200)
+    return lambda: numericalThirdDerivative(ySpaces, JOfY)
+
+
+def benchErrorFunction(nBins, nMasses):
+    ic, dataY, dataE, ySpaces, resPars, instrPars, kinArrays = specArgs(nBins, nMasses)
+    return lambda: errorFunction(ic.initPars, dataY, dataE, ySpaces, resPars, instrPars, kinArrays, ic)
+
+
+def benchFitNcpToSingleSpec(nBins, nMasses):
+    ic, dataY, dataE, ySpaces, resPars, instrPars, kinArrays = specArgs(nBins, nMasses)
+    return lambda: fitNcpToSingleSpec(dataY, dataE, ySpaces, resPars, instrPars, kinArrays, ic)
+
+
+def jOfYArrays(nSpec, nBins, seed=0):
+    """Normalised J(y) of each spectrum, with cut-offs at the edges as after rebinning."""
+
+    rng = np.random.default_rng(seed)
+    x = np.linspace(-20, 20, nBins)
+    dataE = rng.uniform(0.001, 0.005, (nSpec, nBins))
+    dataY = np.exp(-x**2 / 50) / np.sqrt(50 * np.pi) + rng.normal(0, dataE)
+    cutOffs = np.abs(x)[np.newaxis, :] > rng.uniform(15, 20, (nSpec, 1))
+    dataY[cutOffs] = 0
+    dataE[cutOffs] = 0
+    return x, dataY, dataE
+
+
+def benchWeightedAvgArr(nSpec, nBins):
+    x, dataY, dataE = jOfYArrays(nSpec, nBins)
+    return lambda: weightedAvgArr(dataY, dataE)
+
+
+def benchWeightedSymArr(nSpec, nBins):
+    x, dataY, dataE = jOfYArrays(1, nBins)
+    return lambda: weightedSymArr(dataY, dataE)
+
+
+def benchWeightedAvgXBinsArr(nSpec, nBins):
+    """Several points of each spectrum fall on the same bin center, as with NAN masking procedure."""
+    x, dataY, dataE = jOfYArrays(nSpec, nBins)
+    xp = np.linspace(-20, 20, nBins // 2 + 1)
+    step = xp[1] - xp[0]
+    dataX = xp[np.clip(np.rint((x - xp[0]) / step).astype(int), 0, len(xp)-1)]
+    dataX = np.tile(dataX, (nSpec, 1))
+    return lambda: weightedAvgXBinsArr(dataX, dataY, dataE, xp)
+
+
+def benchKMeansClustering(nSpec, nGroups=4):
+    instrPars = loadInstrParsFileIntoArray(ipFilePath, 3, 3 + nSpec - 1)
+    L1 = 2 * instrPars[:, -1] / np.sum(instrPars[:, -1])
+    theta = instrPars[:, 2] / np.sum(instrPars[:, 2])
+    points = np.vstack((L1, theta)).T
+    centers = points[np.linspace(0, nSpec-1, min(nGroups, nSpec)).astype(int)]
+    return lambda: kMeansClustering(points, centers)
+
+
+def benchYSpaceModel(model, nBins):
+    modelFun, defaultPars, sharedPars = selectModelAndPars(model)
+    x = np.linspace(-20, 20, nBins)
+    pars = list(defaultPars.values())
+    return lambda: modelFun(x, *pars)
+
+
+def benchGenerateSyntheticData(nSpec, nBins):
+    """Forward model over a whole synthetic bank, at sizes up to 10 times the backward detectors."""
+    instrPars = syntheticInstrPars(nSpec, "BACKWARD")
+    return lambda: generateSyntheticData(allMasses[:3], np.ones(3), np.full(3, 10.), instrPars=instrPars,
+        tofBinning=tofBinnings[nBins], mode="BACKWARD")
+
+
+def allCases():
+    """Name, parameters and setup function of each benchmark case."""
+
+    cases = []
+    for fun in [benchCalculateNcpSpec, benchPseudoVoigt, benchCalcGaussianResolution, benchNumericalThirdDerivative,
+        benchErrorFunction, benchFitNcpToSingleSpec]:
+        for nBins in binsGrid:
+            for nMasses in massesGrid:
+                cases.append((fun.__name__[5:], {"nBins": nBins, "nMasses": nMasses}, fun))
+
+    for fun in [benchWeightedAvgArr, benchWeightedSymArr, benchWeightedAvgXBinsArr]:
+        for nSpec in specGrid:
+            for nBins in binsGrid:
+                if (fun is benchWeightedSymArr) and (nSpec != specGrid[0]):
+                    continue    # Symmetrisation runs on the averaged J(y) only
+                cases.append((fun.__name__[5:], {"nSpec": nSpec, "nBins": nBins}, fun))
+
+    for nSpec in specGrid:
+        cases.append(("KMeansClustering", {"nSpec": nSpec}, benchKMeansClustering))
+
+    for nSpec in [132, 1320]:
+        cases.append(("GenerateSyntheticData", {"nSpec": nSpec, "nBins": 145}, benchGenerateSyntheticData))
+
+    for model in yModels:
+        for nBins in binsGrid:
+            cases.append(("YSpaceModel", {"model": model, "nBins": nBins}, benchYSpaceModel))
+    return cases
+
+
+def caseKey(name, pars):
+    return name + "[" + ",".join(f"{k}={v}" for k, v in pars.items()) + "]"
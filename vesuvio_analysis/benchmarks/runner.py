@@ -0,0 +1,88 @@
+"""
+Times the benchmark cases and stores results as json files, one per run,
+tagged with the commit of the repository, so that runs on different commits can be compared.
+"""
+
+from vesuvio_analysis.benchmarks.kernels import allCases, caseKey
+from pathlib import Path
+import numpy as np
+import subprocess
+import platform
+import timeit
+import json
+import time
+
+resultsPath = Path(__file__).absolute().parent / "results"
+repoPath = Path(__file__).absolute().parent.parent.parent
+
+
+def currentCommit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=repoPath,
+            capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=repoPath,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + ("-dirty" if dirty else "")
+
+
+def timeCase(fun, repeat, minTime):
+    """Seconds per call: minimum and median over repeats, each repeat running for at least minTime."""
+
+    timer = timeit.Timer(fun)
+    number, totalTime = timer.autorange()
+    number = max(1, int(number * minTime / max(totalTime, 1e-9)))
+    times = np.array(timer.repeat(repeat=repeat, number=number)) / number
+    return {"min_s": float(np.min(times)), "median_s": float(np.median(times)), "number": number, "repeat": repeat}
+
+
+def runBenchmarks(nameFilter=None, repeat=5, minTime=0.2):
+    results = {}
+    for name, pars, setup in allCases():
+        key = caseKey(name, pars)
+        if (nameFilter is not None) and (nameFilter not in key):
+            continue
+
+        results[key] = timeCase(setup(**pars), repeat, minTime)
+        print(f"{key:<60} {results[key]['min_s']*1e3:>12.4f} ms")
+    return results
+
+
+def storeResults(results):
+    resultsPath.mkdir(exist_ok=True)
+    commit = currentCommit()
+    record = {
+        "commit": commit,
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "machine": platform.node(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "results": results
+        }
+    savePath = resultsPath / f"{time.strftime('%Y%m%d_%H%M%S')}_{commit}.json"
+    with open(savePath, "w") as jsonFile:
+        json.dump(record, jsonFile, indent=1)
+    print(f"\nBenchmark results saved in: {savePath}")
+    return savePath
+
+
+def loadResults(commit):
+    """Most recent stored run of a commit."""
+    paths = sorted(resultsPath.glob(f"*_{commit}*.json"))
+    assert len(paths) > 0, f"No stored benchmark results for commit {commit}."
+    with open(paths[-1], "r") as jsonFile:
+        return json.load(jsonFile)
+
+
+def compareResults(baseRecord, newRecord):
+    """Ratio of minimum time of each case in both runs, above 1 means new run is slower."""
+
+    base = baseRecord["results"]
+    new = newRecord["results"]
+    ratios = {key: new[key]["min_s"] / base[key]["min_s"] for key in base if key in new}
+
+    print(f"\n{'Case':<60} {baseRecord['commit']:>14} {newRecord['commit']:>14} {'Ratio':>8}")
+    for key, ratio in ratios.items():
+        print(f"{key:<60} {base[key]['min_s']*1e3:>11.4f} ms {new[key]['min_s']*1e3:>11.4f} ms {ratio:>8.2f}")
+    return ratios
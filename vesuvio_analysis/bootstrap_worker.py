@@ -0,0 +1,33 @@
+"""
+Worker for distributed Bootstrap, selected with distributed = True in BootstrapInitialConditions.
+Runs the replicas published by the main process of the experiment, on any node with access
+to the same repository directory. Any number of workers can be started, from the repository:
+
+    python -m vesuvio_analysis.bootstrap_worker <experiment>
+
+where <experiment> is the name of the script of the sample, for example starch_80_RD.
+"""
+
+from vesuvio_analysis.core_functions import bootstrap
+from pathlib import Path
+import runpy
+import sys
+
+repoPath = Path(__file__).absolute().parent.parent
+
+
+def runWorker(experiment):
+    scriptPath = repoPath / (experiment + ".py")
+    assert scriptPath.is_file(), f"Script of experiment not found: {scriptPath}"
+
+    # Script sets up initial conditions as usual, runBootstrap() then only runs queued replicas
+    bootstrap.runningWorker = True
+    try:
+        runpy.run_path(str(scriptPath), run_name="__main__")
+    except bootstrap.BootstrapWorkerFinished:
+        print("\nNo replicas left to claim, worker finished.")
+
+
+if __name__ == "__main__":
+    assert len(sys.argv) == 2, "Usage: python -m vesuvio_analysis.bootstrap_worker <experiment>"
+    runWorker(sys.argv[1])
@@ -2,8 +2,13 @@
 from random import sample
 from mantid.simpleapi import LoadVesuvio, SaveNexus
 from pathlib import Path
+from vesuvio_analysis.core_functions.input_index import resolveInputWSDir, fileLock
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 import numpy as np
 import json
+import time
+import os
 currentPath = Path(__file__).absolute().parent
 experimentsPath = currentPath / ".."/ ".." / "experiments"
 
@@ -44,19 +49,40 @@ def completeICFromInputs(IC, scriptName, wsIC):
     # Sort out input and output paths
     rawPath, emptyPath = inputDirsForSample(wsIC, scriptName)
 
-    if (not rawPath.is_file()) or (not emptyPath.is_file()):
+    assert rawPath.parent == emptyPath.parent, "Raw and Empty workspaces not set up to be saved under the same directory"
+    rawPath.parent.mkdir(parents=True, exist_ok=True)
 
-        rawPath.parent.mkdir(parents=True, exist_ok=True)
-        assert rawPath.parent == emptyPath.parent, "Raw and Empty workspaces not set up to be saved under the same directory"
-        print(f"\nWorkspaces not found, will save new workspaces in: {rawPath.parent.name}")
-
-        saveWSFromLoadVesuvio(wsIC, rawPath, emptyPath)
+    # Other processes with the same inputs wait for workspaces to be saved instead of loading them again
+    with fileLock(rawPath.parent / "saving.lock"):
+        if (not rawPath.is_file()) or (not emptyPath.is_file()):
+            print(f"\nWorkspaces not found, will save new workspaces in: {rawPath.parent.name}")
+            saveWSFromLoadVesuvio(wsIC, rawPath, emptyPath)
     
     IC.userWsRawPath = rawPath
     IC.userWsEmptyPath = emptyPath
 
+    # Preprocessed input arrays can be cached next to input workspaces, disabled by default
+    IC.inputCachePath = rawPath.parent / "preprocessed_cache"
+    try:
+        t = IC.useInputCache
+    except AttributeError:
+        IC.useInputCache = False
+
+    # Results of iterative fit stored in .npz by default, "hdf5" for chunked and compressed .h5 files
+    try:
+        t = IC.resultsFormat
+    except AttributeError:
+        IC.resultsFormat = "npz"
+    assert (IC.resultsFormat=="npz") | (IC.resultsFormat=="hdf5"), "Results format not recognized. Options: 'npz', 'hdf5'"
+
     setOutputDirsForSample(IC, scriptName)
     
+    # Iterations of preliminary procedure to estimate HToMassIdxRatio asked to the user by default
+    try:
+        t = IC.noOfHRatioIterations
+    except AttributeError:
+        IC.noOfHRatioIterations = None
+
     # Do not run bootstrap sample, by default
     IC.runningSampleWS = False
 
@@ -71,6 +97,9 @@ def completeICFromInputs(IC, scriptName, wsIC):
     figSavePath.mkdir(exist_ok=True)
     IC.figSavePath = figSavePath
 
+    # Run times of each stage, used to estimate duration of Bootstrap
+    IC.runTimesPath = experimentsPath / scriptName / "running_times.json"
+
     # Create default of not running original version with histogram data
     try:
         t = IC.runHistData
@@ -94,24 +123,11 @@ def inputDirsForSample(wsIC, sampleName):
 
     rawWSName, emptyWSName = nameRawEmptyWS(sampleName, runningMode)
 
-    newWSDir = defaultNewWSDirectory(inputWSPath, runningMode)
-
-    rawPath = newWSDir / rawWSName
-    emptyPath = newWSDir / emptyWSName
-
-    currLoadWSDict = convertLoadWSICToDict(wsIC)
-
-    for filePath in inputWSPath.rglob('*' + runningMode + '.json'):
-        storedDict = json.load(open(filePath))
-
-        if currLoadWSDict == storedDict:   # Ignores order
-
-            storedWSDir = filePath.parent
-
-            rawPath = storedWSDir / rawWSName
-            emptyPath = storedWSDir / emptyWSName
-            print(f"\nFound {runningMode} workspaces with matching inputs in: {str(storedWSDir.name)}")
+    # Existing directory with matching inputs, or new version directory registered in the index
+    wsDir = resolveInputWSDir(inputWSPath, runningMode, convertLoadWSICToDict(wsIC))
 
+    rawPath = wsDir / rawWSName
+    emptyPath = wsDir / emptyWSName
     return rawPath, emptyPath
 
 
@@ -131,15 +147,6 @@ def nameRawEmptyWS(sampleName, runningMode):
     return rawWSName, emptyWSName
 
 
-def defaultNewWSDirectory(inputWSPath, runningMode):
-    wsDirs = inputWSPath.glob(f'{runningMode}*/')
-    versionNums = [float(dir.name.split('_')[-1]) for dir in wsDirs]
-    versionNums = [0.0] if not versionNums else versionNums    # Take care of empty list
-    newDirName = runningMode + '_' + str(max(versionNums) + 1)
-    newWSDir = inputWSPath / newDirName
-    return newWSDir
-
-
 def setOutputDirsForSample(IC, sampleName):
     outputPath = experimentsPath / sampleName / "output_npz_for_testing"
     outputPath.mkdir(parents=True, exist_ok=True)
@@ -159,34 +166,72 @@ def setOutputDirsForSample(IC, sampleName):
     return
 
 
+def saveMissingInputWS(scriptName, wsICs):
+    """
+    Loads and stores the input workspaces not yet stored, for all LoadVesuvio inputs at once,
+    so that raw and empty runs of backward and forward are loaded concurrently.
+    """
+
+    with ExitStack() as locks:
+        missingInputs = []
+        for wsIC in wsICs:
+            rawPath, emptyPath = inputDirsForSample(wsIC, scriptName)
+            rawPath.parent.mkdir(parents=True, exist_ok=True)
+            locks.enter_context(fileLock(rawPath.parent / "saving.lock"))
+
+            if (not rawPath.is_file()) or (not emptyPath.is_file()):
+                print(f"\nWorkspaces not found, will save new workspaces in: {rawPath.parent.name}")
+                missingInputs.append((wsIC, rawPath, emptyPath))
+
+        if len(missingInputs) > 0:
+            saveAllWSFromLoadVesuvio(missingInputs)
+    return
+
+
 def saveWSFromLoadVesuvio(wsIC, rawPath, emptyPath):
-    
-    print(f"\nLoading and storing workspace sample runs: {wsIC.runs}\n")
+    saveAllWSFromLoadVesuvio([(wsIC, rawPath, emptyPath)])
+    return
+
+
+def saveAllWSFromLoadVesuvio(inputs):
+    """
+    Each set of runs is loaded and saved in its own thread, Mantid algorithms run concurrently.
+    Json file with the inputs is written only once both raw and empty workspaces are stored.
+    """
+
+    runSets = []
+    for wsIC, rawPath, emptyPath in inputs:
+        runSets.append((wsIC, wsIC.runs, rawPath))
+        runSets.append((wsIC, wsIC.empty_runs, emptyPath))
+
+    with ThreadPoolExecutor(max_workers=len(runSets)) as executor:
+        futures = [executor.submit(loadAndSaveRuns, *runSet) for runSet in runSets]
+        for future in futures:
+            future.result()     # Raises any error from loading
+
+    for wsIC, rawPath, emptyPath in inputs:
+        wsLogNameFile = rawPath.name.replace('_raw_', '_').replace('.nxs', '.json')
+        saveJsonFile(rawPath.parent, wsLogNameFile, wsIC)
+    return
 
-    rawVesuvio = LoadVesuvio(
-        Filename=wsIC.runs,
-        SpectrumList=wsIC.spectra,
-        Mode=wsIC.mode,
-        InstrumentParFile=str(wsIC.ipfile),
-        OutputWorkspace=rawPath.name
-        )
 
-    SaveNexus(rawVesuvio, str(rawPath))
-    print(f"\nRaw workspace stored locally under {rawPath.parent.name}\n")
+def loadAndSaveRuns(wsIC, runs, savePath):
+    print(f"\nLoading and storing runs {runs} as {savePath.name} ...\n")
+    t0 = time.time()
 
-    emptyVesuvio = LoadVesuvio(
-        Filename=wsIC.empty_runs,
+    wsVesuvio = LoadVesuvio(
+        Filename=runs,
         SpectrumList=wsIC.spectra,
         Mode=wsIC.mode,
         InstrumentParFile=str(wsIC.ipfile),
-        OutputWorkspace=emptyPath.name
+        OutputWorkspace=savePath.name
         )
 
-    SaveNexus(emptyVesuvio, str(emptyPath))
-    print(f"\nRaw workspace stored locally under {emptyPath.parent.name}\n")
-
-    wsLogNameFile = rawPath.name.replace('_raw_', '_').replace('.nxs', '.json')
-    saveJsonFile(rawPath.parent, wsLogNameFile, wsIC)
+    # Saved under temporary name first, so that stored workspaces are always complete
+    tmpPath = savePath.with_name(savePath.stem + "_tmp.nxs")
+    SaveNexus(wsVesuvio, str(tmpPath))
+    os.replace(tmpPath, savePath)
+    print(f"\nStored {savePath.name} under {savePath.parent.name} in {time.time()-t0:.0f} seconds\n")
     return
 
 
@@ -201,12 +246,123 @@ def completeBootIC(bootIC, bckwdIC, fwdIC, yFitIC):
     if not bootIC.runBootstrap:
         return
 
+    setBootICDefaults(bootIC)
+    setBootstrapDirs(bckwdIC, fwdIC, bootIC, yFitIC)
+    return
+
+
+def setUserCtrDefaults(userCtr):
+    """Sets default values of optional user controls not defined by the user."""
+
+    try:    # Profiling of stages disabled by default
+        reading = userCtr.profiling
+    except AttributeError:
+        userCtr.profiling = False
+
+    try:    # All workspaces left in the ADS by default
+        reading = userCtr.manageWorkspaces
+    except AttributeError:
+        userCtr.manageWorkspaces = False
+
+    try:    # Intermediate workspaces deleted as soon as not needed
+        reading = userCtr.workspaceMemoryBudget
+    except AttributeError:
+        userCtr.workspaceMemoryBudget = None
+
+    try:    # Figures created by default
+        reading = userCtr.headless
+    except AttributeError:
+        userCtr.headless = False
+
+    try:    # Figures saved to file are rendered in the background by default
+        reading = userCtr.backgroundFigures
+    except AttributeError:
+        userCtr.backgroundFigures = True
+
+    try:    # User asked before clearing loaded workspaces by default
+        reading = userCtr.confirmClearWS
+    except AttributeError:
+        userCtr.confirmClearWS = True
+
+    try:    # Stages run again unless final workspaces are loaded, as before
+        reading = userCtr.reuseStages
+    except AttributeError:
+        userCtr.reuseStages = False
+    return
+
+
+def setBootICDefaults(bootIC):
+    """Sets default values of optional bootstrap attributes not defined by the user."""
+
     try:    # Assume it is not running a test if atribute is not found
         reading = bootIC.runningTest
     except AttributeError:
         bootIC.runningTest = False
 
-    setBootstrapDirs(bckwdIC, fwdIC, bootIC, yFitIC)
+    # Default Jackknife deletes a single bin per replica
+    try:
+        reading = bootIC.jackknifeGroups
+    except AttributeError:
+        bootIC.jackknifeGroups = None
+
+    try:
+        reading = bootIC.jackknifeGroupMode
+    except AttributeError:
+        bootIC.jackknifeGroupMode = "CONTIGUOUS"
+
+    # Default replicas do not reuse MS and gamma corrections from parent
+    try:
+        reading = bootIC.reuseParentCorrections
+    except AttributeError:
+        bootIC.reuseParentCorrections = False
+
+    # Early stopping disabled by default, all nSamples are run
+    try:
+        reading = bootIC.earlyStopTolerance
+    except AttributeError:
+        bootIC.earlyStopTolerance = None
+
+    try:
+        reading = bootIC.earlyStopWindow
+    except AttributeError:
+        bootIC.earlyStopWindow = 50
+
+    try:
+        reading = bootIC.earlyStopCI
+    except AttributeError:
+        bootIC.earlyStopCI = False
+
+    # By default replicas run only in the current process
+    try:
+        reading = bootIC.distributed
+    except AttributeError:
+        bootIC.distributed = False
+
+    try:
+        reading = bootIC.claimTimeout
+    except AttributeError:
+        bootIC.claimTimeout = 3600
+
+    # Y-space Bootstrap resamples whole spectra of J(y) by default
+    try:
+        reading = bootIC.ySpaceResampling
+    except AttributeError:
+        bootIC.ySpaceResampling = "SPECTRA"
+    return
+
+
+def setAnalysisICDefaults(analysisIC):
+    """Sets default values of optional analysis attributes not defined by the user."""
+
+    try:    # By default load all Bootstrap samples into memory
+        reading = analysisIC.streamSamples
+    except AttributeError:
+        analysisIC.streamSamples = False
+
+    try:
+        reading = analysisIC.chunkSize
+    except AttributeError:
+        analysisIC.chunkSize = 1000
     return
 
 
@@ -216,9 +372,7 @@ def setBootstrapDirs(bckwdIC, fwdIC, bootIC, yFitIC):
     # Select script name and experiments path
     sampleName = bckwdIC.scriptName   # Name of sample currently running
     experimentsPath = currentPath/".."/".."/"experiments"
-    
-    # Used to store running times required to estimate Bootstrap total run time.
-    bootIC.runTimesPath = experimentsPath / sampleName / "running_times.txt"
+
 
     # Make bootstrap and jackknife data directories
     if bootIC.bootstrapType=="JACKKNIFE":
@@ -227,9 +381,15 @@ def setBootstrapDirs(bckwdIC, fwdIC, bootIC, yFitIC):
         bootPath = experimentsPath / sampleName / "bootstrap_data"
     bootPath.mkdir(exist_ok=True)
 
-    # Folders for skipped and unskipped MS
-    if bootIC.skipMSIterations:
+    # Folders for skipped, reused and unskipped MS
+    if bootIC.bootstrapType=="BOOT_FAST_LINEAR":
+        dataPath = bootPath / "fast_linear"
+    elif bootIC.bootstrapType=="BOOT_YSPACE":
+        dataPath = bootPath / "yspace_only"
+    elif bootIC.skipMSIterations:
         dataPath = bootPath / "skip_MS_corrections"
+    elif bootIC.reuseParentCorrections:
+        dataPath = bootPath / "parent_MS_corrections"
     else:
         dataPath = bootPath / "with_MS_corrections"
     dataPath.mkdir(exist_ok=True)
@@ -257,7 +417,7 @@ def genBootFilesName (IC, bootIC):
 
     nSamples = bootIC.nSamples
     if bootIC.bootstrapType=="JACKKNIFE": 
-        nSamples = 3 if bootIC.runningTest else noOfHistsFromTOFBinning(IC)
+        nSamples = noOfJackknifeSamples(IC, bootIC)
 
     # Build Filename based on ic
     corr = ""
@@ -279,7 +439,7 @@ def header_string():
     yspace fit data file: boot type | procedure | symmetrisation | rebin pars | fit model | mask type
     """
 
-def logString(bootDataName, IC, yFitIC, bootIC, isYFit):
+def logString(bootDataName, IC, yFitIC, bootIC, isYFit, nCompleted=None):
     if isYFit:
         log = (bootDataName+" : "+bootIC.bootstrapType+
         " | "+str(bootIC.fitInYSpace)+
@@ -292,9 +452,21 @@ def logString(bootDataName, IC, yFitIC, bootIC, isYFit):
         " | "+str(bootIC.procedure)+
         " | "+IC.tofBinning+
         " | "+str(IC.maskTOFRange))
+
+    if nCompleted is not None:    # Bootstrap stopped before running all samples
+        log += " | completed samples "+str(nCompleted)
     return log
 
 
+def noOfJackknifeSamples(IC, bootIC):
+    """Number of Jackknife replicas, either one per bin or one per group of bins."""
+    if bootIC.runningTest:
+        return 3
+    if bootIC.jackknifeGroups is not None:
+        return bootIC.jackknifeGroups
+    return noOfHistsFromTOFBinning(IC)
+
+
 def noOfHistsFromTOFBinning(IC):
     start, spacing, end = [int(float(s)) for s in IC.tofBinning.split(",")]  # Convert first to float and then to int because of decimal points
     return int((end-start)/spacing) - 1 # To account for last column being ignored
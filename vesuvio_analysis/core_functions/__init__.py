@@ -0,0 +1 @@
+mantidOptional = False     # Set by the benchmarks, numerical kernels are then imported without Mantid
@@ -1,12 +1,26 @@
-import matplotlib.pyplot as plt
 import numpy as np
-from mantid.simpleapi import *
-from scipy import optimize
+from . import mantidOptional
+try:
+    from mantid.simpleapi import *
+except ImportError:
+    if not(mantidOptional):     # Only benchmarks of the numerical kernels run without Mantid
+        raise
+from scipy import optimize, stats
+import sys
 
 from .fit_in_yspace import passDataIntoWS, replaceZerosWithNCP
+from .run_times import storeRunTime
+from .profiling import stage, profiled
+from .input_cache import loadCachedInput, storeCachedInput
+from .results_store import saveResultsHDF5, icMetadata
+from .workspace_manager import registerIntermediate, registerFinal, release
+from .plotting import figuresEnabled, submitFigure, newFigure, pointsX
+import time
 
-# Format print output of arrays
-np.set_printoptions(suppress=True, precision=4, linewidth=100, threshold=sys.maxsize)
+
+def setPrintOptions():
+    """Format print output of arrays, set when running a script instead of at import."""
+    np.set_printoptions(suppress=True, precision=4, linewidth=100, threshold=sys.maxsize)
 
 
 def iterativeFitForDataReduction(ic):
@@ -17,40 +31,60 @@ def iterativeFitForDataReduction(ic):
     if ic.runningSampleWS:
         initialWs = RenameWorkspace(InputWorkspace=ic.sampleWS, OutputWorkspace=initialWs.name())
 
+    t0 = time.time()
     cropedWs = cropAndMaskWorkspace(ic, initialWs)
+    storeRunTime(ic, "crop", time.time()-t0, cropedWs.getNumberHistograms(), cropedWs.blocksize())
     wsToBeFitted = CloneWorkspace(InputWorkspace=cropedWs, OutputWorkspace=cropedWs.name()+"0")
 
+    # Raw, empty and uncropped workspaces not needed after cropping
+    registerIntermediate("load", ic.name+"raw", ic.name+"empty", initialWs.name())
+    release("load")
+
+    fittingResults = resultsObject(ic)      # Results of each iteration are added as they are produced
     for iteration in range(ic.noOfMSIterations + 1):
         # Workspace from previous iteration
         wsToBeFitted = mtd[ic.name+str(iteration)]
 
-        ncpTotal = fitNcpToWorkspace(ic, wsToBeFitted)
+        ncpTotal = fitNcpToWorkspace(ic, wsToBeFitted, fittingResults)
         
         mWidths, stdWidths, mIntRatios, stdIntRatios = extractMeans(wsToBeFitted.name(), ic)
         createMeansAndStdTableWS(wsToBeFitted.name(), ic, mWidths, stdWidths, mIntRatios, stdIntRatios)
+        fittingResults.addMeans(mWidths, stdWidths, mIntRatios, stdIntRatios)
    
         # When last iteration, skip MS and GC
         if iteration == ic.noOfMSIterations: break 
 
+        release(wsToBeFitted.name())    # Ncp workspaces are only kept for the last iteration
+
         # Replace zero columns (bins) with ncp total fit
         # If ws has no zero column, then remains unchanged
-        if iteration == 0: wsNCPM = replaceZerosWithNCP(mtd[ic.name], ncpTotal)
+        if iteration == 0: 
+            wsNCPM = replaceZerosWithNCP(mtd[ic.name], ncpTotal)
+            registerIntermediate("corrections", wsNCPM.name(), wsNCPM.name()+"_Sum")
 
         CloneWorkspace(InputWorkspace=ic.name, OutputWorkspace="tmpNameWs")
 
         if ic.MSCorrectionFlag:
+            t0 = time.time()
             wsMS = createWorkspacesForMSCorrection(ic, mWidths, mIntRatios, wsNCPM)
+            storeRunTime(ic, "ms", time.time()-t0, wsNCPM.getNumberHistograms(), wsNCPM.blocksize())
             Minus(LHSWorkspace="tmpNameWs", RHSWorkspace=wsMS, OutputWorkspace="tmpNameWs")
+            registerFinal(wsMS.name())      # Reused by bootstrap replicas
+            release("ms")
 
         if ic.GammaCorrectionFlag:  
+            t0 = time.time()
             wsGC = createWorkspacesForGammaCorrection(ic, mWidths, mIntRatios, wsNCPM)
+            storeRunTime(ic, "gamma", time.time()-t0, wsNCPM.getNumberHistograms(), wsNCPM.blocksize())
             Minus(LHSWorkspace="tmpNameWs", RHSWorkspace=wsGC, OutputWorkspace="tmpNameWs")
+            registerFinal(wsGC.name())
 
         remaskValues(ic.name, "tmpNameWS")    # Masks cols in the same place as in ic.name
         RenameWorkspace(InputWorkspace="tmpNameWs", OutputWorkspace=ic.name+str(iteration+1))
     
+    release("corrections")
     wsFinal = mtd[ic.name+str(ic.noOfMSIterations)]
-    fittingResults = resultsObject(ic)
+    registerFinal(wsFinal.name())
     fittingResults.save()
     return wsFinal, fittingResults
 
@@ -99,10 +133,20 @@ def createTableInitialParameters(ic):
 
 def loadRawAndEmptyWsFromUserPath(ic):
 
+    t0 = time.time()
+    if ic.useInputCache:
+        cached = loadCachedInput(ic)
+        if cached is not None:
+            wsToBeFitted = wsFromCachedInput(ic, *cached)
+            storeRunTime(ic, "load_cache", time.time()-t0, wsToBeFitted.getNumberHistograms(), wsToBeFitted.blocksize())
+            return wsToBeFitted
+
     print('\nLoading local workspaces ...\n')
-    Load(Filename=str(ic.userWsRawPath), OutputWorkspace=ic.name+"raw")
-    Rebin(InputWorkspace=ic.name+'raw', Params=ic.tofBinning,
-          OutputWorkspace=ic.name+'raw')
+    with stage("load"):
+        Load(Filename=str(ic.userWsRawPath), OutputWorkspace=ic.name+"raw")
+    with stage("rebin"):
+        Rebin(InputWorkspace=ic.name+'raw', Params=ic.tofBinning,
+            OutputWorkspace=ic.name+'raw')
 
     assert (type(ic.scaleRaw)==float) | (type(ic.scaleRaw)==int), "Scaling factor of raw ws needs to be float or int."
     Scale(InputWorkspace=ic.name+'raw', OutputWorkspace=ic.name+'raw', Factor=str(ic.scaleRaw))
@@ -112,9 +156,11 @@ def loadRawAndEmptyWsFromUserPath(ic):
 
     # if ic.mode=="DoubleDifference":
     if ic.subEmptyFromRaw:
-        Load(Filename=str(ic.userWsEmptyPath), OutputWorkspace=ic.name+"empty")
-        Rebin(InputWorkspace=ic.name+'empty', Params=ic.tofBinning,
-            OutputWorkspace=ic.name+'empty')
+        with stage("load"):
+            Load(Filename=str(ic.userWsEmptyPath), OutputWorkspace=ic.name+"empty")
+        with stage("rebin"):
+            Rebin(InputWorkspace=ic.name+'empty', Params=ic.tofBinning,
+                OutputWorkspace=ic.name+'empty')
 
         assert (type(ic.scaleEmpty)==float) | (type(ic.scaleEmpty)==int), "Scaling factor of empty ws needs to be float or int"
         Scale(InputWorkspace=ic.name+'empty', OutputWorkspace=ic.name+'empty', Factor=str(ic.scaleEmpty))
@@ -123,9 +169,48 @@ def loadRawAndEmptyWsFromUserPath(ic):
         
         wsToBeFitted = Minus(LHSWorkspace=ic.name+'raw', RHSWorkspace=ic.name+'empty',
                             OutputWorkspace=ic.name+"uncroped_unmasked")
+
+    storeRunTime(ic, "load", time.time()-t0, wsToBeFitted.getNumberHistograms(), wsToBeFitted.blocksize())
+    if ic.useInputCache:
+        storeInputInCache(ic, wsToBeFitted)
     return wsToBeFitted
 
 
+def storeInputInCache(ic, ws):
+    """Stores preprocessed arrays and a one bin copy of ws that keeps instrument and spectra."""
+
+    def saveTemplate(path):
+        wsTemplate = CropWorkspace(InputWorkspace=ws, XMin=ws.readX(0)[0], XMax=ws.readX(0)[1], OutputWorkspace=ws.name()+"_template")
+        SaveNexus(wsTemplate, str(path))
+        DeleteWorkspace(wsTemplate)
+
+    dataX, dataY, dataE = extractWS(ws)
+    meta = {"distribution": ws.isDistribution(), "unitX": ws.getAxis(0).getUnit().unitID()}
+    storeCachedInput(ic, dataX, dataY, dataE, np.array(ws.getSpectrumNumbers()), meta, saveTemplate)
+    return
+
+
+@profiled("load_cache")
+def wsFromCachedInput(ic, arrays, meta, templatePath):
+    """Builds preprocessed ws from cached arrays, skipping loading and preprocessing of nexus files."""
+
+    print('\nLoading preprocessed input from cache ...\n')
+    dataX, dataY, dataE, specNumbers = arrays
+    wsTemplate = Load(Filename=str(templatePath), OutputWorkspace=ic.name+"template")
+
+    ws = CreateWorkspace(
+        DataX=np.ravel(dataX), DataY=np.ravel(dataY), DataE=np.ravel(dataE), NSpec=len(dataY),
+        UnitX=meta["unitX"], Distribution=meta["distribution"], ParentWorkspace=wsTemplate,
+        OutputWorkspace=ic.name+"uncroped_unmasked"
+        )
+    for i, specNo in enumerate(specNumbers):
+        ws.getSpectrum(i).setSpectrumNo(int(specNo))
+
+    DeleteWorkspace(wsTemplate)
+    return ws
+
+
+@profiled("crop_and_mask")
 def cropAndMaskWorkspace(ic, ws):
     """Returns cloned and cropped workspace with modified name"""
     # Read initial Spectrum number
@@ -169,14 +254,17 @@ def maskBinsWithZeros(ws, IC):
     return 
 
 
-def fitNcpToWorkspace(IC, ws):
+@profiled("ncp_fit")
+def fitNcpToWorkspace(IC, ws, fittingResults=None):
     """
     Performs the fit of ncp to the workspace.
     Firtly the arrays required for the fit are prepared and then the fit is performed iteratively
     on a spectrum by spectrum basis.
+    Results of the fit are added to fittingResults, when given.
     """
     
     dataX, dataY, dataE = extractWS(ws)
+    wsDataY = dataY
     if IC.runHistData:     # Converts point data from workspaces to histogram data
         dataY, dataX, dataE = histToPointData(dataY, dataX, dataE)      
 
@@ -185,17 +273,57 @@ def fitNcpToWorkspace(IC, ws):
     
     print("\nFitting NCP:\n")
 
-    arrFitPars = fitNcpToArray(IC, dataY, dataE, resolutionPars, instrPars, kinematicArrays, ySpacesForEachMass)
+    t0 = time.time()
+    arrFitPars, arrTelemetry, fitMessages = fitNcpToArray(IC, dataY, dataE, resolutionPars, instrPars, kinematicArrays, ySpacesForEachMass)
+    nFitted = np.sum(~np.all(arrFitPars==0, axis=1))
+    storeRunTime(IC, "ncp_fit", (time.time()-t0)/nFitted, dataY.shape[0], dataY.shape[1])   # Time per spectrum
     createTableWSForFitPars(ws.name(), IC.noOfMasses, arrFitPars)
+    createTableWSForFitTelemetry(ws.name(), IC.noOfMasses, arrTelemetry, fitMessages)
+    printFitTelemetry(arrTelemetry)
     arrBestFitPars = arrFitPars[:, 1:-2]
     ncpForEachMass, ncpTotal = calculateNcpArr(IC, arrBestFitPars, resolutionPars, instrPars, kinematicArrays, ySpacesForEachMass)
     ncpSumWSs = createNcpWorkspaces(ncpForEachMass, ncpTotal, ws, IC)
+    if fittingResults is not None:
+        fittingResults.addFit(wsDataY, arrFitPars, arrTelemetry, fitMessages, ncpForEachMass, ncpTotal)
+
+    corrResiduals = residualAutoCorr(dataY - ncpTotal, [1])
+    print(f"\nNumber of spectra with lag-1 correlation of residuals > 0.5: {np.sum(corrResiduals[:, 0, 0]>0.5)}")
 
     wsDataSum = SumSpectra(InputWorkspace=ws, OutputWorkspace=ws.name()+"_Sum")
     plotSumNCPFits(wsDataSum, *ncpSumWSs, IC)
+    registerIntermediate(ws.name(), wsDataSum.name())
     return ncpTotal
 
 
+def residualAutoCorr(residuals, lags):
+    """
+    Pearson correlation of residuals with themselves shifted by each lag, for all spectra at once.
+    Residuals shape: (noOfSpec, noOfBins)
+    Output shape: (noOfSpec, noOfLags, 2), with correlation coefficients and two-sided p-values,
+    same as scipy.stats.pearsonr(residuals[i, :-lag], residuals[i, lag:]).
+    Masked spectra, with constant residuals, give nans.
+    """
+
+    corr = np.zeros((len(residuals), len(lags), 2))
+    for i, lag in enumerate(lags):
+        x = residuals[:, :-lag]
+        y = residuals[:, lag:]
+        xm = x - np.mean(x, axis=1)[:, np.newaxis]
+        ym = y - np.mean(y, axis=1)[:, np.newaxis]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            r = np.sum(xm * ym, axis=1) / np.sqrt(np.sum(xm**2, axis=1) * np.sum(ym**2, axis=1))
+        r = np.clip(r, -1, 1)
+
+        # Distribution of r under null hypothesis is a beta distribution on [-1, 1]
+        n = x.shape[1]
+        pValues = 2 * stats.beta.cdf(-np.abs(r), n/2-1, n/2-1, loc=-1, scale=2)
+
+        corr[:, i, 0] = r
+        corr[:, i, 1] = pValues
+    return corr
+
+
 def extractWS(ws):
     """Directly exctracts data from workspace into arrays"""
     return ws.extractX(), ws.extractY(), ws.extractE()
@@ -300,12 +428,17 @@ def convertDataXToYSpacesForEachMass(dataX, masses, delta_Q, delta_E):
 
 
 def fitNcpToArray(ic, dataY, dataE, resolutionPars, instrPars, kinematicArrays, ySpacesForEachMass):
-    """Takes dataY as a 2D array and returns the 2D array best fit parameters."""
+    """
+    Takes dataY as a 2D array and returns the 2D array best fit parameters,
+    the 2D array of telemetry of each fit and the exit messages of the minimizer.
+    """
 
     arrFitPars = np.zeros((len(dataY), len(ic.initPars)+3))
+    arrTelemetry = np.zeros((len(dataY), len(ic.initPars)+5))
+    fitMessages = []
     for i in range(len(dataY)):
 
-        specFitPars = fitNcpToSingleSpec(
+        specFitPars, specTelemetry, message = fitNcpToSingleSpec(
             dataY[i],
             dataE[i],
             ySpacesForEachMass[i],
@@ -316,6 +449,8 @@ def fitNcpToArray(ic, dataY, dataE, resolutionPars, instrPars, kinematicArrays,
             ) 
 
         arrFitPars[i] = specFitPars
+        arrTelemetry[i] = specTelemetry
+        fitMessages.append(message)
 
         if np.all(specFitPars==0):
             print("Skipped spectra.")
@@ -323,7 +458,7 @@ def fitNcpToArray(ic, dataY, dataE, resolutionPars, instrPars, kinematicArrays,
             print(f"Fitted spectra {int(specFitPars[0]):3}")
     
     assert ~np.all(arrFitPars==0), "Either Fits are all zero or assignment of fitting not working"
-    return arrFitPars
+    return arrFitPars, arrTelemetry, fitMessages
 
 
 def createTableWSForFitPars(wsName, noOfMasses, arrFitPars):
@@ -342,6 +477,39 @@ def createTableWSForFitPars(wsName, noOfMasses, arrFitPars):
     return 
 
 
+def createTableWSForFitTelemetry(wsName, noOfMasses, arrTelemetry, fitMessages):
+    """Companion table of the best fit parameters with cost and convergence of each fit."""
+
+    tableWS = CreateEmptyTableWorkspace(OutputWorkspace=wsName+"_Fit_Telemetry")
+    tableWS.setTitle("SCIPY Fit Telemetry")
+    for name in telemetryColumnNames(noOfMasses):
+        tableWS.addColumn(type='float', name=name)
+    tableWS.addColumn(type='str', name="Message")
+
+    for row, message in zip(arrTelemetry, fitMessages):
+        tableWS.addRow(list(row) + [message])
+    return
+
+
+def telemetryColumnNames(noOfMasses):
+    """Active bounds columns are -1 at lower bound, 1 at upper bound and 0 otherwise."""
+
+    names = ["Spec Idx", "No Fun Evals", "No Jac Evals", "Fit Time", "Exit Status"]
+    for i in range(int(noOfMasses)):
+        names += [f"Bound Intensity {i}", f"Bound Width {i}", f"Bound Center {i}"]
+    return names
+
+
+def printFitTelemetry(arrTelemetry):
+    fitted = arrTelemetry[~np.all(arrTelemetry==0, axis=1)]
+    slowest = fitted[np.argsort(fitted[:, 3])[::-1][:3]]
+
+    print(f"\nFits not converged: {np.sum(fitted[:, 4]!=0)}, fits with active bounds: {np.sum(np.any(fitted[:, 5:]!=0, axis=1))}")
+    print("Slowest spectra: " + ", ".join([f"{int(row[0])} ({row[3]:.2f} s, {int(row[1])} evals)" for row in slowest]))
+    return
+
+
+@profiled("ncp_build")
 def calculateNcpArr(ic, arrBestFitPars, resolutionPars, instrPars, kinematicArrays, ySpacesForEachMass):
     """Calculates the matrix of NCP from matrix of best fit parameters"""
 
@@ -388,6 +556,7 @@ def createNcpWorkspaces(ncpForEachMass, ncpTotal, ws, ic):
     ncpTotWS = createWS(dataX, ncpTotal, np.zeros(dataX.shape), ws.name()+"_TOF_Fitted_Profiles")
     MaskDetectors(Workspace=ncpTotWS, WorkspaceIndexList=ic.maskedDetectorIdx)
     wsTotNCPSum = SumSpectra(InputWorkspace=ncpTotWS, OutputWorkspace=ncpTotWS.name()+"_Sum" )
+    registerIntermediate(ws.name(), wsTotNCPSum.name())    # Total ncp kept, used by bootstrap from any iteration
 
     # Individual ncp workspaces
     wsMNCPSum = []
@@ -396,6 +565,7 @@ def createNcpWorkspaces(ncpForEachMass, ncpTotal, ws, ic):
         MaskDetectors(Workspace=ncpMWS, WorkspaceIndexList=ic.maskedDetectorIdx)
         wsNCPSum = SumSpectra(InputWorkspace=ncpMWS, OutputWorkspace=ncpMWS.name()+"_Sum" )
         wsMNCPSum.append(wsNCPSum)
+        registerIntermediate(ws.name(), ncpMWS.name(), wsNCPSum.name())
         
     return wsTotNCPSum, wsMNCPSum
 
@@ -413,27 +583,37 @@ def createWS(dataX, dataY, dataE, wsName):
 
 def plotSumNCPFits(wsDataSum, wsTotNCPSum, wsMNCPSum, IC):
 
-    if IC.runningSampleWS:   # Skip saving figure if running bootstrap
+    if IC.runningSampleWS | (not figuresEnabled()):   # Skip saving figure if running bootstrap or headless
         return         
 
+    dataY = wsDataSum.readY(0).copy()
+    dataX = pointsX(wsDataSum.readX(0).copy(), dataY)
+    dataE = wsDataSum.readE(0).copy()
+    ncpTotal = wsTotNCPSum.readY(0).copy()
+    ncpX = pointsX(wsTotNCPSum.readX(0).copy(), ncpTotal)
+    ncpForEachMass = [wsNcp.readY(0).copy() for wsNcp in wsMNCPSum]
+
+    savePath = IC.figSavePath / (wsDataSum.name()+"_NCP_Fits.pdf")
+    submitFigure(renderSumNCPFits, savePath, dataX, dataY, dataE, ncpX, ncpTotal, ncpForEachMass, IC.masses.copy())
+    return
+
+
+def renderSumNCPFits(savePath, dataX, dataY, dataE, ncpX, ncpTotal, ncpForEachMass, masses):
     lw = 2
 
-    fig, ax = plt.subplots(subplot_kw={"projection":"mantid"})
-    ax.errorbar(wsDataSum, "k.", label="Spectra")
+    fig, ax = newFigure()
+    ax.errorbar(dataX, dataY, dataE, fmt="k.", label="Spectra")
 
-    ax.plot(wsTotNCPSum, "r-", label="Total NCP", linewidth=lw)
-    for m, wsNcp in zip(IC.masses, wsMNCPSum):
-        ax.plot(wsNcp, label=f"NCP m={m}", linewidth=lw)
+    ax.plot(ncpX, ncpTotal, "r-", label="Total NCP", linewidth=lw)
+    for m, ncp in zip(masses, ncpForEachMass):
+        ax.plot(ncpX, ncp, label=f"NCP m={m}", linewidth=lw)
     
     ax.set_xlabel("TOF")
     ax.set_ylabel("Counts")
     ax.set_title("Sum of NCP fits")
     ax.legend()
 
-    fileName = wsDataSum.name()+"_NCP_Fits.pdf"
-    savePath = IC.figSavePath / fileName
-    plt.savefig(savePath, bbox_inches="tight")
-    plt.close(fig)
+    fig.savefig(savePath, bbox_inches="tight")
     return
 
 
@@ -530,12 +710,74 @@ def filterWidthsAndIntensities(widthsIn, intensitiesIn, IC):
     return betterWidths, betterIntensities
 
 
+def calculateMeansAndStdsBatch(widthsIn, intensitiesIn, IC):
+    """
+    Same as calculateMeansAndStds() for a stack of samples, in a single pass.
+    Widths and Intensities shape: (noOfSamples, noOfMasses, noOfSpec)
+    Outputs shape: (noOfSamples, noOfMasses)
+    """
+
+    betterWidths, betterIntensities = filterWidthsAndIntensitiesBatch(widthsIn, intensitiesIn, IC)
+    
+    meanWidths = np.nanmean(betterWidths, axis=2)  
+    stdWidths = np.nanstd(betterWidths, axis=2)
+
+    meanIntensityRatios = np.nanmean(betterIntensities, axis=2)
+    stdIntensityRatios = np.nanstd(betterIntensities, axis=2)
+
+    return meanWidths, stdWidths, meanIntensityRatios, stdIntensityRatios
+
+
+def filterWidthsAndIntensitiesBatch(widthsIn, intensitiesIn, IC):
+    """
+    Same as filterWidthsAndIntensities() for a stack of samples, in a single pass.
+    Widths and Intensities shape: (noOfSamples, noOfMasses, noOfSpec)
+    """
+
+    widths = widthsIn.copy()      # Copy to avoid accidental changes in arrays
+    intensities = intensitiesIn.copy()
+
+    zeroSpecs = np.all(widths==0, axis=1)[:, np.newaxis, :]   # Catches all failed fits, not just masked spectra
+    widths = np.where(zeroSpecs, np.nan, widths)
+    intensities = np.where(zeroSpecs, np.nan, intensities)
+
+    meanWidths = np.nanmean(widths, axis=2)[:, :, np.newaxis]  
+
+    widthDeviation = np.abs(widths - meanWidths)
+    stdWidths = np.nanstd(widths, axis=2)[:, :, np.newaxis]  
+
+    # Put nan in places where width deviation is bigger than std
+    filterMask = widthDeviation > stdWidths
+    betterWidths = np.where(filterMask, np.nan, widths)
+    
+    maskedIntensities = np.where(filterMask, np.nan, intensities)
+    betterIntensities = maskedIntensities / np.sum(maskedIntensities, axis=1)[:, np.newaxis, :]   # Not nansum()      
+    
+    # When trying to estimate HToMassIdxRatio and normalization fails, skip normalization
+    failedNorm = np.all(np.isnan(betterIntensities), axis=(1, 2))
+    if np.any(failedNorm) & IC.runningPreliminary:
+        assert IC.noOfMSIterations == 0, "Calculation of mean intensities failed, cannot proceed with MS correction. Try to run again with noOfMSIterations=0."
+        betterIntensities[failedNorm] = maskedIntensities[failedNorm] 
+
+    # Same checks as for a single sample, evaluated for all samples at once
+    assert np.all(np.sum(filterMask, axis=(1, 2)) >= 1), "No widths survive filtering condition"
+    assert not(np.any(np.all(np.isnan(betterWidths), axis=(1, 2)))), "All filtered widths are nan"
+    assert not(np.any(np.all(np.isnan(betterIntensities), axis=(1, 2)))), "All filtered intensities are nan"
+    if betterWidths.shape[1]>1:
+        assert np.all(np.nanmax(betterWidths, axis=(1, 2)) != np.nanmin(betterWidths, axis=(1, 2))), "All fitered widths have the same value"
+        assert np.all(np.nanmax(betterIntensities, axis=(1, 2)) != np.nanmin(betterIntensities, axis=(1, 2))), "All fitered intensities have the same value"
+   
+    return betterWidths, betterIntensities
+
+
+@profiled("spectrum_fit")
 def fitNcpToSingleSpec(dataY, dataE, ySpacesForEachMass, resolutionPars, instrPars, kinematicArrays, ic):
     """Fits the NCP and returns the best fit parameters for one spectrum"""
 
     if np.all(dataY == 0) : 
-        return np.zeros(len(ic.initPars)+3)  
+        return np.zeros(len(ic.initPars)+3), np.zeros(len(ic.initPars)+5), "Skipped"
 
+    t0 = time.time()
     result = optimize.minimize(
         errorFunction, 
         ic.initPars, 
@@ -545,11 +787,27 @@ def fitNcpToSingleSpec(dataY, dataE, ySpacesForEachMass, resolutionPars, instrPa
         constraints=ic.constraints
         )
 
+    fitTime = time.time() - t0
     fitPars = result["x"]
 
     noDegreesOfFreedom = len(dataY) - len(fitPars)
     specFitPars = np.append(instrPars[0], fitPars)
-    return np.append(specFitPars, [result["fun"] / noDegreesOfFreedom, result["nit"]])
+
+    specTelemetry = np.append(
+        [instrPars[0], result["nfev"], result.get("njev", 0), fitTime, result["status"]],
+        activeBounds(fitPars, ic.bounds)
+        )
+    return np.append(specFitPars, [result["fun"] / noDegreesOfFreedom, result["nit"]]), specTelemetry, result["message"]
+
+
+def activeBounds(pars, bounds, relTol=1e-6):
+    """-1 for parameters at lower bound, 1 at upper bound and 0 otherwise. Nan bounds are ignored."""
+
+    lower, upper = bounds[:, 0], bounds[:, 1]
+    with np.errstate(invalid="ignore"):
+        atLower = np.abs(pars - lower) <= relTol * np.maximum(1, np.abs(lower))
+        atUpper = np.abs(pars - upper) <= relTol * np.maximum(1, np.abs(upper))
+    return np.where(atLower, -1, np.where(atUpper, 1, 0))
 
 
 def errorFunction(pars, dataY, dataE, ySpacesForEachMass, resolutionPars, instrPars, kinematicArrays, ic):
@@ -745,6 +1003,7 @@ def numericalThirdDerivative(x, fun):
     return derivative
 
 
+@profiled("ms")
 def createWorkspacesForMSCorrection(ic, meanWidths, meanIntensityRatios, wsNCPM):
     """Creates _MulScattering and _TotScattering workspaces used for the MS correction"""
 
@@ -822,6 +1081,7 @@ def createMulScatWorkspaces(ic, ws, sampleProperties):
         Multiply(LHSWorkspace=workspace, RHSWorkspace=data_normalisation, OutputWorkspace=workspace)
         RenameWorkspace(InputWorkspace=workspace, OutputWorkspace=ws.name()+workspace)
         SumSpectra(ws.name()+workspace, OutputWorkspace=ws.name()+workspace+"_Sum")
+    registerIntermediate("ms", ws.name()+"_TotScattering", ws.name()+"_TotScattering_Sum", ws.name()+"_MulScattering_Sum")
         
     DeleteWorkspaces(
         [data_normalisation, simulation_normalisation, trans, dens]
@@ -830,6 +1090,7 @@ def createMulScatWorkspaces(ic, ws, sampleProperties):
     return mtd[ws.name()+"_MulScattering"]
 
 
+@profiled("gamma")
 def createWorkspacesForGammaCorrection(ic, meanWidths, meanIntensityRatios, wsNCPM):
     """Creates _gamma_background correction workspace to be subtracted from the main workspace"""
 
@@ -865,76 +1126,89 @@ def calcGammaCorrectionProfiles(masses, meanWidths, meanIntensityRatios):
 
 
 class resultsObject:
-    """Used to collect results from workspaces and store them in .npz files for testing."""
+    """
+    Used to collect results of each iteration as they are produced and store them in .npz files for testing.
+    Arrays of all iterations are allocated at the first fit, when the number of spectra and bins is known.
+    """
     def __init__(self, ic):
 
-        allIterNcp = []
-        allFitWs = []
-        allTotNcp = []
-        allBestPar = []
-        allMeanWidhts = []
-        allMeanIntensities = []
-        allStdWidths = []
-        allStdIntensities = []
-        j=0
-        while True:
-            try:
-                wsIterName = ic.name+str(j)
-
-                # Extract ws that were fitted
-                ws = mtd[wsIterName]
-                allFitWs.append(ws.extractY())
-
-                # Extract total ncp
-                totNcpWs = mtd[wsIterName+"_TOF_Fitted_Profiles"]
-                allTotNcp.append(totNcpWs.extractY())
-
-                # Extract best fit parameters
-                fitParTable = mtd[wsIterName+"_Best_Fit_NCP_Parameters"]
-                bestFitPars = []
-                for key in fitParTable.keys():
-                    bestFitPars.append(fitParTable.column(key))
-                allBestPar.append(np.array(bestFitPars).T)
-                
-                # Extract individual ncp 
-                allNCP = []
-                i = 0
-                while True:   # By default, looks for all ncp ws until it breaks
-                    try:
-                        ncpWsToAppend = mtd[wsIterName+"_TOF_Fitted_Profile_"+str(i)]
-                        allNCP.append(ncpWsToAppend.extractY())
-                        i += 1
-                    except KeyError:
-                        break
-                allNCP = switchFirstTwoAxis(np.array(allNCP))
-                allIterNcp.append(allNCP)
-                
-                # Extract Mean and Std Widths, Intensities
-                meansTable = mtd[wsIterName + "_Mean_Widths_And_Intensities"]
-                allMeanWidhts.append(meansTable.column("Mean Widths"))
-                allStdWidths.append(meansTable.column("Std Widths"))
-                allMeanIntensities.append(meansTable.column("Mean Intensities"))
-                allStdIntensities.append(meansTable.column("Std Intensities"))  
-                
-                j+=1
-            except KeyError:
-                break
-
-        self.all_fit_workspaces = np.array(allFitWs)
-        self.all_spec_best_par_chi_nit = np.array(allBestPar)
-        self.all_tot_ncp = np.array(allTotNcp)
-        self.all_ncp_for_each_mass = np.array(allIterNcp)
-
-        self.all_mean_widths = np.array(allMeanWidhts)
-        self.all_mean_intensities = np.array(allMeanIntensities)
-        self.all_std_widths = np.array(allStdWidths)
-        self.all_std_intensities = np.array(allStdIntensities)
+        self.noOfIterations = ic.noOfMSIterations + 1
+        self.noOfFits = 0
+        self.noOfMeans = 0
+        self.allFitMessages = []
+
+        meansShape = (self.noOfIterations, ic.noOfMasses)
+        self.all_mean_widths = np.zeros(meansShape)
+        self.all_mean_intensities = np.zeros(meansShape)
+        self.all_std_widths = np.zeros(meansShape)
+        self.all_std_intensities = np.zeros(meansShape)
 
         # Pass all attributes of ic into attributes to be used whithin this object
         self.maskedDetectorIdx = ic.maskedDetectorIdx
         self.masses = ic.masses
         self.noOfMasses = ic.noOfMasses
         self.resultsSavePath = ic.resultsSavePath
+        self.resultsFormat = ic.resultsFormat
+        self.icMeta = icMetadata(ic)
+
+
+    def allocateFitArrays(self, wsDataY, arrFitPars, arrTelemetry, ncpForEachMass):
+        self.all_fit_workspaces = np.zeros((self.noOfIterations,) + wsDataY.shape)
+        self.all_spec_best_par_chi_nit = np.zeros((self.noOfIterations,) + arrFitPars.shape)
+        self.all_fit_telemetry = np.zeros((self.noOfIterations,) + arrTelemetry.shape)
+        self.all_ncp_for_each_mass = np.zeros((self.noOfIterations,) + ncpForEachMass.shape)
+        self.all_tot_ncp = np.zeros((self.noOfIterations,) + ncpForEachMass[:, 0].shape)
+
+
+    def addFit(self, wsDataY, arrFitPars, arrTelemetry, fitMessages, ncpForEachMass, ncpTotal):
+        """Stores results of the fit of the next iteration."""
+
+        if self.noOfFits == 0:
+            self.allocateFitArrays(wsDataY, arrFitPars, arrTelemetry, ncpForEachMass)
+
+        j = self.noOfFits
+        self.all_fit_workspaces[j] = wsDataY
+        self.all_spec_best_par_chi_nit[j] = arrFitPars
+        self.all_fit_telemetry[j] = arrTelemetry
+        self.allFitMessages.append(list(fitMessages))
+
+        # Masked as in ncp workspaces
+        self.all_ncp_for_each_mass[j] = ncpForEachMass
+        self.all_ncp_for_each_mass[j, self.maskedDetectorIdx] = 0
+        self.all_tot_ncp[j] = ncpTotal
+        self.all_tot_ncp[j, self.maskedDetectorIdx] = 0
+        self.noOfFits += 1
+
+
+    def addMeans(self, meanWidths, stdWidths, meanIntensityRatios, stdIntensityRatios):
+        """Stores means and stds of widths and intensities of the next iteration."""
+
+        j = self.noOfMeans
+        self.all_mean_widths[j] = meanWidths
+        self.all_std_widths[j] = stdWidths
+        self.all_mean_intensities[j] = meanIntensityRatios
+        self.all_std_intensities[j] = stdIntensityRatios
+        self.noOfMeans += 1
+
+
+    @property
+    def all_fit_messages(self):
+        return np.array(self.allFitMessages)
+
+
+    def arrays(self):
+        return {
+            "all_fit_workspaces": self.all_fit_workspaces,
+            "all_spec_best_par_chi_nit": self.all_spec_best_par_chi_nit,
+            "all_mean_widths": self.all_mean_widths,
+            "all_mean_intensities": self.all_mean_intensities,
+            "all_std_widths": self.all_std_widths,
+            "all_std_intensities": self.all_std_intensities,
+            "all_tot_ncp": self.all_tot_ncp,
+            "all_ncp_for_each_mass": self.all_ncp_for_each_mass,
+            "all_fit_telemetry": self.all_fit_telemetry,
+            "all_fit_messages": self.all_fit_messages
+            }
 
 
     def save(self):
@@ -945,16 +1219,13 @@ class resultsObject:
         self.all_spec_best_par_chi_nit[:, self.maskedDetectorIdx, :] = np.nan
         self.all_ncp_for_each_mass[:, self.maskedDetectorIdx, :, :] = np.nan
         self.all_tot_ncp[:, self.maskedDetectorIdx, :] = np.nan
+        self.all_fit_telemetry[:, self.maskedDetectorIdx, :] = np.nan
 
-        savePath = self.resultsSavePath
-        np.savez(savePath,
-                 all_fit_workspaces=self.all_fit_workspaces,
-                 all_spec_best_par_chi_nit=self.all_spec_best_par_chi_nit,
-                 all_mean_widths=self.all_mean_widths,
-                 all_mean_intensities=self.all_mean_intensities,
-                 all_std_widths=self.all_std_widths,
-                 all_std_intensities=self.all_std_intensities,
-                 all_tot_ncp=self.all_tot_ncp,
-                 all_ncp_for_each_mass=self.all_ncp_for_each_mass)
+        if self.resultsFormat == "hdf5":
+            savePath = self.resultsSavePath.with_suffix(".h5")
+            saveResultsHDF5(savePath, self.arrays(), self.icMeta)
+        else:
+            savePath = self.resultsSavePath
+            np.savez(savePath, **self.arrays())
 
            
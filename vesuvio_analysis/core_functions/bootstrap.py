@@ -1,21 +1,35 @@
-from vesuvio_analysis.core_functions.fit_in_yspace import fitInYSpaceProcedure
+from vesuvio_analysis.core_functions.fit_in_yspace import fitInYSpaceProcedure, ySpaceBootstrap
 from vesuvio_analysis.core_functions.procedures import runJointBackAndForwardProcedure, runIndependentIterativeProcedure
-from vesuvio_analysis.core_functions.ICHelpers import buildFinalWSName, noOfHistsFromTOFBinning
+from vesuvio_analysis.core_functions.ICHelpers import buildFinalWSName, noOfJackknifeSamples, logString
+from vesuvio_analysis.core_functions.run_times import estimateRunTime
+from vesuvio_analysis.core_functions.bootstrap_queue import BootQueue, atomicWrite
+from vesuvio_analysis.core_functions.profiling import stage, profiled
+from vesuvio_analysis.core_functions.plotting import closeAllFigures, figuresEnabled
+from vesuvio_analysis.core_functions.analysis_functions import extractWS, histToPointData, prepareFitArgs, calculateNcpSpec, residualAutoCorr
 from mantid.api import AnalysisDataService, mtd
-from mantid.simpleapi import CloneWorkspace, SaveNexus, Load, SumSpectra
-from scipy import stats
+from mantid.simpleapi import CloneWorkspace, SaveNexus, Load, SumSpectra, Minus
 import numpy as np
 from pathlib import Path
+import shutil
 import time
-import matplotlib.pyplot as plt
-plt.style.use("ggplot")
+import uuid
+import subprocess
+import pickle
+import sys
 currentPath = Path(__file__).parent.absolute()
+repoPath = currentPath.parent.parent
+
+runningWorker = False    # Set by bootstrap_worker, runs only replicas published by the main process
 
 
 def runBootstrap(bckwdIC, fwdIC, bootIC, yFitIC):
 
     checkValidInput(bootIC)
 
+    if runningWorker:
+        runBootstrapWorker(bckwdIC, fwdIC, bootIC, yFitIC)
+        raise BootstrapWorkerFinished()
+
     checkOutputDirExists(bckwdIC, fwdIC, bootIC)            # Checks to see if those directories exits already
     askUserConfirmation(bckwdIC, fwdIC, bootIC)
     AnalysisDataService.clear()
@@ -28,8 +42,37 @@ def runBootstrap(bckwdIC, fwdIC, bootIC, yFitIC):
 
 def checkValidInput(bootIC):
     boot = bootIC.bootstrapType
-    assert (boot=="JACKKNIFE") | (boot=="BOOT_GAUSS_ERRS") | (boot=="BOOT_RESIDUALS"), \
-        "bootstrapType not recognized. Options: 'JACKKNIFE', 'BOOT_GAUSS_ERRS', 'BOOT_RESIDUALS'"
+    assert (boot=="JACKKNIFE") | (boot=="BOOT_GAUSS_ERRS") | (boot=="BOOT_RESIDUALS") | (boot=="BOOT_FAST_LINEAR") | (boot=="BOOT_YSPACE"), \
+        "bootstrapType not recognized. Options: 'JACKKNIFE', 'BOOT_GAUSS_ERRS', 'BOOT_RESIDUALS', 'BOOT_FAST_LINEAR', 'BOOT_YSPACE'"
+
+    if boot=="BOOT_FAST_LINEAR":
+        assert bootIC.fitInYSpace==None, "Fast linear Bootstrap only resamples ncp parameters, set fitInYSpace to None."
+
+    if boot=="BOOT_YSPACE":
+        assert bootIC.fitInYSpace!=None, "Y-space Bootstrap only resamples y-space fit parameters, select fitInYSpace."
+        assert (bootIC.ySpaceResampling=="SPECTRA") | (bootIC.ySpaceResampling=="RESIDUALS"), \
+            "ySpaceResampling not recognized. Options: 'SPECTRA', 'RESIDUALS'"
+
+    assert not(bootIC.skipMSIterations & bootIC.reuseParentCorrections), \
+        "skipMSIterations and reuseParentCorrections can not be both set to True."
+
+    if bootIC.earlyStopTolerance is not None:
+        assert (boot=="BOOT_RESIDUALS") | (boot=="BOOT_GAUSS_ERRS"), "Early stopping only available for 'BOOT_RESIDUALS' and 'BOOT_GAUSS_ERRS'."
+        assert bootIC.earlyStopTolerance > 0, "Tolerance for early stopping needs to be positive."
+        assert type(bootIC.earlyStopWindow)==int and (bootIC.earlyStopWindow > 0), "Window for early stopping needs to be a positive integer."
+
+    if bootIC.distributed:
+        assert (boot!="BOOT_FAST_LINEAR") & (boot!="BOOT_YSPACE") & (bootIC.earlyStopTolerance is None), \
+            "Distributed Bootstrap not available for 'BOOT_FAST_LINEAR', 'BOOT_YSPACE' or with early stopping."
+        assert not((boot=="JACKKNIFE") & (bootIC.procedure=="JOINT")), \
+            "Distributed Jackknife not available for 'JOINT' procedure, run 'BACKWARD' and 'FORWARD' separately."
+        assert bootIC.claimTimeout > 0, "Timeout of claims needs to be positive."
+
+    if (boot=="JACKKNIFE") and (bootIC.jackknifeGroups is not None):
+        assert type(bootIC.jackknifeGroups)==int, "Number of Jackknife groups needs to be an integer."
+        assert bootIC.jackknifeGroups > 1, "Number of Jackknife groups needs to be bigger than one."
+        assert (bootIC.jackknifeGroupMode=="CONTIGUOUS") | (bootIC.jackknifeGroupMode=="STRIDED"), \
+            "jackknifeGroupMode not recognized. Options: 'CONTIGUOUS', 'STRIDED'"
 
 
 def checkOutputDirExists(bckwdIC, fwdIC, bootIC):
@@ -66,23 +109,80 @@ def JackknifeProcedure(bckwdIC, fwdIC, bootIC, yFitIC):
         # Run original procedure to change fwdIC from running backward
         runOriginalBeforeBootstrap(bckwdIC, fwdIC, bootIC, yFitIC) 
 
-        bootIC.procedure="BACKWARD"
-        bootIC.fitInYSpace="BACKWARD"
-        bckwdJackRes = bootstrapProcedure(bckwdIC, fwdIC, bootIC, yFitIC)
+        icStates = stateOfICs(bckwdIC, fwdIC, bootIC, yFitIC)
+        try:
+            pickle.dumps(icStates)
+        except (pickle.PicklingError, AttributeError, TypeError):     # Functions in constraints
+            print("\nInitial conditions can not be sent to other processes, running Jackknife halves one after the other.")
+            bckwdJackRes = runJackknifeHalf("BACKWARD", bckwdIC, fwdIC, bootIC, yFitIC)
+            fwdJackRes = runJackknifeHalf("FORWARD", bckwdIC, fwdIC, bootIC, yFitIC)
+            return {**bckwdJackRes, **fwdJackRes}    # For consistency
+
+        return runJackknifeHalvesConcurrently(bckwdIC, icStates)
+    else: raise ValueError ("Bootstrap procedure not recognized.")
 
-        bootIC.procedure="FORWARD"
-        bootIC.fitInYSpace="FORWARD"
-        fwdJackRes = bootstrapProcedure(bckwdIC, fwdIC, bootIC, yFitIC)
 
-        return {**bckwdJackRes, **fwdJackRes}    # For consistency
-    else: raise ValueError ("Bootstrap procedure not recognized.")
+def runJackknifeHalf(mode, bckwdIC, fwdIC, bootIC, yFitIC):
+    bootIC.procedure=mode
+    bootIC.fitInYSpace=mode
+    return bootstrapProcedure(bckwdIC, fwdIC, bootIC, yFitIC)
+
+
+def stateOfICs(bckwdIC, fwdIC, bootIC, yFitIC):
+    """Public attributes of each initial conditions, including inherited ones, to rebuild them in another process."""
+    ICs = {"bckwdIC": bckwdIC, "fwdIC": fwdIC, "bootIC": bootIC, "yFitIC": yFitIC}
+    return {key: {name: getattr(IC, name) for name in dir(IC) if not name.startswith("_")} for key, IC in ICs.items()}
 
 
+def runJackknifeHalvesConcurrently(bckwdIC, icStates):
+    """
+    Backward and forward Jackknife are independent after the parent procedure,
+    so each runs in a new Python process started from the initial conditions of this process.
+    Processes are started anew instead of forked, since Mantid is not safe to fork.
+    Each half runs its own parent procedure, so no workspaces are passed to the processes.
+    """
+
+    halvesPath = bckwdIC.bootSavePath.parent / f"jackknife_halves_{uuid.uuid4().hex[:8]}"
+    halvesPath.mkdir()
+    processes = {}
+    try:
+        for mode in ["BACKWARD", "FORWARD"]:
+            state = {"mode": mode, "ICs": icStates, "headless": not(figuresEnabled()),
+                "resultsPath": halvesPath / f"{mode}_results.pkl"}
+            with open(halvesPath / f"{mode}_state.pkl", "wb") as stateFile:
+                pickle.dump(state, stateFile)
+            processes[mode] = subprocess.Popen(
+                [sys.executable, "-m", "vesuvio_analysis.jackknife_half", str(halvesPath / f"{mode}_state.pkl")],
+                cwd=repoPath
+                )
+
+        halfResults = {}
+        while len(halfResults) < len(processes):
+            for mode, process in processes.items():
+                if (mode in halfResults) or (process.poll() is None):
+                    continue
+                if process.returncode != 0:
+                    raise RuntimeError(f"Process running {mode} Jackknife failed with exit code {process.returncode}.")
+                with open(halvesPath / f"{mode}_results.pkl", "rb") as resultsFile:
+                    halfResults[mode] = pickle.load(resultsFile)
+            time.sleep(1)
+    finally:
+        for process in processes.values():
+            if process.poll() is None:
+                process.terminate()
+            process.wait()
+        shutil.rmtree(halvesPath, ignore_errors=True)
+
+    return {**halfResults["BACKWARD"], **halfResults["FORWARD"]}    # For consistency
+
+
+@profiled("bootstrap")
 def bootstrapProcedure(bckwdIC, fwdIC, bootIC, yFitIC):
     """
     Main algorithm for the Bootstrap.
     Allows for Jackknife or Bootstrap depending on bool flag set in bootIC.
     Chooses fast or slow (correct) version of bootstrap depending on flag set in bootIC.
+    Intermediate version reuses MS and gamma corrections of parent on each replica.
     Performs either independent or joint procedure depending of len(inputIC).
     """
     if bootIC.bootstrapType=="JACKKNIFE": assert bootIC.procedure!='JOINT', "'JOINT' mode should not have reached Jackknife here."
@@ -95,109 +195,342 @@ def bootstrapProcedure(bckwdIC, fwdIC, bootIC, yFitIC):
     nSamples = chooseNSamples(bootIC, parentWSnNCPs)
 
     bootResults = initializeResults(parentResults, nSamples, corrCoefs)
+    if bootIC.bootstrapType=="BOOT_YSPACE":     # Ncp parameters are not resampled
+        bootResults = {key: bootResults[key] for key in bootResults if key.endswith("YFit")}
     saveBootstrapLogs(bootResults, bckwdIC, fwdIC)
-    parentWSNCPSavePaths = convertWSToSavePaths(parentWSnNCPs)
 
-    iStart, iEnd = chooseLoopRange(bootIC, nSamples)
+    if bootIC.bootstrapType=="BOOT_YSPACE":     # No replicas of TOF workspaces needed
+        ySpaceBootstrapProcedure(bckwdIC, fwdIC, bootIC, yFitIC, bootResults, nSamples)
+        saveBootstrapResults(bootResults, bckwdIC, fwdIC)
+        return bootResults
+
+    if bootIC.bootstrapType=="BOOT_FAST_LINEAR":    # No replicas of workspaces needed
+        linearBootstrapProcedure(bckwdIC, fwdIC, parentWSnNCPs, bootResults, nSamples)
+        saveBootstrapResults(bootResults, bckwdIC, fwdIC)
+        return bootResults
+
+    parentWSDir = parentWSDirForBootstrap(bckwdIC, fwdIC, bootIC)
+    try:
+        parentWSNCPSavePaths = convertWSToSavePaths(parentWSnNCPs, parentWSDir)
+        parentCorrSavePaths = convertWSToSavePaths(selectParentCorrections(bckwdIC, fwdIC, bootIC), parentWSDir)
+
+        iStart, iEnd = chooseLoopRange(bootIC, nSamples)
+
+        if bootIC.distributed:    # Replicas are shared with worker processes
+            distributedBootstrapProcedure(bckwdIC, fwdIC, bootIC, yFitIC, bootResults, range(iStart, iEnd),
+                parentWSNCPSavePaths, parentCorrSavePaths)
+        else:
+            replicasProcedure(bckwdIC, fwdIC, bootIC, yFitIC, bootResults, range(iStart, iEnd),
+                parentWSNCPSavePaths, parentCorrSavePaths)
+    finally:    # Parent workspaces only needed while replicas run
+        shutil.rmtree(parentWSDir, ignore_errors=True)
+    return bootResults
+
+
+def replicasProcedure(bckwdIC, fwdIC, bootIC, yFitIC, bootResults, sampleIdxs,
+    parentWSNCPSavePaths, parentCorrSavePaths):
+    """Runs replicas one after the other in this process, stopping early if selected."""
+
+    monitor = initializeMonitor(bootIC)
 
     # Form each bootstrap workspace and run ncp fit with MS corrections
-    for i in range(iStart, iEnd):
+    for i in sampleIdxs:
         AnalysisDataService.clear()
-        plt.close("all")    # Not sure if previous step clears plt figures, so introduced this step to be safe
+        closeAllFigures()    # Not sure if previous step clears plt figures, so introduced this step to be safe
 
         try:
             sampleInputWS, parentWS = createSampleWS(parentWSNCPSavePaths, i, bootIC)   # Creates ith sample
         except JackMaskCol: continue    # If Jackknife column already masked, skip to next column
 
+        if bootIC.reuseParentCorrections:
+            applyParentCorrections(sampleInputWS, parentCorrSavePaths)
+
         formSampleIC(bckwdIC, fwdIC, bootIC, sampleInputWS, parentWS)  
         try:
-            iterResults = runMainProcedure(bckwdIC, fwdIC, bootIC, yFitIC)   # Conversion to YSpace with masked column
+            with stage("bootstrap_replica"):
+                iterResults = runMainProcedure(bckwdIC, fwdIC, bootIC, yFitIC)   # Conversion to YSpace with masked column
         except AssertionError: continue     # If the procedure fails, skip to next iteration
         
         storeBootIter(bootResults, i, iterResults)   # Stores results for each iteration
         saveBootstrapResults(bootResults, bckwdIC, fwdIC)
-    return bootResults
 
+        if monitor is not None:
+            monitor.update(convergenceValues(iterResults))
+            if monitor.converged():
+                stopBootstrapEarly(bootResults, i+1, bckwdIC, fwdIC, yFitIC, bootIC)
+                break
+    return
 
-def askUserConfirmation(bckwdIC, fwdIC, bootIC):
-    """Estimates running time for all samples and asks the user to confirm the run."""
-    
-    if not(bootIC.userConfirmation):   # Skip user confirmation 
+
+def distributedBootstrapProcedure(bckwdIC, fwdIC, bootIC, yFitIC, bootResults, sampleIdxs,
+    parentWSNCPSavePaths, parentCorrSavePaths):
+    """
+    Publishes replicas in a queue shared with worker processes, started on any node with:
+    python -m vesuvio_analysis.bootstrap_worker <experiment>
+    Main process also runs replicas, waits until all replicas are finished and merges the results.
+    """
+
+    queue = BootQueue(queuePathForBootstrap(bckwdIC, fwdIC, bootIC), bootIC.claimTimeout)
+    queue.publish(sampleIdxs, {"parentWS": parentWSNCPSavePaths, "parentCorr": parentCorrSavePaths})
+    print(f"\nPublished {len(sampleIdxs)} replicas to queue:\n{queue.path}")
+
+    runReplicasFromQueue(queue, bckwdIC, fwdIC, bootIC, yFitIC, waitForAll=True)
+
+    for i, arrays in queue.readShards():
+        for key in bootResults:
+            bootResults[key].bootSamples[i] = arrays[key]
+    saveBootstrapResults(bootResults, bckwdIC, fwdIC)
+    queue.remove()
+    return
+
+
+def runBootstrapWorker(bckwdIC, fwdIC, bootIC, yFitIC):
+    """Runs replicas published by the main process of a distributed Bootstrap."""
+
+    assert bootIC.distributed, "Bootstrap workers need bootIC.distributed set to True."
+
+    queue = BootQueue(queuePathForBootstrap(bckwdIC, fwdIC, bootIC), bootIC.claimTimeout)
+    if not(queue.isPublished()):
+        print(f"\nNo replicas published for this Bootstrap, start main process first:\n{queue.path}")
         return
 
-    tDict = storeRunnningTime(fwdIC, bckwdIC, bootIC)   # Run times file path stores in bootIC
+    setICsToDefault(bckwdIC, fwdIC, yFitIC)
+    runReplicasFromQueue(queue, bckwdIC, fwdIC, bootIC, yFitIC, waitForAll=False)
+    return
 
-    proc = bootIC.procedure
-    runTime = 0
-    if (proc=="BACKWARD") | (proc=="JOINT"):
-        runTime += calcRunTime(bckwdIC, tDict["tBackNoMS"], tDict["tBackPerMS"], bootIC)
 
-    if (proc=="FORWARD") | (proc=="JOINT"):
-        runTime += calcRunTime(fwdIC, tDict["tFowNoMS"], tDict["tFowPerMS"], bootIC)
+class BootstrapWorkerFinished(Exception):
+    """Stops experiment script after worker is finished, so that nothing else runs on the worker."""
+    pass
 
-    userInput = input(f"\n\nEstimated time for Bootstrap procedure: {runTime/60:.1f} hours.\nProceed? (y/n): ")
-    if (userInput == "y") or (userInput == "Y"):
+
+def queuePathForBootstrap(bckwdIC, fwdIC, bootIC):
+    """Queue stored next to the data file of the Bootstrap, same path for main process and workers."""
+    IC = fwdIC if bootIC.procedure=="FORWARD" else bckwdIC
+    return IC.bootSavePath.parent / (IC.bootSavePath.stem + "_queue")
+
+
+def runReplicasFromQueue(queue, bckwdIC, fwdIC, bootIC, yFitIC, waitForAll):
+    """
+    Claims and runs replicas until there are no replicas left to claim.
+    If waitForAll, keeps waiting for replicas claimed by other processes, 
+    to take over claims of workers that stopped.
+    """
+
+    samples, savePaths = queue.readManifest()
+    while True:
+        i = queue.claim()
+
+        if i is None:
+            if not(waitForAll) or queue.allDone():
+                return
+            time.sleep(min(10, queue.claimTimeout))
+            continue
+
+        print(f"\nRunning replica {i} from queue.")
+        queue.runClaimed(i, lambda: runQueuedReplica(queue, i, bckwdIC, fwdIC, bootIC, yFitIC, savePaths))
+
+
+def runQueuedReplica(queue, i, bckwdIC, fwdIC, bootIC, yFitIC, savePaths):
+    """Same steps as a single iteration of bootstrapProcedure, results are written to a shard."""
+
+    AnalysisDataService.clear()
+    closeAllFigures()
+
+    try:
+        sampleInputWS, parentWS = createSampleWS(savePaths["parentWS"], i, bootIC)
+    except JackMaskCol:
+        queue.writeFailed(i)
         return
-    else:
-        raise KeyboardInterrupt ("Bootstrap procedure interrupted.")
+
+    if bootIC.reuseParentCorrections:
+        applyParentCorrections(sampleInputWS, savePaths["parentCorr"])
+
+    formSampleIC(bckwdIC, fwdIC, bootIC, sampleInputWS, parentWS)  
+    try:
+        iterResults = runMainProcedure(bckwdIC, fwdIC, bootIC, yFitIC)
+    except AssertionError:
+        queue.writeFailed(i)
+        return
+
+    queue.writeShard(i, bootIterArrays(iterResults))
+    return
 
 
-def storeRunnningTime(fwdIC, bckwdIC, bootIC):
-    """Used to write run times to txt file."""
+def bootIterArrays(bootIterResults: dict):
+    """Arrays stored for each Bootstrap sample, as in storeBootIter()."""
+    arrays = {}
+    for key, res in bootIterResults.items():
+        if key.endswith("Scat"):
+            arrays[key] = res.all_spec_best_par_chi_nit[-1]
+        else:
+            arrays[key] = res.popt
+    return arrays
 
-    savePath = bootIC.runTimesPath
 
-    if not(savePath.is_file()):
-        with open(savePath, "w") as txtFile:
-            txtFile.write("This file stores run times to estimate Bootstrap total run time.")
-            txtFile.write("\nTime in minutes.\n\n")
-    
-    resDict = {}
-    with open(savePath, "r") as txtFile:
-        for line in txtFile:
-            if line[0]=="{":   # If line contains dictionary
-                resDict = eval(line)
+def initializeMonitor(bootIC):
+    """Returns convergence monitor if early stopping is selected, None otherwise."""
+    if bootIC.earlyStopTolerance is None:
+        return None
+    if bootIC.bootstrapType=="JACKKNIFE":    # Jackknife needs all replicas, stopping early biases the variance
+        print("\nEarly stopping ignored for Jackknife, running all replicas.")
+        return None
+    return BootConvergenceMonitor(bootIC.earlyStopTolerance, bootIC.earlyStopWindow, bootIC.earlyStopCI)
+
+
+class BootConvergenceMonitor:
+    """
+    Tracks running means and stds of bootstrap quantities with online (Welford) updates,
+    and optionally the bounds of the 68% confidence interval.
+    Converged when all tracked statistics change less than the relative tolerance
+    over the last window of replicas.
+    """
+
+    def __init__(self, tolerance, window, trackCI=False):
+        self.tolerance = tolerance
+        self.window = window
+        self.trackCI = trackCI
+        self.n = 0
+        self.mean = None
+        self.M2 = None
+        self.samples = []     # Stored only when tracking confidence intervals
+        self.history = []     # Statistics over last window of replicas
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        if np.any(np.isnan(values)):    # Ignore failed replicas
+            return
+
+        if self.n == 0:
+            self.mean = np.zeros(values.shape)
+            self.M2 = np.zeros(values.shape)
+
+        self.n += 1
+        delta = values - self.mean
+        self.mean += delta / self.n
+        self.M2 += delta * (values - self.mean)
+
+        stats = [self.mean.copy(), np.sqrt(self.M2 / self.n)]
+        if self.trackCI:
+            self.samples.append(values)
+            stats.extend(np.percentile(np.array(self.samples), [16, 68+16], axis=0))
 
-    if len(resDict)<4:
-        ans = input("Did not find necessary information to estimate runtime. Will run a short routine to store an estimate. Please wait until this is finished. Press any key to continue.")
-        resDict = buildRunTimes(fwdIC, bckwdIC)
+        self.history.append(np.concatenate(stats))
+        self.history = self.history[-(self.window+1):]
 
-        with open(savePath, "a") as txtFile:
-            print(resDict, file=txtFile)
+    def converged(self):
+        if (self.n < 2) or (len(self.history) <= self.window):
+            return False
 
-    return resDict
+        current = self.history[-1]
+        scale = np.where(current==0, 1, np.abs(current))    # Absolute change for values at zero
+        relChange = np.abs(np.array(self.history[:-1]) - current) / scale
+        return np.all(relChange < self.tolerance)
 
 
-def buildRunTimes(fwdIC, bckwdIC):
-    resDict = {}
-    for IC, mode in zip([bckwdIC, fwdIC], ["Back", "Fow"]):
-        oriMS = IC.noOfMSIterations
-        for NIter, key in zip([0, 1], ["NoMS", "PerMS"]):
-            IC.noOfMSIterations = NIter
-            t0 = time.time()
-            runIndependentIterativeProcedure(IC)
-            t1 = time.time()
-            resDict["t"+mode+key] = (t1-t0) / 60
-        # Restore starting value
-        IC.noOfMSIterations = oriMS
+def convergenceValues(iterResults: dict):
+    """Mean widths, intensities and y-space fit parameters of one replica, tracked for early stopping."""
 
-        # Correct times of only MS by subtacting time spend on fitting ncps
-        resDict["t"+mode+"PerMS"] -= 2 * resDict["t"+mode+"NoMS"]   
+    values = []
+    for key in ["bckwd", "fwd"]:
+        if key+"Scat" in iterResults:
+            values.append(iterResults[key+"Scat"].all_mean_widths[-1])
+            values.append(iterResults[key+"Scat"].all_mean_intensities[-1])
+        if key+"YFit" in iterResults:
+            values.append(iterResults[key+"YFit"].popt[0, :-1])    # Minuit values, discard chi2
+    return np.concatenate(values)
+
+
+def stopBootstrapEarly(bootResultObjs: dict, nCompleted, bckwdIC, fwdIC, yFitIC, bootIC):
+    """Discards samples not run, saves results and logs the number of completed samples."""
+
+    print(f"\nBootstrap converged after {nCompleted} samples, stopping early.\n")
 
-    return resDict
+    for bootRes in bootResultObjs.values():
+        bootRes.bootSamples = bootRes.bootSamples[:nCompleted]
+    saveBootstrapResults(bootResultObjs, bckwdIC, fwdIC)
 
+    for key, IC in zip(["bckwd", "fwd"], [bckwdIC, fwdIC]):
+        for res, savePath, isYFit in zip(["Scat", "YFit"], [IC.bootSavePath, IC.bootYFitSavePath], [False, True]):
+            if key+res in bootResultObjs:
+                log = IC.bootYFitSavePathLog if isYFit else IC.bootSavePathLog
+                rewriteLogEntry(IC.logFilePath, log, logString(savePath.name, IC, yFitIC, bootIC, isYFit, nCompleted))
+    return
 
-def calcRunTime(IC, tNoMS, tPerMS, bootIC):
-    if bootIC.skipMSIterations:
-        timePerSample = tNoMS
+
+def rewriteLogEntry(logFilePath, oldLog, newLog):
+    """Replaces last entry oldLog of log file with newLog, so that each data file keeps a single entry."""
+
+    with open(logFilePath, "r") as logFile:
+        lines = logFile.read().split("\n")
+
+    idx = max([i for i, line in enumerate(lines) if line == oldLog], default=None)
+    if idx is None:
+        lines.append(newLog)
     else:
-        timePerSample = tNoMS + (IC.noOfMSIterations) * (tNoMS+tPerMS)
+        lines[idx] = newLog
+
+    with atomicWrite(logFilePath) as logFile:
+        logFile.write("\n".join(lines).encode())
+    return
 
-    nSamples = bootIC.nSamples 
-    if bootIC.bootstrapType=="JACKKNIFE":
-        nSamples = 3 if bootIC.runningTest else noOfHistsFromTOFBinning(IC)
 
-    return  nSamples * timePerSample
+def askUserConfirmation(bckwdIC, fwdIC, bootIC):
+    """Estimates running time for all samples and asks the user to confirm the run."""
+    
+    if not(bootIC.userConfirmation):   # Skip user confirmation 
+        return
+
+    runTime = estimateBootstrapRunTime(bckwdIC, fwdIC, bootIC)
+
+    if runTime is None:
+        message = "\n\nNo stored run times found to estimate duration of Bootstrap procedure."
+    else:
+        message = f"\n\nEstimated time for Bootstrap procedure: {runTime/3600:.1f} hours."
+
+    userInput = input(message + "\nProceed? (y/n): ")
+    if (userInput == "y") or (userInput == "Y"):
+        return
+    else:
+        raise KeyboardInterrupt ("Bootstrap procedure interrupted.")
+
+
+def estimateBootstrapRunTime(bckwdIC, fwdIC, bootIC):
+    """
+    Estimates run time in seconds of parent and Bootstrap samples from 
+    run times stored during previous procedures. Returns None if not enough records.
+    """
+
+    parentTimes = []
+    replicasTimes = []
+    for mode, IC in zip(["BACKWARD", "FORWARD"], [bckwdIC, fwdIC]):
+        if not((bootIC.procedure==mode) | (bootIC.procedure=="JOINT")):
+            continue
+
+        isYFit = (bootIC.fitInYSpace==mode) | (bootIC.fitInYSpace=="JOINT")
+        parentTime = estimateRunTime(IC, IC.noOfMSIterations, isYFit)
+
+        if bootIC.skipMSIterations | bootIC.reuseParentCorrections:
+            sampleTime = estimateRunTime(IC, 0, isYFit)
+        else:
+            sampleTime = parentTime
+
+        if (parentTime is None) or (sampleTime is None):
+            return None
+
+        nSamples = bootIC.nSamples 
+        if bootIC.bootstrapType=="JACKKNIFE":
+            nSamples = noOfJackknifeSamples(IC, bootIC)
+        if (bootIC.bootstrapType=="BOOT_FAST_LINEAR") | (bootIC.bootstrapType=="BOOT_YSPACE"):   # Only parent procedure is run
+            nSamples = 0
+
+        parentTimes.append(parentTime)
+        replicasTimes.append(nSamples * sampleTime)
+
+    if (bootIC.bootstrapType=="JACKKNIFE") & (bootIC.procedure=="JOINT"):
+        # Joint parent, then each half runs its own parent and replicas concurrently
+        return sum(parentTimes) + max(p + r for p, r in zip(parentTimes, replicasTimes))
+    return sum(parentTimes) + sum(replicasTimes)
     
 
 def chooseLoopRange(bootIC, nSamples):
@@ -222,7 +555,8 @@ def runOriginalBeforeBootstrap(bckwdIC, fwdIC, bootIC, yFitIC):
 def chooseNSamples(bootIC, parentWSnNCPs: dict):
     """
     Returns number of samples to run.
-    If Jackknife is running, no of samples is the number of bins in the workspace."""
+    If Jackknife is running, no of samples is the number of bins in the workspace,
+    or the number of groups of bins when grouped Jackknife is selected."""
 
     nSamples = bootIC.nSamples
     if bootIC.bootstrapType=="JACKKNIFE":
@@ -231,6 +565,10 @@ def chooseNSamples(bootIC, parentWSnNCPs: dict):
         elif bootIC.procedure=="BACKWARD": key = "bckwdNCP"
 
         nSamples = parentWSnNCPs[key].blocksize()   # Number of cols from ncp workspace, accounts for missing last col or not
+
+        if bootIC.jackknifeGroups is not None:
+            assert bootIC.jackknifeGroups <= nSamples, "Number of Jackknife groups can not be bigger than number of bins."
+            nSamples = bootIC.jackknifeGroups
     return nSamples
 
 
@@ -299,7 +637,9 @@ def selectParentWorkspaces(bckwdIC, fwdIC, bootIC):
 
         if (bootIC.procedure==mode) | (bootIC.procedure=="JOINT"):
 
-            wsIter = str(IC.noOfMSIterations) if bootIC.skipMSIterations else "0"   # In case of skipping MS, select very last corrected ws
+            lastIter = bootIC.skipMSIterations | (bootIC.bootstrapType=="BOOT_FAST_LINEAR")
+            wsIter = str(IC.noOfMSIterations) if lastIter else "0"   # In case of skipping MS, select very last corrected ws
+            # When reusing parent corrections, raw parent ws is selected, corrections are subtracted from each replica
             
             parentWS = mtd[IC.name+wsIter]
             parentNCP = mtd[parentWS.name()+"_TOF_Fitted_Profiles"]
@@ -310,6 +650,32 @@ def selectParentWorkspaces(bckwdIC, fwdIC, bootIC):
     return parentWSnNCPsDict 
 
 
+def selectParentCorrections(bckwdIC, fwdIC, bootIC):
+    """
+    Selects the converged MS and gamma corrections from the parent procedure.
+    These are the workspaces subtracted at the last MS iteration of the parent.
+    Returns empty dict if replicas are not set to reuse parent corrections.
+    """
+    parentCorrDict = {}
+    if not(bootIC.reuseParentCorrections):
+        return parentCorrDict
+
+    for mode, IC, key in zip(["FORWARD", "BACKWARD"], [fwdIC, bckwdIC], ["fwd", "bckwd"]):
+
+        if (bootIC.procedure==mode) | (bootIC.procedure=="JOINT"):
+
+            if IC.noOfMSIterations == 0:    # Parent did not run any corrections
+                continue
+
+            # Corrections are calculated from the ws with masked bins replaced by ncp
+            if IC.MSCorrectionFlag:
+                parentCorrDict[key+"MS"] = mtd[IC.name+"_NCPMasked_MulScattering"]
+            if IC.GammaCorrectionFlag:
+                parentCorrDict[key+"GC"] = mtd[IC.name+"_NCPMasked_Gamma_Background"]
+
+    return parentCorrDict
+
+
 def autoCorrResiduals(parentWSnNCP: dict):
     """
     Calculates the self-correlation of residuals for each spectrum.
@@ -327,11 +693,7 @@ def autoCorrResiduals(parentWSnNCP: dict):
         residuals = dataY - totNcp 
 
         lag = 1     # For lag-plot of self-correlation
-        corr = np.zeros((len(residuals), 2))
-        for i, rowRes in enumerate(residuals):
-            corr[i] = stats.pearsonr(rowRes[:-lag], rowRes[lag:]) 
-
-        corrCoefs[mode+"Scat"] = corr
+        corrCoefs[mode+"Scat"] = residualAutoCorr(residuals, [lag])[:, 0, :]
     return corrCoefs
     
 
@@ -412,14 +774,23 @@ def saveBootstrapLogs(bootResultObjs: dict, bckwdIC, fwdIC):
     return
 
 
-def convertWSToSavePaths(parentWSnNCPs: dict):
+def parentWSDirForBootstrap(bckwdIC, fwdIC, bootIC):
+    """
+    Directory for parent workspaces next to the data file of the Bootstrap, unique to each run,
+    so that runs of different samples or jobs at the same time never share parent workspaces.
+    """
+    IC = fwdIC if bootIC.procedure=="FORWARD" else bckwdIC
+    return IC.bootSavePath.parent / f"{IC.bootSavePath.stem}_parent_ws_{uuid.uuid4().hex[:8]}"
+
+
+def convertWSToSavePaths(parentWSnNCPs: dict, saveDir):
     savePaths = {}
     for key in parentWSnNCPs:
-        savePaths[key] = saveWorkspacesLocally(parentWSnNCPs[key])
+        savePaths[key] = saveWorkspacesLocally(parentWSnNCPs[key], saveDir)
     return savePaths
 
 
-def saveWorkspacesLocally(ws):
+def saveWorkspacesLocally(ws, saveDir):
     keys = ws.name().split("_")
     saveName = "Parent"
 
@@ -430,18 +801,176 @@ def saveWorkspacesLocally(ws):
 
     if "Profiles" in keys:
         saveName += "_NCP"
+
+    if "MulScattering" in keys:
+        saveName += "_MS"
+
+    if "Background" in keys:
+        saveName += "_GC"
     
     saveName += ".nxs"
-    savePath = currentPath / "bootstrap_ws" / saveName
+    saveDir.mkdir(parents=True, exist_ok=True)
+    savePath = saveDir / saveName
     SaveNexus(ws, str(savePath))
     return savePath 
 
 
+def linearBootstrapProcedure(bckwdIC, fwdIC, parentWSnNCPs: dict, bootResults: dict, nSamples):
+    """
+    Fast linearised version of the residual Bootstrap.
+    Replicas are not fitted, instead bootstrap samples of ncp parameters are 
+    calculated from the Jacobian at the parent best fit.
+    """
+    for key, IC in zip(["bckwd", "fwd"], [bckwdIC, fwdIC]):
+
+        if key+"Scat" not in bootResults:
+            continue
+
+        bootScat = bootResults[key+"Scat"]
+        bootScat.bootSamples = linearBootSamples(IC, parentWSnNCPs[key+"WS"], bootScat.parentResult, nSamples)
+    return
+
+
+def ySpaceBootstrapProcedure(bckwdIC, fwdIC, bootIC, yFitIC, bootResults: dict, nSamples):
+    """
+    Bootstrap of the y-space fit only, ncp fit and corrections of the parent are kept fixed.
+    Replicas resample the normalised J(y) of each spectrum of the parent final ws.
+    Only the Minuit row of the stored samples is filled.
+    """
+    for mode, IC, key in zip(["BACKWARD", "FORWARD"], [bckwdIC, fwdIC], ["bckwd", "fwd"]):
+
+        if key+"YFit" not in bootResults:
+            continue
+
+        wsFinal = mtd[buildFinalWSName(IC.scriptName, mode, IC)]
+        samples = ySpaceBootstrap(yFitIC, IC, wsFinal, nSamples, bootIC.ySpaceResampling)
+
+        bootYFit = bootResults[key+"YFit"]
+        bootYFit.bootSamples[:, 0, :samples.shape[1]] = samples
+    return
+
+
+def linearBootSamples(IC, parentWS, parentFitPars, nSamples):
+    """
+    Calculates bootstrap samples of each spectrum from the linearised ncp at the parent best fit.
+    Output has the same format as stored bootstrap samples:
+    shape (nSamples, no of spectra, spec no + fit parameters + chi2 + no of iterations)
+    """
+
+    dataX, dataY, dataE = extractWS(parentWS)
+    if IC.runHistData:     # Same data used in the fit of the parent
+        dataY, dataX, dataE = histToPointData(dataY, dataX, dataE)
+
+    resolutionPars, instrPars, kinematicArrays, ySpacesForEachMass = prepareFitArgs(IC, dataX)
+
+    # Masked spectra keep values of parent
+    bootSamples = np.repeat(parentFitPars[np.newaxis, :, :], nSamples, axis=0)
+
+    for i in range(len(dataY)):
+        bestPars = parentFitPars[i, 1:-2]
+        if np.all(dataY[i]==0) or np.any(np.isnan(bestPars)):
+            continue
+
+        def ncpTotalFun(pars):
+            ncpForEachMass, ncpTotal = calculateNcpSpec(
+                IC, pars, ySpacesForEachMass[i], resolutionPars[i], instrPars[i], kinematicArrays[i]
+                )
+            return ncpTotal
+
+        bootPars, bootChi2 = linearBootSpec(ncpTotalFun, bestPars, dataY[i], dataE[i], IC, nSamples)
+
+        bootSamples[:, i, 1:-2] = bootPars
+        bootSamples[:, i, -2] = bootChi2
+        bootSamples[:, i, -1] = 1         # Single Gauss-Newton step
+        print(f"Linear Bootstrap of spectra {int(parentFitPars[i, 0]):3}")
+
+    return bootSamples
+
+
+def linearBootSpec(ncpTotalFun, bestPars, dataY, dataE, IC, nSamples):
+    """
+    Resamples residuals of a single spectrum and converts each sample into 
+    parameter perturbations with one Gauss-Newton step, all samples at once.
+    Parameters with fixed bounds and equality constraints are kept fixed to first order.
+    """
+
+    # Ignore masked values in the same way as errorFunction
+    zerosMask = (dataY==0)
+    residuals = (dataY - ncpTotalFun(bestPars))[~zerosMask]
+
+    if np.all(dataE==0):   # When errors not present
+        weights = np.ones(residuals.size)
+    else:
+        weights = 1 / np.square(dataE[~zerosMask])
+
+    jac = numericalJacobian(ncpTotalFun, bestPars)[~zerosMask]     # Shape (no of bins, no of pars)
+
+    # Restrict step to parameters free to vary
+    nullSpace = constraintsNullSpace(bestPars, IC)
+    jacFree = jac @ nullSpace
+
+    jacTW = jacFree.T * weights
+    gaussNewton = nullSpace @ np.linalg.pinv(jacTW @ jacFree) @ jacTW    # Shape (no of pars, no of bins)
+
+    rowIdxs = np.random.randint(0, residuals.size, (nSamples, residuals.size))
+    bootRes = residuals[rowIdxs]
+
+    deltaPars = bootRes @ gaussNewton.T
+    lowerBounds = np.where(np.isnan(IC.bounds[:, 0]), -np.inf, IC.bounds[:, 0])
+    upperBounds = np.where(np.isnan(IC.bounds[:, 1]), np.inf, IC.bounds[:, 1])
+    bootPars = np.clip(bestPars + deltaPars, lowerBounds, upperBounds)
+
+    # Residuals of linearised ncp after the step
+    linRes = bootRes - (bootPars - bestPars) @ jac.T
+    noDegreesOfFreedom = len(dataY) - len(bestPars)
+    bootChi2 = np.sum(np.square(linRes) * weights, axis=1) / noDegreesOfFreedom
+    return bootPars, bootChi2
+
+
+def numericalJacobian(fun, pars):
+    """Jacobian of fun at pars from central differences, shape (len(fun(pars)), len(pars))"""
+
+    steps = 1e-6 * np.maximum(np.abs(pars), 1)
+    jac = []
+    for j, h in enumerate(steps):
+        dPars = np.zeros(len(pars))
+        dPars[j] = h
+        jac.append((np.asarray(fun(pars+dPars)) - np.asarray(fun(pars-dPars))) / (2*h))
+    return np.array(jac).reshape(len(pars), -1).T
+
+
+def constraintsNullSpace(pars, IC):
+    """
+    Basis of parameter perturbations that keep fixed parameters and equality 
+    constraints unchanged, linearised at pars. Inequality constraints are ignored.
+    Shape: (no of pars, no of free directions)
+    """
+
+    constrRows = []
+    fixedIdxs = np.flatnonzero(IC.bounds[:, 0] == IC.bounds[:, 1])
+    for idx in fixedIdxs:
+        row = np.zeros((1, len(pars)))
+        row[0, idx] = 1
+        constrRows.append(row)
+
+    for constr in IC.constraints:
+        if constr["type"] == "eq":
+            constrRows.append(numericalJacobian(constr["fun"], pars))
+
+    if len(constrRows) == 0:
+        return np.identity(len(pars))
+
+    constrMatrix = np.vstack(constrRows)
+    u, singVals, vT = np.linalg.svd(constrMatrix)
+    rank = np.sum(singVals > 1e-10 * np.max(singVals))
+    return vT[rank:].T
+
+
 def createSampleWS(parentWSNCPSavePaths: dict, j: int, bootIC):
 
     boot = bootIC.bootstrapType
     if boot=="JACKKNIFE":
-        return createJackknifeWS(parentWSNCPSavePaths, j)
+        return createJackknifeWS(parentWSNCPSavePaths, j, bootIC)
     elif boot=="BOOT_RESIDUALS":
         return createBootstrapWS(parentWSNCPSavePaths)
     elif boot=="BOOT_GAUSS_ERRS":
@@ -510,10 +1039,11 @@ def bootstrapResidualsSample(residuals):
     return bootRes
 
 
-def createJackknifeWS(parentWSNCPSavePaths: list, j: int):
+def createJackknifeWS(parentWSNCPSavePaths: list, j: int, bootIC):
     """
     Creates jackknife ws replicas.
     Inputs: Experimental (parent) workspace and corresponding NCP total fit
+    Masks either the j column or the j group of columns (delete-d Jackknife).
     """
 
     jackInputWS = {}
@@ -533,10 +1063,9 @@ def createJackknifeWS(parentWSNCPSavePaths: list, j: int):
 
         jackDataY = dataY.copy()
 
-        # Skip Jackknife procedure on columns that are already masked
-        if np.all(jackDataY[:, j]==0): raise JackMaskCol
+        maskCols = selectJackknifeCols(jackDataY, totNcpWS.blocksize(), j, bootIC)
 
-        jackDataY[:, j] = 0   # Masks j collumn with zeros
+        jackDataY[:, maskCols] = 0   # Masks j collumn or group of columns with zeros
         # DataE is not masked intentionally, to preserve errors that are used in the normalization of averaged NaN profile
         
         wsJack = CloneWorkspace(parentWS, OutputWorkspace=parentWS.name()+"_Jackknife")
@@ -551,6 +1080,33 @@ def createJackknifeWS(parentWSNCPSavePaths: list, j: int):
     return jackInputWS, parentInputWS
 
 
+def selectJackknifeCols(dataY, nCols, j, bootIC):
+    """
+    Returns idxs of columns to mask in j Jackknife replica.
+    Default deletes the single j column.
+    When jackknifeGroups is set, the unmasked columns among the first nCols
+    (ncp fit ignores last column or not) are split into groups, either contiguous
+    blocks or strided, and the j group is deleted.
+    """
+
+    if bootIC.jackknifeGroups is None:
+        # Skip Jackknife procedure on columns that are already masked
+        if np.all(dataY[:, j]==0): raise JackMaskCol
+        return np.array([j])
+
+    validCols = np.flatnonzero(~np.all(dataY[:, :nCols]==0, axis=0))
+    nGroups = bootIC.jackknifeGroups
+    assert nGroups <= len(validCols), "Number of Jackknife groups can not be bigger than number of unmasked bins."
+
+    if bootIC.jackknifeGroupMode=="CONTIGUOUS":
+        groups = np.array_split(validCols, nGroups)
+    elif bootIC.jackknifeGroupMode=="STRIDED":
+        groups = [validCols[i::nGroups] for i in range(nGroups)]
+    else:
+        raise ValueError("jackknifeGroupMode not recognized. Options: 'CONTIGUOUS', 'STRIDED'")
+    return groups[j]
+
+
 class JackMaskCol(Exception):
     """
     Custom exception used only to flag and skip a Jackknife iteration
@@ -559,6 +1115,39 @@ class JackMaskCol(Exception):
     pass
 
 
+def applyParentCorrections(sampleInputWS: dict, parentCorrSavePaths: dict):
+    """Subtracts the stored parent MS and gamma corrections from each sample ws."""
+
+    for key in ["bckwd", "fwd"]:
+        if key+"WS" not in sampleInputWS:
+            continue
+
+        corrPaths = [parentCorrSavePaths[key+corr] for corr in ["MS", "GC"] if key+corr in parentCorrSavePaths]
+        corrWSList = loadWorkspacesFromPath(*corrPaths)
+        sampleInputWS[key+"WS"] = subtractParentCorrections(sampleInputWS[key+"WS"], corrWSList)
+    return
+
+
+def subtractParentCorrections(wsSample, corrWSList):
+    """
+    Subtracts corrections from the sample ws in the same way as the MS iterations.
+    Keeps masked columns and absence of errors of the sample ws.
+    """
+    maskCols = np.all(wsSample.extractY()==0, axis=0)
+    noErrors = np.all(wsSample.extractE()==0)
+
+    for corrWS in corrWSList:
+        wsSample = Minus(LHSWorkspace=wsSample, RHSWorkspace=corrWS, OutputWorkspace=wsSample.name())
+
+    dataY = wsSample.extractY()
+    dataY[:, maskCols] = 0
+    for i, row in enumerate(dataY):
+        wsSample.dataY(i)[:] = row
+        if noErrors:
+            wsSample.dataE(i)[:] = np.zeros(wsSample.readE(i).size)
+    return wsSample
+
+
 def loadWorkspacesFromPath(*savePaths):
     wsList = []
     for path in savePaths:
@@ -578,7 +1167,7 @@ def formSampleIC(bckwdIC, fwdIC, bootIC, sampleInputWS:dict, parentWS:dict):
         if (bootIC.procedure==mode) | (bootIC.procedure=="JOINT"):
             IC.runningSampleWS = True
 
-            if bootIC.skipMSIterations: 
+            if bootIC.skipMSIterations | bootIC.reuseParentCorrections: 
                 IC.noOfMSIterations = 0
 
             IC.sampleWS = sampleInputWS[key+"WS"]
@@ -1,13 +1,16 @@
 
 from os import execv
 from xml.dom import NotFoundErr
-from vesuvio_analysis.core_functions.analysis_functions import calculateMeansAndStds, filterWidthsAndIntensities
-from vesuvio_analysis.core_functions.ICHelpers import setBootstrapDirs
+from vesuvio_analysis.core_functions.analysis_functions import calculateMeansAndStds, calculateMeansAndStdsBatch, filterWidthsAndIntensitiesBatch
+from vesuvio_analysis.core_functions.ICHelpers import setBootstrapDirs, setBootICDefaults, setAnalysisICDefaults
 from vesuvio_analysis.core_functions.fit_in_yspace import selectModelAndPars
+from vesuvio_analysis.core_functions.plotting import pyplot
 import numpy as np
-import matplotlib .pyplot as plt
 from pathlib import Path
 from scipy import stats
+import tempfile
+import zipfile
+import struct
 
 currentPath = Path(__file__).parent.absolute() 
 experimentsPath = currentPath / ".." / ".. " / "experiments"
@@ -19,43 +22,33 @@ def runAnalysisOfStoredBootstrap(bckwdIC, fwdIC, yFitIC, bootIC, analysisIC, use
     if not(analysisIC.runAnalysis):
         return
 
+    setBootICDefaults(bootIC)
+    setAnalysisICDefaults(analysisIC)
     setBootstrapDirs(bckwdIC, fwdIC, bootIC, yFitIC)   # Same function used to store data, to check below if dirs exist
 
     for IC in [bckwdIC, fwdIC]:
 
-        if not(IC.bootSavePath.is_file()):
-            print("Bootstrap data files not found, unable to run analysis!")
-            print(f"{IC.bootSavePath.name}")
-            continue    # If main results are not present, assume ysapce results are also missing
-        
-        checkLogMatch(IC, isYFitFile=False)
-
-        bootParsRaw, parentParsRaw, nSamples, corrResiduals = readBootData(IC.bootSavePath)
-        checkResiduals(corrResiduals)
-        checkBootSamplesVSParent(bootParsRaw, parentParsRaw, IC)    # Prints comparison
+        if bootIC.bootstrapType!="BOOT_YSPACE":     # Y-space Bootstrap stores no ncp samples
 
-        bootPars = bootParsRaw.copy()      # By default do not filter means, copy to avoid accidental changes
-        if analysisIC.filterAvg:
-            bootPars = filteredBootMeans(bootParsRaw.copy(), IC)
-            try:
-                print("\nCompare filtered parameters with parent:\n")
-                checkBootSamplesVSParent(bootPars, parentParsRaw, IC)    # Prints comparison
-            except AssertionError:
-                print("\nUnable to calculate new means of filtered parameters.\n")
+            if not(IC.bootSavePath.is_file()):
+                print("Bootstrap data files not found, unable to run analysis!")
+                print(f"{IC.bootSavePath.name}")
+                continue    # If main results are not present, assume ysapce results are also missing
             
-        
-        # Plots histograms of all spectra for a given width or intensity
-        plotRawWidthsAndIntensities(analysisIC, IC, bootPars, parentParsRaw)
-        
-        # Calculate bootstrap histograms for mean widths and intensities 
-        meanWidths, meanIntensities = calculateMeanWidthsIntensities(bootPars, IC, nSamples)
+            checkLogMatch(IC, isYFitFile=False)
 
-        # If filer is on, check that it matches original procedure
-        checkMeansProcedure(analysisIC, IC, meanWidths, meanIntensities, bootParsRaw)
+            if analysisIC.streamSamples:
+                meanWidths, meanIntensities, parentParsRaw = streamedAnalysisOfBootData(analysisIC, IC)
+            else:
+                meanWidths, meanIntensities, parentParsRaw = analysisOfBootData(analysisIC, IC)
 
-        plotMeanWidthsAndIntensities(analysisIC, IC, meanWidths, meanIntensities, parentParsRaw)
-        plotMeansEvolution(analysisIC, meanWidths, meanIntensities)
-        plot2DHistsWidthsAndIntensities(analysisIC, meanWidths, meanIntensities)
+            if bootIC.bootstrapType=="JACKKNIFE":
+                meanWidths = rescaleJackknifeSamples(meanWidths, "Mean Widths")
+                meanIntensities = rescaleJackknifeSamples(meanIntensities, "Mean Intensities")
+
+            plotMeanWidthsAndIntensities(analysisIC, IC, meanWidths, meanIntensities, parentParsRaw)
+            plotMeansEvolution(analysisIC, meanWidths, meanIntensities)
+            plot2DHistsWidthsAndIntensities(analysisIC, meanWidths, meanIntensities)
 
 
         if not(IC.bootYFitSavePath.is_file()):
@@ -67,11 +60,96 @@ def runAnalysisOfStoredBootstrap(bckwdIC, fwdIC, yFitIC, bootIC, analysisIC, use
 
         minuitFitVals = readYFitData(IC.bootYFitSavePath, yFitIC)
 
+        if bootIC.bootstrapType=="JACKKNIFE":
+            minuitFitVals = rescaleJackknifeSamples(minuitFitVals, "Y-space Fit Parameters")
+
         plotMeansEvolutionYFit(analysisIC, minuitFitVals)
         plotYFitHists(analysisIC, yFitIC, minuitFitVals)
         plot2DHistsYFit(analysisIC, minuitFitVals)
 
 
+def analysisOfBootData(analysisIC, IC):
+    """Loads all Bootstrap samples into memory and calculates mean widths and intensities of each sample."""
+
+    bootParsRaw, parentParsRaw, nSamples, corrResiduals = readBootData(IC.bootSavePath)
+    checkResiduals(corrResiduals)
+    checkBootSamplesVSParent(bootParsRaw, parentParsRaw, IC)    # Prints comparison
+
+    bootPars = bootParsRaw.copy()      # By default do not filter means, copy to avoid accidental changes
+    if analysisIC.filterAvg:
+        bootPars = filteredBootMeans(bootParsRaw.copy(), IC)
+        try:
+            print("\nCompare filtered parameters with parent:\n")
+            checkBootSamplesVSParent(bootPars, parentParsRaw, IC)    # Prints comparison
+        except AssertionError:
+            print("\nUnable to calculate new means of filtered parameters.\n")
+        
+    
+    # Plots histograms of all spectra for a given width or intensity
+    plotRawWidthsAndIntensities(analysisIC, IC, bootPars, parentParsRaw)
+    
+    # Calculate bootstrap histograms for mean widths and intensities 
+    meanWidths, meanIntensities = calculateMeanWidthsIntensities(bootPars, IC, nSamples)
+
+    # If filer is on, check that it matches original procedure
+    checkMeansProcedure(analysisIC, IC, meanWidths, meanIntensities, bootParsRaw)
+    return meanWidths, meanIntensities, parentParsRaw
+
+
+def streamedAnalysisOfBootData(analysisIC, IC):
+    """
+    Same outputs as analysisOfBootData(), but Bootstrap samples are memory mapped and 
+    processed in chunks of samples, so only arrays with size of the number of samples 
+    are kept in memory. Means over samples are accumulated with an online estimator.
+    """
+
+    bootParsRaw, parentParsRaw, goodIdxs, corrResiduals = readBootDataMemmap(IC.bootSavePath)
+    checkResiduals(corrResiduals)
+
+    rawMeans = OnlineMean()
+    filteredMeans = OnlineMean()
+    meanWidths = []
+    meanIntensities = []
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+
+        # Samples used for raw histograms are written to disk to keep memory usage low
+        if analysisIC.plotRawWidthsIntensities:
+            bootPars = np.lib.format.open_memmap(
+                Path(tmpDir) / "boot_pars.npy", mode="w+", dtype=float, shape=(len(goodIdxs), *bootParsRaw.shape[1:])
+                )
+
+        for start, chunkRaw in iterBootChunks(bootParsRaw, goodIdxs, analysisIC.chunkSize):
+            rawMeans.update(chunkRaw)
+
+            chunk = chunkRaw.copy()      # By default do not filter means, copy to avoid accidental changes
+            if analysisIC.filterAvg:
+                chunk = filteredBootMeans(chunkRaw.copy(), IC)
+                filteredMeans.update(chunk)
+
+            chunkWidths, chunkIntensities = calculateMeanWidthsIntensities(chunk, IC, len(chunk))
+            checkMeansProcedure(analysisIC, IC, chunkWidths, chunkIntensities, chunkRaw)
+
+            meanWidths.append(chunkWidths)
+            meanIntensities.append(chunkIntensities)
+            if analysisIC.plotRawWidthsIntensities:
+                bootPars[start : start+len(chunk)] = chunk
+
+        compareBootMeansWithParent(rawMeans.mean, parentParsRaw, IC)    # Prints comparison
+        if analysisIC.filterAvg:
+            try:
+                print("\nCompare filtered parameters with parent:\n")
+                compareBootMeansWithParent(filteredMeans.mean, parentParsRaw, IC)    # Prints comparison
+            except AssertionError:
+                print("\nUnable to calculate new means of filtered parameters.\n")
+
+        if analysisIC.plotRawWidthsIntensities:
+            plotRawWidthsAndIntensities(analysisIC, IC, bootPars, parentParsRaw)
+            del bootPars     # Close memory map before temporary file is removed
+
+    return np.concatenate(meanWidths, axis=1), np.concatenate(meanIntensities, axis=1), parentParsRaw
+
+
 def checkLogMatch(IC, isYFitFile):
     """Checks if currently selected data file matches stored logs."""
     currentLog = IC.bootYFitSavePathLog if isYFitFile else IC.bootSavePathLog
@@ -119,6 +197,84 @@ def readBootData(dataPath):
         return bootParsRaw, parentParsRaw, nSamples, corrResiduals
 
 
+def readBootDataMemmap(dataPath):
+    """
+    Memory maps Bootstrap samples instead of loading them.
+    Failed samples are not discarded, instead the indices of good samples are returned.
+    """
+
+    bootData = np.load(dataPath)
+    parentParsRaw = bootData["parent_result"][:, 1:-2]
+    try:
+        corrResiduals = bootData["corr_residuals"]
+    except KeyError:
+        corrResiduals = np.array([np.nan]) 
+        print("\nCorrelation of coefficients not found!\n")
+
+    bootParsRaw = memmapNpzArray(dataPath, "boot_samples")[:, :, 1:-2]
+
+    allIdxs = np.arange(len(bootParsRaw))
+    failMask = np.zeros(len(bootParsRaw), dtype=bool)
+    maskedSpec = np.ones(bootParsRaw.shape[1], dtype=bool)
+    for start, chunk in iterBootChunks(bootParsRaw, allIdxs, 1000):
+        failMask[start : start+len(chunk)] = np.all(np.isnan(chunk), axis=(1, 2))
+        maskedSpec &= np.all(np.isnan(chunk), axis=(0, 2))
+
+    goodIdxs = allIdxs[~failMask]
+    if np.sum(failMask) > 0:
+        print(f"\nNo of failed samples: {np.sum(failMask)}")
+        print("\nUsing only good replicas ...\n")
+
+    print(f"Masked idxs with nans found: {np.where(maskedSpec)}")
+    print(f"\nData files found:\n{dataPath.name}")
+    print(f"\nNumber of samples in the file: {len(goodIdxs)}")
+    assert ~np.all(bootParsRaw[goodIdxs[-1]] == parentParsRaw), "Error in Jackknife due to last column."
+    return bootParsRaw, parentParsRaw, goodIdxs, corrResiduals
+
+
+def memmapNpzArray(npzPath, key):
+    """Memory maps an array stored without compression in a npz file, as written by np.savez()."""
+
+    with zipfile.ZipFile(npzPath) as zipFile:
+        info = zipFile.getinfo(key+".npy")
+    assert info.compress_type == zipfile.ZIP_STORED, f"Unable to memory map {key}, array is compressed."
+
+    with open(npzPath, "rb") as file:
+        # Local file header: 30 bytes followed by file name and extra field
+        file.seek(info.header_offset)
+        nameLength, extraLength = struct.unpack("<HH", file.read(30)[26:30])
+        file.seek(info.header_offset + 30 + nameLength + extraLength)
+
+        version = np.lib.format.read_magic(file)
+        if version == (1, 0):
+            shape, fortranOrder, dtype = np.lib.format.read_array_header_1_0(file)
+        else:
+            shape, fortranOrder, dtype = np.lib.format.read_array_header_2_0(file)
+        offset = file.tell()
+
+    return np.memmap(npzPath, dtype=dtype, mode="r", shape=shape, order="F" if fortranOrder else "C", offset=offset)
+
+
+def iterBootChunks(bootPars, sampleIdxs, chunkSize):
+    """Yields start position and in memory copy of consecutive chunks of the selected samples."""
+    for start in range(0, len(sampleIdxs), chunkSize):
+        yield start, np.array(bootPars[sampleIdxs[start : start+chunkSize]])
+
+
+class OnlineMean:
+    """Mean over first axis of arrays passed in chunks, updated as in Welford's algorithm."""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = None
+
+    def update(self, chunk):
+        if self.mean is None:
+            self.mean = np.zeros(chunk.shape[1:])
+        self.n += len(chunk)
+        self.mean = self.mean + (np.mean(chunk, axis=0) - self.mean) * len(chunk) / self.n
+
+
 def readYFitData(dataPath, yFitIC):
         """Resulting output has shape(no of pars, no of samples)"""
 
@@ -162,11 +318,14 @@ def checkBootSamplesVSParent(bestPars, parentPars, IC):
     the mean of the experimental sample (here called parent).
     """
 
-    bootWidths = bestPars[:, :, 1::3]
-    bootIntensities = bestPars[:, :, 0::3]
+    compareBootMeansWithParent(np.mean(bestPars, axis=0), parentPars, IC)
+
+
+def compareBootMeansWithParent(meanBootPars, parentPars, IC):
+    """Prints comparison of the means over Bootstrap samples, shape (No of spectra, No of pars), with parent."""
 
-    meanBootWidths = np.mean(bootWidths, axis=0)
-    meanBootIntensities = np.mean(bootIntensities, axis=0)
+    meanBootWidths = meanBootPars[:, 1::3]
+    meanBootIntensities = meanBootPars[:, 0::3]
 
     avgWidths, stdWidths, avgInt, stdInt = calculateMeansAndStds(meanBootWidths.T, meanBootIntensities.T, IC)
 
@@ -191,21 +350,17 @@ def printResults(arrM, arrE, mode):
 def filteredBootMeans(bestPars, IC):  # Pass IC just to check flag for preliminary procedure
     """Use same filtering function used on original procedure"""
 
-    # Extract Widths and Intensities from bootstrap samples
-    bootWidths = bestPars[:, :, 1::3]
-    bootIntensities = bestPars[:, :, 0::3]
+    # Extract Widths and Intensities from bootstrap samples, shape (noOfSamples, noOfMasses, noOfSpec)
+    bootWidths = np.transpose(bestPars[:, :, 1::3], (0, 2, 1))
+    bootIntensities = np.transpose(bestPars[:, :, 0::3], (0, 2, 1))
 
-    # Perform the filter
-    for i, (widths, intensities) in enumerate(zip(bootWidths, bootIntensities)):
-        filteredWidths, filteredIntensities = filterWidthsAndIntensities(widths.T, intensities.T, IC)
-        
-        bootWidths[i] = filteredWidths.T
-        bootIntensities[i] = filteredIntensities.T
+    # Perform the filter on all samples at once
+    filteredWidths, filteredIntensities = filterWidthsAndIntensitiesBatch(bootWidths, bootIntensities, IC)
     
     # Convert back to format of bootstrap samples
     filteredBestPars = bestPars.copy()
-    filteredBestPars[:, :, 1::3] = bootWidths
-    filteredBestPars[:, :, 0::3] = bootIntensities
+    filteredBestPars[:, :, 1::3] = np.transpose(filteredWidths, (0, 2, 1))
+    filteredBestPars[:, :, 0::3] = np.transpose(filteredIntensities, (0, 2, 1))
     return filteredBestPars
 
 
@@ -221,6 +376,7 @@ def plotRawWidthsAndIntensities(analysisIC, IC, bootPars, parentPars):
     parentWidths, parentIntensities = extractParentMeans(parentPars, IC)
     noOfMasses = len(parentWidths)
 
+    plt = pyplot()
     fig, axs = plt.subplots(2, noOfMasses)
 
     for axIdx, startIdx, kind, parentMeans in zip([0, 1], [1, 0], ["Width", "Intensity"], [parentWidths, parentIntensities]):
@@ -247,22 +403,13 @@ def extractParentMeans(parentPars, IC):
 def calcMeansWithOriginalProc(bestPars, IC):
     """Performs the means and std on each bootstrap sample according to original procedure"""
     
-    bootWidths = bestPars[:, :, 1::3]
-    bootIntensities = bestPars[:, :, 0::3]
-
-    bootMeanW = np.zeros((len(bootWidths[0,0,:]), len(bootWidths)))
-    bootStdW = np.zeros(bootMeanW.shape)
-    bootMeanI = np.zeros(bootMeanW.shape)
-    bootStdI = np.zeros(bootMeanW.shape)
+    bootWidths = np.transpose(bestPars[:, :, 1::3], (0, 2, 1))
+    bootIntensities = np.transpose(bestPars[:, :, 0::3], (0, 2, 1))
 
-    for j, (widths, intensities) in enumerate(zip(bootWidths, bootIntensities)):
+    meanW, stdW, meanI, stdI = calculateMeansAndStdsBatch(bootWidths, bootIntensities, IC)
 
-        meanW, stdW, meanI, stdI = calculateMeansAndStds(widths.T, intensities.T, IC)
-
-        bootMeanW[:, j] = meanW       # Interested only in the means 
-        bootMeanI[:, j] = meanI
-
-    return bootMeanW, bootMeanI
+    # Interested only in the means, shape (noOfMasses, noOfSamples)
+    return meanW.T, meanI.T
 
 
 def calculateMeanWidthsIntensities(bootPars, IC, nSamples):
@@ -298,6 +445,26 @@ def checkMeansProcedure(analysisIC, IC, meanWidths, meanIntensities, bootParsRaw
         return
        
 
+def rescaleJackknifeSamples(samples, mode):
+    """
+    Spreads Jackknife replicas to match the Jackknife variance estimator.
+    For g replicas, each deleting one bin or one group of bins (delete-d Jackknife),
+    var = (g-1)/g * sum((samples - mean)**2), so the deviations from the mean are
+    scaled by sqrt(g-1) and histograms and percentiles can be used as for Bootstrap.
+    Replicas with nan, from masked detectors or failed fits, are not counted in g of each parameter.
+    Samples shape: (No of parameters, No of replicas)
+    """
+
+    nReplicas = np.sum(np.isfinite(samples), axis=1)[:, np.newaxis]
+    assert np.all(nReplicas > 1), "Jackknife variance needs more than one replica."
+
+    means = np.nanmean(samples, axis=1)[:, np.newaxis]
+    rescaledSamples = means + np.sqrt(nReplicas-1) * (samples - means)
+
+    printResults(means.flatten(), np.nanstd(rescaledSamples, axis=1), "Jackknife "+mode)
+    return rescaledSamples
+
+
 def plotMeanWidthsAndIntensities(analysisIC, IC, meanWidths, meanIntensities, parentParsRaw):
     """
     Most informative histograms, shows all mean widhts and intensities of Bootstrap samples
@@ -311,6 +478,7 @@ def plotMeanWidthsAndIntensities(analysisIC, IC, meanWidths, meanIntensities, pa
 
     print("\n\n Test passed! Mean Widths match!")
 
+    plt = pyplot()
     fig, axs = plt.subplots(2, 1)
     axs[0].set_title("Histograms of mean Widths")
     axs[1].set_title("Histograms of mean Intensitiess")
@@ -330,6 +498,7 @@ def plotMeansEvolution(IC, meanWidths, meanIntensities):
     if not(IC.plotMeansEvolution):
         return
 
+    plt = pyplot()
     fig, axs = plt.subplots(2, 2)
     axs[0, 0].set_title("Evolution of mean Widths")
     plotMeansOverNoSamples(axs[0, 0], meanWidths)
@@ -353,6 +522,7 @@ def plotMeansEvolutionYFit(analysisIC, minuitFitVals):
     if not(analysisIC.plotMeansEvolution):
         return
     
+    plt = pyplot()
     fig, ax = plt.subplots(2, 1)
     ax[0].set_title("Evolution of y-space fit parameters")
     plotMeansOverNoSamples(ax[0], minuitFitVals)
@@ -420,6 +590,7 @@ def plot2DHists(bootSamples, mode):
     """bootSamples has histogram rows for each parameter"""
 
     plotSize = len(bootSamples)
+    plt = pyplot()
     fig, axs = plt.subplots(plotSize, plotSize, tight_layout=True)
 
     for i in range(plotSize):
@@ -479,6 +650,7 @@ def plotYFitHists(analysisIC, yFitIC, yFitHists):
         return
 
     # Plot each parameter in an individual histogram
+    plt = pyplot()
     fig, axs = plt.subplots(2, int(np.ceil(len(yFitHists)/2)), figsize=(12, 7), tight_layout=True)
 
     # To label each histogram, extract signature of function used for the fit
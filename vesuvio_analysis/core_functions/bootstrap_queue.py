@@ -0,0 +1,159 @@
+"""
+Directory based queue to share Bootstrap replicas between worker processes,
+possibly running on different nodes, with a shared directory as the only common resource.
+Replicas are claimed by atomic creation of claim files and results are written as shards,
+one per replica, which are merged by the main process at the end.
+"""
+
+import numpy as np
+import threading
+import shutil
+import socket
+import json
+import time
+import uuid
+import os
+from pathlib import Path
+
+
+class BootQueue:
+
+    def __init__(self, queuePath, claimTimeout):
+        self.path = Path(queuePath)
+        self.claimTimeout = claimTimeout     # Seconds after which a claim without heartbeat is stale
+        self.manifestPath = self.path / "manifest.json"
+        self.claimsPath = self.path / "claims"
+        self.shardsPath = self.path / "shards"
+
+    def publish(self, sampleIdxs, savePaths: dict):
+        """Creates new queue with replica indices and paths of parent workspaces needed to form replicas."""
+
+        if self.path.is_dir():     # Discard queue from previous run
+            shutil.rmtree(self.path)
+        self.claimsPath.mkdir(parents=True)
+        self.shardsPath.mkdir()
+
+        manifest = {
+            "samples": [int(i) for i in sampleIdxs],
+            "savePaths": {group: {key: str(path) for key, path in paths.items()} for group, paths in savePaths.items()}
+            }
+        # Manifest written last, workers only start once it is present
+        with atomicWrite(self.manifestPath) as file:
+            file.write(json.dumps(manifest).encode())
+
+    def isPublished(self):
+        return self.manifestPath.is_file()
+
+    def readManifest(self):
+        with open(self.manifestPath, "r") as file:
+            manifest = json.load(file)
+        savePaths = {group: {key: Path(path) for key, path in paths.items()} for group, paths in manifest["savePaths"].items()}
+        return manifest["samples"], savePaths
+
+    def claimPath(self, i):
+        return self.claimsPath / f"{i}.claim"
+
+    def shardPath(self, i):
+        return self.shardsPath / f"{i}.npz"
+
+    def failedPath(self, i):
+        return self.shardsPath / f"{i}.failed"
+
+    def isDone(self, i):
+        return self.shardPath(i).is_file() or self.failedPath(i).is_file()
+
+    def allDone(self):
+        samples, savePaths = self.readManifest()
+        return all(self.isDone(i) for i in samples)
+
+    def claim(self):
+        """Returns index of the replica claimed by this process, None if there are no replicas left to claim."""
+
+        samples, savePaths = self.readManifest()
+        for i in samples:
+            if self.isDone(i):
+                continue
+            if self.createClaim(i):
+                return i
+            if self.releaseIfStale(i) and self.createClaim(i):
+                return i
+        return None
+
+    def createClaim(self, i):
+        """Atomic, only one process succeeds in creating the claim file."""
+        try:
+            fd = os.open(self.claimPath(i), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w") as file:
+            file.write(f"{socket.gethostname()} {os.getpid()} {time.time()}")
+        return True
+
+    def releaseIfStale(self, i):
+        """Removes claim whose owner stopped refreshing it. Rename is atomic, only one process releases it."""
+        try:
+            if time.time() - os.path.getmtime(self.claimPath(i)) < self.claimTimeout:
+                return False
+            os.rename(self.claimPath(i), self.claimsPath / f"{i}.stale.{uuid.uuid4().hex}")
+        except FileNotFoundError:     # Released by another process
+            return False
+        print(f"\nReleased stale claim of replica {i}.")
+        return True
+
+    def runClaimed(self, i, fun):
+        """Runs fun while refreshing the claim of replica i, so that it is not taken as stale."""
+
+        stop = threading.Event()
+        def heartbeat():
+            while not(stop.wait(self.claimTimeout / 4)):
+                try:
+                    os.utime(self.claimPath(i))
+                except FileNotFoundError:
+                    return
+
+        thread = threading.Thread(target=heartbeat, daemon=True)
+        thread.start()
+        try:
+            return fun()
+        finally:
+            stop.set()
+            thread.join()
+
+    def writeShard(self, i, arrays: dict):
+        with atomicWrite(self.shardPath(i)) as file:
+            np.savez(file, **arrays)
+
+    def writeFailed(self, i):
+        with atomicWrite(self.failedPath(i)) as file:
+            file.write(b"")
+
+    def readShards(self):
+        """Yields index and arrays of each replica that finished successfully."""
+        samples, savePaths = self.readManifest()
+        for i in samples:
+            if self.shardPath(i).is_file():
+                with np.load(self.shardPath(i)) as shard:
+                    yield i, {key: shard[key] for key in shard.files}
+
+    def remove(self):
+        shutil.rmtree(self.path)
+
+
+class atomicWrite:
+    """Writes to temporary file in the same directory and renames it on success, so that readers never see partial files."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.tmpPath = self.path.with_name(f".{self.path.name}.{uuid.uuid4().hex}.tmp")
+
+    def __enter__(self):
+        self.file = open(self.tmpPath, "wb")
+        return self.file
+
+    def __exit__(self, excType, excValue, traceback):
+        self.file.close()
+        if excType is None:
+            os.replace(self.tmpPath, self.path)
+        else:
+            os.remove(self.tmpPath)
+        return False
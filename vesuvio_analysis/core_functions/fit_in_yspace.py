@@ -1,29 +1,55 @@
 from dataclasses import replace
-import matplotlib.pyplot as plt
 import numpy as np
-from mantid.simpleapi import *
+from . import mantidOptional
+try:
+    from mantid.simpleapi import *
+except ImportError:
+    if not(mantidOptional):     # Only benchmarks of the numerical kernels run without Mantid
+        raise
 from scipy import optimize
-from scipy import  signal
 from pathlib import Path
-from iminuit import Minuit, cost, util
-from iminuit.util import make_func_code, describe
-import jacobi
 import time
+from .run_times import storeRunTime
+from .profiling import profiled
+from .plotting import pyplot, figuresEnabled, submitFigure, newFigure
+from .workspace_manager import registerIntermediate, release
 
 repoPath = Path(__file__).absolute().parent  # Path to the repository
 
 
+@profiled("y_fit")
 def fitInYSpaceProcedure(yFitIC, IC, wsTOF):
 
+    t0 = time.time()
+    wsJoY, wsJoYAvg, wsRes, wsResSum = reduceToYSpace(yFitIC, IC, wsTOF)
+
+    yfitResults = fitYSpace(yFitIC, IC, wsTOF, wsJoYAvg, wsResSum)
+    
+    if yFitIC.globalFit:
+        runGlobalFit(wsJoY, wsRes, IC, yFitIC) 
+
+    storeRunTime(IC, "y_fit", time.time()-t0, wsTOF.getNumberHistograms(), wsTOF.blocksize())
+    return yfitResults
+
+
+def reduceToYSpace(yFitIC, IC, wsTOF):
+    """J(y) of the first mass for each spectrum and averaged, and resolution of each spectrum and summed."""
+
     ncpForEachMass = extractNCPFromWorkspaces(wsTOF, IC)
     wsResSum, wsRes = calculateMantidResolutionFirstMass(IC, yFitIC, wsTOF)
 
     wsTOFMass0 = subtractAllMassesExceptFirst(IC, wsTOF, ncpForEachMass)
     
     wsJoY, wsJoYAvg = ySpaceReduction(wsTOFMass0, IC.masses[0], yFitIC, ncpForEachMass[:, 0, :])
+    release("y_reduction")
     
     if yFitIC.symmetrisationFlag:
         wsJoYAvg = symmetrizeWs(wsJoYAvg)
+    return wsJoY, wsJoYAvg, wsRes, wsResSum
+
+
+def fitYSpace(yFitIC, IC, wsTOF, wsJoYAvg, wsResSum):
+    """Fits averaged J(y) with Minuit and Mantid Fit, results are saved to ySpaceFitSavePath."""
 
     fitProfileMinuit(yFitIC, wsJoYAvg, wsResSum)
     fitProfileMantidFit(yFitIC, wsJoYAvg, wsResSum)
@@ -32,10 +58,6 @@ def fitInYSpaceProcedure(yFitIC, IC, wsTOF):
 
     yfitResults = ResultsYFitObject(IC, yFitIC, wsTOF.name(), wsJoYAvg.name())
     yfitResults.save()
-    
-    if yFitIC.globalFit:
-        runGlobalFit(wsJoY, wsRes, IC, yFitIC) 
-        
     return yfitResults
 
 
@@ -133,6 +155,7 @@ def ySpaceReduction(wsTOF, mass0, yFitIC, ncp):
             wsTOFNCP = replaceZerosWithNCP(wsTOF, ncp)
             wsJoYNCP = convertToYSpace(wsTOFNCP, mass0)
             wsJoYNCPN, wsJoYInt = rebinAndNorm(wsJoYNCP, rebinPars)
+            registerIntermediate("y_reduction", wsJoY.name(), wsJoYB.name(), wsTOFNCP.name(), wsTOFNCP.name()+"_Sum", wsJoYNCPN.name())
 
             # Normalize spectra of specieal workspace
             wsJoYN = Divide(wsJoYB, wsJoYInt, OutputWorkspace=wsJoYB.name()+"_Normalised")
@@ -154,6 +177,7 @@ def ySpaceReduction(wsTOF, mass0, yFitIC, ncp):
     return wsJoYN, wsJoYAvg
 
 
+@profiled("y_conversion")
 def convertToYSpace(wsTOF, mass0):
     wsJoY = ConvertToYSpace(wsTOF, Mass=mass0, OutputWorkspace=wsTOF.name()+"_JoY")
     return wsJoY
@@ -163,6 +187,7 @@ def rebinAndNorm(wsJoY, rebinPars):
     wsJoYR = Rebin(InputWorkspace=wsJoY, Params=rebinPars, FullBinsOnly=True, OutputWorkspace=wsJoY.name()+"_Rebinned")
     wsJoYInt = Integration(wsJoYR, OutputWorkspace=wsJoYR.name()+"_Integrated")
     wsJoYNorm = Divide(wsJoYR, wsJoYInt, OutputWorkspace=wsJoYR.name()+"_Normalised")
+    registerIntermediate("y_reduction", wsJoY.name(), wsJoYR.name(), wsJoYInt.name())
     return wsJoYNorm, wsJoYInt
 
 
@@ -225,6 +250,7 @@ def dataXBining(ws, xp):
     return wsXBins
 
 
+@profiled("averaging")
 def weightedAvgXBins(wsXBins, xp):
     """Weighted average on ws where dataY points are grouped per dataX bin centers."""
     dataX, dataY, dataE = extractWS(wsXBins)
@@ -279,16 +305,22 @@ def weightedAvgXBinsArr(dataX, dataY, dataE, xp):
     return meansY, meansE
 
 
+@profiled("averaging")
 def weightedAvgCols(wsYSpace):
     """Returns ws with weighted avg of columns of input ws"""
     dataX, dataY, dataE = extractWS(wsYSpace)
+    meanY, meanE = weightedAvgColsArr(dataY, dataE)
+    wsYSpaceAvg = CreateWorkspace(DataX=dataX[0, :], DataY=meanY, DataE=meanE, NSpec=1, OutputWorkspace=wsYSpace.name()+"_WeightedAvg")
+    return wsYSpaceAvg
+
+
+def weightedAvgColsArr(dataY, dataE):
     if np.all(dataE==0):      # Bootstrap case where errors are not used
         meanY = avgArr(dataY)
         meanE = np.zeros(meanY.shape)
     else:
         meanY, meanE = weightedAvgArr(dataY, dataE)
-    wsYSpaceAvg = CreateWorkspace(DataX=dataX[0, :], DataY=meanY, DataE=meanE, NSpec=1, OutputWorkspace=wsYSpace.name()+"_WeightedAvg")
-    return wsYSpaceAvg
+    return meanY, meanE
 
 
 def avgArr(dataYO):
@@ -365,6 +397,7 @@ def passDataIntoWS(dataX, dataY, dataE, ws):
     return ws
 
 
+@profiled("symmetrisation")
 def symmetrizeWs(avgYSpace):
     """
     Symmetrizes workspace after weighted average.
@@ -372,16 +405,20 @@ def symmetrizeWs(avgYSpace):
     """
 
     dataX, dataY, dataE = extractWS(avgYSpace)
-    
+    dataYS, dataES = symmetrizeArr(dataY, dataE)
+
+    wsSym = CloneWorkspace(avgYSpace, OutputWorkspace=avgYSpace.name()+"_Symmetrised")
+    wsSym = passDataIntoWS(dataX, dataYS, dataES, wsSym)
+    return wsSym
+
+
+def symmetrizeArr(dataY, dataE):
     if np.all(dataE==0):
         dataYS = symArr(dataY)
         dataES = np.zeros(dataYS.shape)
     else:
         dataYS, dataES = weightedSymArr(dataY, dataE)
-
-    wsSym = CloneWorkspace(avgYSpace, OutputWorkspace=avgYSpace.name()+"_Symmetrised")
-    wsSym = passDataIntoWS(dataX, dataYS, dataES, wsSym)
-    return wsSym
+    return dataYS, dataES
 
 
 def symArr(dataYO):
@@ -446,12 +483,51 @@ def weightedSymArr(dataYO, dataEO):
 
 
 def fitProfileMinuit(yFitIC, wsYSpaceSym, wsRes):
+    import jacobi
 
     dataX, dataY, dataE = extractFirstSpectra(wsYSpaceSym)
     resX, resY, resE = extractFirstSpectra(wsRes)
-    assert np.all(dataX==resX), "Resolution should operate on the same range as DataX"
 
     model, defaultPars, sharedPars = selectModelAndPars(yFitIC.fitModel)
+    m, chi2, convolvedModel, constrFunc = fitProfileMinuitArr(yFitIC, dataX, dataY, dataE, resX, resY, model, defaultPars)
+
+    # Best fit and confidence band
+    # Calculated for the whole range of dataX, including where zero
+    dataYFit, dataYCov = jacobi.propagate(lambda pars: convolvedModel(dataX, *pars), m.values, m.covariance)
+    dataYSigma = np.sqrt(np.diag(dataYCov))
+    dataYSigma *= chi2        # Weight the confidence band
+    Residuals = dataY - dataYFit
+
+    # Create workspace to store best fit curve and errors on the fit
+    wsMinFit = createFitResultsWorkspace(wsYSpaceSym, dataX, dataY, dataE, dataYFit, dataYSigma, Residuals)
+    saveMinuitPlot(yFitIC, wsMinFit, m)
+
+    # Calculate correlation matrix
+    corrMatrix = m.covariance.correlation()
+    corrMatrix *= 100
+
+    # Create correlation tableWorkspace
+    createCorrelationTableWorkspace(wsYSpaceSym, m.parameters, corrMatrix)
+
+    # Run Minos
+    fitCols = runMinos(m, yFitIC, constrFunc, wsYSpaceSym.name())
+
+    # Create workspace with final fitting parameters and their errors
+    createFitParametersTableWorkspace(wsYSpaceSym, *fitCols, chi2)
+    return 
+
+
+@profiled("minuit")
+def fitProfileMinuitArr(yFitIC, dataX, dataY, dataE, resX, resY, model, defaultPars):
+    """
+    Minuit fit of the model convolved with resolution, on arrays of a single spectrum.
+    model and defaultPars are selected by the caller, once for all replicas of a Bootstrap.
+    """
+    from iminuit import Minuit, cost
+    from iminuit.util import make_func_code, describe
+    from scipy import signal
+
+    assert np.all(dataX==resX), "Resolution should operate on the same range as DataX"
 
     xDelta, resDense = oddPointsRes(resX, resY)
     def convolvedModel(x, y0, *pars):
@@ -461,7 +537,7 @@ def fitProfileMinuit(yFitIC, wsYSpaceSym, wsRes):
     signature[1:1] = ["y0"]     # Add intercept as first fitting parameter after range 'x'
 
     convolvedModel.func_code = make_func_code(signature)    
-    defaultPars["y0"] = 0    # Add initialization of parameter to dictionary
+    defaultPars = {**defaultPars, "y0": 0}    # Add initialization of parameter, without changing pars of caller
 
     # Fit only valid values, ignore cut-offs 
     dataXNZ, dataYNZ, dataENZ = selectNonZeros(dataX, dataY, dataE)
@@ -497,31 +573,7 @@ def fitProfileMinuit(yFitIC, wsYSpaceSym, wsRes):
 
     # Weighted Chi2
     chi2 = m.fval / (len(dataXNZ)-m.nfit)
-
-    # Best fit and confidence band
-    # Calculated for the whole range of dataX, including where zero
-    dataYFit, dataYCov = jacobi.propagate(lambda pars: convolvedModel(dataX, *pars), m.values, m.covariance)
-    dataYSigma = np.sqrt(np.diag(dataYCov))
-    dataYSigma *= chi2        # Weight the confidence band
-    Residuals = dataY - dataYFit
-
-    # Create workspace to store best fit curve and errors on the fit
-    wsMinFit = createFitResultsWorkspace(wsYSpaceSym, dataX, dataY, dataE, dataYFit, dataYSigma, Residuals)
-    saveMinuitPlot(yFitIC, wsMinFit, m)
-
-    # Calculate correlation matrix
-    corrMatrix = m.covariance.correlation()
-    corrMatrix *= 100
-
-    # Create correlation tableWorkspace
-    createCorrelationTableWorkspace(wsYSpaceSym, m.parameters, corrMatrix)
-
-    # Run Minos
-    fitCols = runMinos(m, yFitIC, constrFunc, wsYSpaceSym.name())
-
-    # Create workspace with final fitting parameters and their errors
-    createFitParametersTableWorkspace(wsYSpaceSym, *fitCols, chi2)
-    return 
+    return m, chi2, convolvedModel, constrFunc
 
 
 def extractFirstSpectra(ws):
@@ -647,6 +699,7 @@ def selectModelAndPars(modelFlag):
     print("\nShared Parameters: ", [key for key in sharedPars])
     print("\nUnshared Parameters: ", [key for key in defaultPars if key not in sharedPars])
     
+    from iminuit.util import describe
     assert all(isinstance(item, str) for item in sharedPars), "Parameters in list must be strings."
     assert describe(model)[-len(sharedPars):]==sharedPars, "Function signature needs to have shared parameters at the end: model(*unsharedPars, *sharedPars)"
     
@@ -672,9 +725,10 @@ class MyLeastSquares:
     This structure is required for high compatibility with Minuit. 
     """
 
-    errordef = Minuit.LEAST_SQUARES # for Minuit to compute errors correctly
+    errordef = 1.0   # Minuit.LEAST_SQUARES, for Minuit to compute errors correctly
     
     def __init__(self, x, y, model):
+        from iminuit.util import make_func_code, describe
         self.model = model  # model predicts y for given x
         self.x = np.asarray(x)
         self.y = np.asarray(y)
@@ -703,22 +757,31 @@ def createFitResultsWorkspace(wsYSpaceSym, dataX, dataY, dataE, dataYFit, dataYS
 def saveMinuitPlot(yFitIC, wsMinuitFit, mObj):
     """Saves figure with Minuit Fit."""
 
+    if not(figuresEnabled()):
+        return
+
     leg = ""
     for p, v, e in zip(mObj.parameters, mObj.values, mObj.errors):
         leg += f"${p}={v:.2f} \pm {e:.2f}$\n"
 
-    fig, ax = plt.subplots(subplot_kw={"projection":"mantid"})
-    ax.errorbar(wsMinuitFit, "k.", wkspIndex=0, label="Weighted Avg")
-    ax.errorbar(wsMinuitFit, "r-", wkspIndex=1, label=leg)
+    dataX, dataY, dataE = extractWS(wsMinuitFit)
+    savePath = yFitIC.figSavePath / (wsMinuitFit.name()+".pdf")
+    submitFigure(renderMinuitFit, savePath, dataX[:2], dataY[:2], dataE[:2], leg)
+    return
+
+
+def renderMinuitFit(savePath, dataX, dataY, dataE, leg):
+    """First row is the weighted average, second row is the best fit with its confidence band."""
+
+    fig, ax = newFigure()
+    ax.errorbar(dataX[0], dataY[0], dataE[0], fmt="k.", label="Weighted Avg")
+    ax.errorbar(dataX[1], dataY[1], dataE[1], fmt="r-", label=leg)
     ax.set_xlabel("YSpace")
     ax.set_ylabel("Counts")
     ax.set_title("Minuit Fit")
     ax.legend()
 
-    fileName = wsMinuitFit.name()+".pdf"
-    savePath = yFitIC.figSavePath / fileName
-    plt.savefig(savePath, bbox_inches="tight")
-    plt.close(fig)
+    fig.savefig(savePath, bbox_inches="tight")
     return
 
 
@@ -732,6 +795,7 @@ def createCorrelationTableWorkspace(wsYSpaceSym, parameters, corrMatrix):
         tableWS.addRow([p] + list(arr))
  
 
+@profiled("minos")
 def runMinos(mObj, yFitIC, constrFunc, wsName):
     """Outputs columns to be displayed in a table workspace"""
 
@@ -762,7 +826,7 @@ def runMinos(mObj, yFitIC, constrFunc, wsName):
             minosAutoErr.append([me[p].lower, me[p].upper])
         minosManErr = list(np.zeros(np.array(minosAutoErr).shape))
 
-        if yFitIC.showPlots:
+        if yFitIC.showPlots & figuresEnabled():
             plotAutoMinos(mObj, wsName)
 
     else:   # Case with positivity constraint on function, use manual implementation
@@ -774,7 +838,7 @@ def runMinos(mObj, yFitIC, constrFunc, wsName):
             minosManErr.append(merrors[p])
         minosAutoErr = list(np.zeros(np.array(minosManErr).shape))
 
-        if yFitIC.showPlots:
+        if yFitIC.showPlots & figuresEnabled():
             fig.canvas.setWindowTitle(wsName+"_Manual_Implementation_MINOS")
             fig.show()
 
@@ -783,27 +847,37 @@ def runMinos(mObj, yFitIC, constrFunc, wsName):
 
 def runAndPlotManualMinos(minuitObj, constrFunc, bestFitVals, bestFitErrs, showPlots):
     """
-    Runs brute implementation of minos algorithm and
-    plots the profile for each parameter along the way.
+    Runs brute implementation of minos algorithm for each parameter.
+    Profiles are kept as arrays and plotted once all parameters are done, only if shown.
     """
-    # Reason for two distinct operations inside the same function is that its easier
-    # to build the minos plots for each parameter as they are being calculated.
     print("\nRunning Minos ... \n")
 
+    merrors = {}
+    profiles = {}
+    for p in minuitObj.parameters:
+        profiles[p] = runMinosForPar(minuitObj, constrFunc, p, 2, bestFitVals, bestFitErrs)
+        merrors[p] = np.array([profiles[p]["lerr"], profiles[p]["uerr"]])
+
+    fig = None
+    if showPlots & figuresEnabled():
+        fig = plotManualMinos(profiles)
+    return merrors, fig
+
+
+def plotManualMinos(profiles):
     # Set format of subplots
     height = 2
-    width = int(np.ceil(len(minuitObj.parameters)/2))
+    width = int(np.ceil(len(profiles)/2))
     figsize = (12, 7)
     # Output plot to Mantid
-    fig, axs = plt.subplots(height, width, tight_layout=True, figsize=figsize, subplot_kw={'projection':'mantid'})  #subplot_kw={'projection':'mantid'}
-    # fig.canvas.setWindowTitle("Plot of Manual Implementation MINOS")
+    fig, axs = pyplot().subplots(height, width, tight_layout=True, figsize=figsize, subplot_kw={'projection':'mantid'})
 
-    merrors = {}
-    for p, ax in zip(minuitObj.parameters, axs.flat):
-        lerr, uerr = runMinosForPar(minuitObj, constrFunc, p, 2, ax, bestFitVals, bestFitErrs, showPlots)
-        merrors[p] = np.array([lerr, uerr])
+    for (var, prof), ax in zip(profiles.items(), axs.flat):
+        ax.plot(prof["varSpace"], prof["fValsScipy"], label="fVals Constr Scipy")
+        # Plot migrad as well to see the difference between constrained and unconstrained
+        plotProfile(ax, var, prof["varSpace"], prof["fValsMigrad"], prof["lerr"], prof["uerr"], 
+            prof["fValsMin"], prof["varVal"], prof["varErr"])
 
-    # if showPlots:
     # Hide plots not in use:
     for ax in axs.flat:
         if not ax.lines:   # If empty list
@@ -812,11 +886,11 @@ def runAndPlotManualMinos(minuitObj, constrFunc, bestFitVals, bestFitErrs, showP
     # ALl axes share same legend, so set figure legend to first axis
     handle, label = axs[0, 0].get_legend_handles_labels()
     fig.legend(handle, label, loc='lower right')
-        # fig.show()
-    return merrors, fig
+    return fig
 
 
-def runMinosForPar(minuitObj, constrFunc, var:str, bound:int, ax, bestFitVals, bestFitErrs, showPlots):
+def runMinosForPar(minuitObj, constrFunc, var:str, bound:int, bestFitVals, bestFitErrs):
+    """Profile of the cost function for constrained Scipy and unconstrained Migrad, and Minos errors from Scipy."""
 
     resetMinuit(minuitObj, bestFitVals, bestFitErrs)
     # Run Fitting procedures again to be on the safe side and reset to minimum
@@ -835,6 +909,7 @@ def runMinosForPar(minuitObj, constrFunc, var:str, bound:int, ax, bestFitVals, b
     lhsVarSpace, rhsVarSpace = np.split(varSpace, 2)
     lhsVarSpace = np.flip(lhsVarSpace)   # Flip to start at minimum
 
+    profile = {"varSpace": varSpace, "fValsMin": fValsMin, "varVal": varVal, "varErr": varErr}
     for minimizer in ("Scipy", "Migrad"):
         resetMinuit(minuitObj, bestFitVals, bestFitErrs)
         rhsMinos = runMinosOnRange(minuitObj, var, rhsVarSpace, minimizer, constrFunc)
@@ -843,18 +918,13 @@ def runMinosForPar(minuitObj, constrFunc, var:str, bound:int, ax, bestFitVals, b
         lhsMinos = runMinosOnRange(minuitObj, var, lhsVarSpace, minimizer, constrFunc)
 
         wholeMinos = np.concatenate((np.flip(lhsMinos), rhsMinos), axis=None)   # Flip left hand side again
+        profile["fVals"+minimizer] = wholeMinos
 
-        if minimizer == "Scipy":   # Calculate minos errors from constrained scipy
-            lerr, uerr = errsFromMinosCurve(varSpace, varVal, wholeMinos, fValsMin, dChi2=1)
-            ax.plot(varSpace, wholeMinos, label="fVals Constr Scipy")
-
-        elif minimizer == "Migrad":   # Plot migrad as well to see the difference between constrained and unconstrained
-            plotProfile(ax, var, varSpace, wholeMinos, lerr, uerr, fValsMin, varVal, varErr)
-        else:
-            raise ValueError("Minimizer not recognized.")
+    # Calculate minos errors from constrained scipy
+    profile["lerr"], profile["uerr"] = errsFromMinosCurve(varSpace, varVal, profile["fValsScipy"], fValsMin, dChi2=1)
 
     resetMinuit(minuitObj, bestFitVals, bestFitErrs)
-    return lerr, uerr
+    return profile
 
 
 def resetMinuit(minuitObj, bestFitVals, bestFitErrs):
@@ -920,7 +990,7 @@ def plotAutoMinos(minuitObj, wsName):
     width = int(np.ceil(len(minuitObj.parameters)/2))
     figsize = (12, 7)
     # Output plot to Mantid
-    fig, axs = plt.subplots(height, width, tight_layout=True, figsize=figsize, subplot_kw={'projection':'mantid'})
+    fig, axs = pyplot().subplots(height, width, tight_layout=True, figsize=figsize, subplot_kw={'projection':'mantid'})
     # fig.canvas.setWindowTitle(wsName+"_Plot_Automatic_MINOS")
     fig.canvas.setWindowTitle(wsName+"_Plot_Automatic_MINOS")
  
@@ -1004,6 +1074,7 @@ def oddPointsRes(x, res):
     return xDelta, resDense
 
 
+@profiled("mantid_fit")
 def fitProfileMantidFit(yFitIC, wsYSpaceSym, wsRes):
     print('\nFitting on the sum of spectra in the West domain ...\n')     
     for minimizer in ['Levenberg-Marquardt','Simplex']:
@@ -1148,7 +1219,92 @@ class ResultsYFitObject:
                  perr=self.perr)
 
 
+def ySpaceBootstrap(yFitIC, IC, wsTOF, nSamples, resampleMode):
+    """
+    Bootstrap of y-space fit parameters only, without TOF replicas.
+    Reduction to normalised J(y) of each spectrum is done once. Each replica resamples
+    these rows, either whole spectra or residuals to the averaged J(y) within each spectrum,
+    and reruns only the averaging, symmetrisation and Minuit fit, all in memory.
+    Needs resolution workspaces from the y-space fit of wsTOF.
+    Output shape: (nSamples, noOfPars+1), same as Minuit row of popt, with last column chi2.
+    """
+
+    assert (resampleMode=="SPECTRA") | (resampleMode=="RESIDUALS"), "Resampling of J(y) not recognized. Options: 'SPECTRA', 'RESIDUALS'"
+
+    ncpForEachMass = extractNCPFromWorkspaces(wsTOF, IC)
+    wsResSum = mtd[wsTOF.name()+"_Resolution_Sum"]
+    wsTOFMass0 = subtractAllMassesExceptFirst(IC, wsTOF, ncpForEachMass)
+    wsJoYN, wsJoYAvg = ySpaceReduction(wsTOFMass0, IC.masses[0], yFitIC, ncpForEachMass[:, 0, :])
+    release("y_reduction")
+
+    dataX, dataY, dataE = extractWS(wsJoYN)
+    xp, meanY, meanE = extractFirstSpectra(wsJoYAvg)
+    resX, resY, resE = extractFirstSpectra(wsResSum)
+
+    # Each dataY point may correspond to any of the bin centers xp when masked TOF bins are set to NAN
+    isXBinned = np.any(np.all(wsTOFMass0.extractY()==0, axis=0)) & (yFitIC.maskTypeProcedure=="NAN")
+    meanAtPoints = meanYAtPoints(dataX, meanY, xp, isXBinned)
+    model, defaultPars, sharedPars = selectModelAndPars(yFitIC.fitModel)
+
+    bootSamples = []
+    for j in range(nSamples):
+        bootX, bootY, bootE = resampleJoYRows(dataX, dataY, dataE, meanAtPoints, resampleMode)
+
+        if isXBinned:
+            avgY, avgE = weightedAvgXBinsArr(bootX, bootY, bootE, xp)
+        else:
+            avgY, avgE = weightedAvgColsArr(bootY, bootE)
+
+        avgY, avgE = avgY[np.newaxis, :], avgE[np.newaxis, :]
+        if yFitIC.symmetrisationFlag:
+            avgY, avgE = symmetrizeArr(avgY, avgE)
+
+        m, chi2, convolvedModel, constrFunc = fitProfileMinuitArr(yFitIC, xp, avgY[0], avgE[0], resX, resY, model, defaultPars)
+        bootSamples.append(list(m.values) + [chi2])
+
+        if (j+1) % 100 == 0:
+            print(f"Y-space Bootstrap replicas: {j+1}/{nSamples}")
+    return np.array(bootSamples)
+
+
+def meanYAtPoints(dataX, meanY, xp, isXBinned):
+    """Value of averaged J(y) at each point of the normalised J(y) of each spectrum."""
+
+    if not(isXBinned):
+        return np.broadcast_to(meanY, dataX.shape)
+
+    step = xp[1] - xp[0]
+    validX = ~np.isnan(dataX)
+    idxs = np.rint((dataX[validX] - xp[0]) / step).astype(int)
+
+    meanAtPoints = np.zeros(dataX.shape)
+    meanAtPoints[validX] = meanY[idxs]
+    return meanAtPoints
+
+
+def resampleJoYRows(dataX, dataY, dataE, meanAtPoints, resampleMode):
+    """Forms replica of normalised J(y) of each spectrum, masked points are left unchanged."""
+
+    if resampleMode=="SPECTRA":
+        rowIdxs = np.random.randint(0, len(dataY), len(dataY))    # [low, high)
+        return dataX[rowIdxs], dataY[rowIdxs], dataE[rowIdxs]
+
+    # Resample residuals to averaged J(y) within each spectrum (same statistical weight)
+    bootY = dataY.copy()
+    validPoints = (dataY!=0) & ~np.isnan(dataX)
+    for i, valid in enumerate(validPoints):
+        if not(np.any(valid)):     # Masked spectrum
+            continue
+        residuals = dataY[i, valid] - meanAtPoints[i, valid]
+        pointIdxs = np.random.randint(0, len(residuals), len(residuals))
+        bootY[i, valid] = meanAtPoints[i, valid] + residuals[pointIdxs]
+    return dataX, bootY, dataE
+
+
+@profiled("global_fit")
 def runGlobalFit(wsYSpace, wsRes, IC, yFitIC):
+    from iminuit import Minuit
+    from iminuit.util import describe
 
     print("\nRunning GLobal Fit ...\n")
 
@@ -1231,7 +1387,7 @@ def runGlobalFit(wsYSpace, wsRes, IC, yFitIC):
         print(f"{p:>7s} = {v:>8.4f} \u00B1 {e:<8.4f}")
     print("\n")
 
-    if yFitIC.showPlots:
+    if yFitIC.showPlots & figuresEnabled():
         plotGlobalFit(dataX, dataY, dataE, m, totCost, wsYSpace.name())
     
     return np.array(m.values), np.array(m.errors)     # Pass into array to store values in variable
@@ -1298,8 +1454,8 @@ def groupDetectors(ipData, yFitIC):
     clusters = kMeansClustering(points, centers)
     idxList = formIdxList(clusters)
 
-    if yFitIC.showPlots:
-        fig, ax = plt.subplots(tight_layout=True, subplot_kw={'projection':'mantid'})  
+    if yFitIC.showPlots & figuresEnabled():
+        fig, ax = pyplot().subplots(tight_layout=True, subplot_kw={'projection':'mantid'})  
         fig.canvas.setWindowTitle("Grouping of detectors")
         plotFinalGroups(ax, ipData, idxList)
         fig.show()
@@ -1405,7 +1561,7 @@ def formIdxList(clusters):
 
 def plotDetsAndInitialCenters(L1, theta, centers):
     """Used in debugging."""
-    fig, ax = plt.subplots(tight_layout=True, subplot_kw={'projection':'mantid'})  
+    fig, ax = pyplot().subplots(tight_layout=True, subplot_kw={'projection':'mantid'})  
     fig.canvas.setWindowTitle("Starting centroids for groupings")
     ax.scatter(L1, theta, alpha=0.3, color="r", label="Detectors")
     ax.scatter(centers[:, 0], centers[:, 1], color="k", label="Starting centroids")
@@ -1523,6 +1679,9 @@ def extractArrByIdx(dataX, dataY, dataE, dataRes, idxs):
 
 def calcCostFun(model, i, x, y, yerr, res, sharedPars):
     "Returns cost function for one spectrum i to be summed to total cost function"
+    from iminuit import cost
+    from iminuit.util import make_func_code, describe
+    from scipy import signal
    
     xDelta, resDense = oddPointsRes(x, res)
     def convolvedModel(xrange, y0, *pars):
@@ -1561,13 +1720,14 @@ def minuitInitialParameters(defaultPars, sharedPars, nSpec):
 
 
 def plotGlobalFit(dataX, dataY, dataE, mObj, totCost, wsName):
+    from iminuit.util import describe
 
     if len(dataY) > 10:    
         print("\nToo many axes to show in figure, skipping the plot ...\n")
         return
 
     rows = 2
-    fig, axs = plt.subplots(
+    fig, axs = pyplot().subplots(
         rows, 
         int(np.ceil(len(dataY)/rows)),
         figsize=(15, 8), 
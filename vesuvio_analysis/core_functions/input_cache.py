@@ -0,0 +1,101 @@
+"""
+Cache of the preprocessed input data, after rebinning, scaling and subtraction of the empty run.
+Arrays are stored as .npy files next to the input workspaces and loaded memory-mapped,
+together with a one bin template workspace holding the instrument and spectra of the data.
+Entries are keyed by the contents of raw and empty files and by the preprocessing options,
+so that any change of inputs results in a new entry.
+"""
+
+from contextlib import contextmanager
+import numpy as np
+import hashlib
+import shutil
+import errno
+import json
+import uuid
+import os
+
+hashChunkSize = 2**20
+fileHashes = {}     # Hashes already calculated in this process, keyed by path, size and modification time
+
+
+def fileHash(path):
+    stat = os.stat(path)
+    key = (str(path), stat.st_size, stat.st_mtime_ns)
+    if key not in fileHashes:
+        sha = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(hashChunkSize), b""):
+                sha.update(chunk)
+        fileHashes[key] = sha.hexdigest()
+    return fileHashes[key]
+
+
+def cacheInputs(ic):
+    """Everything that changes the preprocessed data."""
+
+    inputs = {
+        "raw": fileHash(ic.userWsRawPath),
+        "tofBinning": ic.tofBinning,
+        "scaleRaw": ic.scaleRaw,
+        "subEmptyFromRaw": ic.subEmptyFromRaw
+        }
+    if ic.subEmptyFromRaw:
+        inputs["empty"] = fileHash(ic.userWsEmptyPath)
+        inputs["scaleEmpty"] = ic.scaleEmpty
+    return inputs
+
+
+def cacheEntryPath(ic):
+    key = hashlib.sha256(json.dumps(cacheInputs(ic), sort_keys=True).encode()).hexdigest()[:16]
+    return ic.inputCachePath / key
+
+
+def loadCachedInput(ic):
+    """Returns memory-mapped arrays, metadata and path of template workspace, or None if not cached."""
+
+    entryPath = cacheEntryPath(ic)
+    if not((entryPath / "meta.json").is_file()):     # Written last, entry is complete when present
+        return None
+
+    with open(entryPath / "meta.json", "r") as metaFile:
+        meta = json.load(metaFile)
+    arrays = [np.load(entryPath / f"{name}.npy", mmap_mode="r") for name in ["dataX", "dataY", "dataE", "specNumbers"]]
+    return arrays, meta, entryPath / "template.nxs"
+
+
+def storeCachedInput(ic, dataX, dataY, dataE, specNumbers, meta: dict, saveTemplate):
+    """Writes entry to a temporary directory first, moved into place when complete."""
+
+    entryPath = cacheEntryPath(ic)
+    if entryPath.is_dir():
+        return
+
+    with atomicDir(entryPath) as tmpPath:
+        for name, arr in zip(["dataX", "dataY", "dataE", "specNumbers"], [dataX, dataY, dataE, specNumbers]):
+            np.save(tmpPath / f"{name}.npy", arr)
+        saveTemplate(tmpPath / "template.nxs")
+        with open(tmpPath / "meta.json", "w") as metaFile:
+            json.dump({**meta, "inputs": cacheInputs(ic)}, metaFile)
+    return
+
+
+@contextmanager
+def atomicDir(entryPath):
+    """
+    Temporary directory to write an entry into, moved to entryPath once complete and removed on errors.
+    If another process stored the same entry in the meantime, the stored entry is kept.
+    """
+
+    tmpPath = entryPath.with_name(f".{entryPath.name}.{uuid.uuid4().hex}.tmp")
+    tmpPath.mkdir(parents=True)
+    try:
+        yield tmpPath
+        try:
+            os.rename(tmpPath, entryPath)
+        except OSError as error:
+            if not(isinstance(error, FileExistsError) or (error.errno == errno.ENOTEMPTY)):
+                raise       # Disk full, permissions, ...
+    finally:
+        if tmpPath.is_dir():
+            shutil.rmtree(tmpPath)
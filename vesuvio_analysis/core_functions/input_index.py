@@ -0,0 +1,100 @@
+"""
+Index of the input workspaces stored for each sample, in input_ws/index.json.
+Maps the hash of each LoadVesuvio configuration to its directory and keeps a version counter
+for each running mode, so that directories are resolved without scanning the input_ws tree.
+Reads and updates of the index are done under a file lock, safe with several processes.
+"""
+
+from vesuvio_analysis.core_functions.bootstrap_queue import atomicWrite
+from contextlib import contextmanager
+import hashlib
+import json
+try:
+    import fcntl
+except ImportError:     # Windows
+    fcntl = None
+    import msvcrt
+
+
+@contextmanager
+def fileLock(lockPath):
+    """Exclusive lock held while inside the context, blocks until available."""
+
+    with open(lockPath, "a+") as lockFile:
+        if fcntl is not None:
+            fcntl.flock(lockFile, fcntl.LOCK_EX)
+        else:
+            lockFile.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lockFile.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:     # Gives up after about 10 s, keep waiting
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lockFile, fcntl.LOCK_UN)
+            else:
+                lockFile.seek(0)
+                msvcrt.locking(lockFile.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def configHash(loadWSDict: dict):
+    return hashlib.sha256(json.dumps(loadWSDict, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def readIndex(inputWSPath):
+    """Reads the index, built from the stored directories and written when missing. Called under the index lock."""
+
+    indexPath = inputWSPath / "index.json"
+    if not(indexPath.is_file()):
+        index = buildIndexFromDirs(inputWSPath)
+        writeIndex(inputWSPath, index)
+        return index
+    with open(indexPath, "r") as indexFile:
+        return json.load(indexFile)
+
+
+def writeIndex(inputWSPath, index):
+    with atomicWrite(inputWSPath / "index.json") as indexFile:
+        indexFile.write(json.dumps(index, indent=1).encode())
+
+
+def buildIndexFromDirs(inputWSPath):
+    """Index of directories stored before the index file was introduced, scanned only once."""
+
+    index = {"versions": {}, "entries": {}}
+    for mode in ["backward", "forward"]:
+        versionNums = [float(dir.name.split('_')[-1]) for dir in inputWSPath.glob(f'{mode}_*/') if dir.is_dir()]
+        index["versions"][mode] = max(versionNums, default=0.0)
+
+        for filePath in inputWSPath.rglob('*' + mode + '.json'):
+            with open(filePath, "r") as jsonFile:
+                storedDict = json.load(jsonFile)
+            index["entries"][configHash(storedDict)] = {"dir": str(filePath.parent.relative_to(inputWSPath)), "mode": mode}
+    return index
+
+
+def resolveInputWSDir(inputWSPath, runningMode, loadWSDict: dict):
+    """
+    Directory of input workspaces with matching LoadVesuvio inputs.
+    If none is registered, a new version directory is registered and returned.
+    """
+
+    key = configHash(loadWSDict)
+    with fileLock(inputWSPath / "index.lock"):
+        index = readIndex(inputWSPath)
+
+        if key in index["entries"]:
+            wsDir = inputWSPath / index["entries"][key]["dir"]
+            print(f"\nFound {runningMode} workspaces with matching inputs in: {wsDir.name}")
+            return wsDir
+
+        version = index["versions"].get(runningMode, 0.0) + 1
+        newDirName = runningMode + '_' + str(version)
+        index["versions"][runningMode] = version
+        index["entries"][key] = {"dir": newDirName, "mode": runningMode}
+        writeIndex(inputWSPath, index)
+    return inputWSPath / newDirName
@@ -0,0 +1,115 @@
+"""
+Lazy import of matplotlib, loaded when the first figure is made instead of when the procedures are imported.
+In headless mode, selected with headless = True in UserScriptControls, no figures are created,
+so batch jobs and bootstrap workers never load matplotlib.
+
+Figures saved to file are rendered in the background from plain arrays, while the procedures continue.
+A single worker thread draws them with the object oriented API of matplotlib, without pyplot,
+and flushFigures() waits for all of them at the end of the run.
+Other processes, like the Jackknife halves, render their figures in place.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import sys
+import os
+
+headless = False
+styleApplied = False
+figureQueue = None
+queuePid = None
+pendingFigures = []
+
+
+def applyStyle():
+    """Style used in all figures of the procedures."""
+    global styleApplied
+
+    if not(styleApplied):
+        import matplotlib.style
+        matplotlib.style.use("ggplot")
+        styleApplied = True
+
+
+def pyplot():
+    """matplotlib.pyplot, for interactive figures."""
+    import matplotlib.pyplot as plt
+    applyStyle()
+    return plt
+
+
+def newFigure(**kwargs):
+    """Figure and axes detached from pyplot, safe to draw outside the main thread."""
+    from matplotlib.figure import Figure
+    applyStyle()
+    fig = Figure(**kwargs)
+    return fig, fig.subplots()
+
+
+def pointsX(dataX, dataY):
+    """Centers of bins for histogram data, unchanged for point data."""
+    if len(dataX) == len(dataY) + 1:
+        return (dataX[1:] + dataX[:-1]) / 2
+    return dataX
+
+
+def figuresEnabled():
+    return not(headless)
+
+
+def closeAllFigures():
+    """Closes figures without importing matplotlib if no figure was made."""
+    if "matplotlib.pyplot" in sys.modules:
+        sys.modules["matplotlib.pyplot"].close("all")
+
+
+def submitFigure(render, *args):
+    """Renders figure in the background with render(*args), args should be plain arrays and paths."""
+
+    if (figureQueue is None) or (queuePid != os.getpid()):
+        render(*args)
+        return
+    applyStyle()    # Set once in the main thread, rcParams are global
+    pendingFigures.append(figureQueue.submit(render, *args))
+
+
+def flushFigures():
+    """Waits for figures being rendered, failed figures do not stop the run."""
+
+    while pendingFigures:
+        future = pendingFigures.pop(0)
+        try:
+            future.result()
+        except Exception as error:
+            print(f"\nFigure could not be saved: {error}")
+
+
+@contextmanager
+def headlessRun(enabled):
+    global headless
+
+    previous = headless
+    headless = enabled
+    try:
+        yield
+    finally:
+        headless = previous
+
+
+@contextmanager
+def backgroundFigures(enabled):
+    """Figures submitted inside the context are rendered in the background and flushed at the end."""
+    global figureQueue, queuePid
+
+    if not(enabled):
+        yield
+        return
+
+    figureQueue = ThreadPoolExecutor(max_workers=1)
+    queuePid = os.getpid()
+    try:
+        yield
+    finally:
+        flushFigures()
+        figureQueue.shutdown()
+        figureQueue = None
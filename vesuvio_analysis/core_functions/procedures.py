@@ -46,7 +46,7 @@ def runPreProcToEstHRatio(bckwdIC, fwdIC):
         oriMS.append(IC.noOfMSIterations)
         IC.noOfMSIterations = 0
 
-    nIter = askUserNoOfIterations()
+    nIter = askUserNoOfIterations(bckwdIC)
  
     HRatios = []   # List to store HRatios
     massIdxs = []
@@ -96,8 +96,12 @@ def createTableWSHRatios(HRatios, massIdxs):
     return
 
 
-def askUserNoOfIterations():
+def askUserNoOfIterations(bckwdIC):
     print("\nH was detected but HToMassIdxRatio was not provided.")
+    if bckwdIC.noOfHRatioIterations is not None:     # Set in initial conditions, runs without asking
+        print(f"\nRunning preliminary procedure with {bckwdIC.noOfHRatioIterations} iterations.")
+        return bckwdIC.noOfHRatioIterations
+
     print("\nSugested preliminary procedure:\n\nrun_forward\nfor n:\n    estimate_HToMassIdxRatio\n    run_backward\n    run_forward")
     userInput = input("\n\nDo you wish to run preliminary procedure to estimate HToMassIdxRatio? (y/n)") 
     if not((userInput=="y") or (userInput=="Y")): raise KeyboardInterrupt("Preliminary procedure interrupted.")
@@ -0,0 +1,143 @@
+"""
+Optional profiling of the main stages of the procedures, selected with profiling = True in UserScriptControls.
+Each stage records wall time, CPU time and peak resident memory of the process.
+At the end of the run a Chrome trace file (open in chrome://tracing or ui.perfetto.dev)
+and a summary table are written to the profiles folder of the sample.
+When profiling is disabled, stages only check a module flag and run unchanged.
+"""
+
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+import threading
+import json
+import time
+import sys
+import os
+try:
+    import resource     # Not available on Windows, peak memory is then not recorded
+except ImportError:
+    resource = None
+
+profilingEnabled = False
+traceEvents = []
+runStart = 0
+nullStage = nullcontext()
+
+
+def stage(name):
+    """Context manager around a stage of the procedure."""
+    if not(profilingEnabled):
+        return nullStage
+    return RecordedStage(name)
+
+
+def profiled(name):
+    """Decorator to record every call of a function as a stage."""
+    def decorator(fun):
+        @wraps(fun)
+        def wrapper(*args, **kwargs):
+            if not(profilingEnabled):
+                return fun(*args, **kwargs)
+            with RecordedStage(name):
+                return fun(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class RecordedStage:
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.wallStart = time.perf_counter()
+        self.cpuStart = time.process_time()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        wallTime = time.perf_counter() - self.wallStart
+        cpuTime = time.process_time() - self.cpuStart
+        traceEvents.append({
+            "name": self.name,
+            "cat": "stage",
+            "ph": "X",      # Complete event, nested stages are shown below their parent
+            "ts": (self.wallStart - runStart) * 1e6,
+            "dur": wallTime * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": {"cpu_s": cpuTime, "peak_rss_mb": peakRSS()}
+            })
+        return False
+
+
+def peakRSS():
+    """Peak resident memory of the process in MB, None if not available."""
+    if resource is None:
+        return None
+    maxRSS = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":      # Bytes on macOS, kB on Linux
+        return maxRSS / 1024**2
+    return maxRSS / 1024
+
+
+@contextmanager
+def profileRun(enabled, profilesPath, runName):
+    """Records stages run inside the context and writes trace and summary files at the end."""
+
+    global profilingEnabled, runStart
+    if not(enabled):
+        yield
+        return
+
+    traceEvents.clear()
+    runStart = time.perf_counter()
+    profilingEnabled = True
+    try:
+        with RecordedStage("run"):
+            yield
+    finally:
+        profilingEnabled = False
+        writeProfile(profilesPath, runName)
+
+
+def stageSummary(events):
+    """Calls, total and mean wall time, total CPU time and peak memory of each stage."""
+
+    summary = {}
+    for event in events:
+        s = summary.setdefault(event["name"], {"calls": 0, "wall_s": 0, "cpu_s": 0, "peak_rss_mb": None})
+        s["calls"] += 1
+        s["wall_s"] += event["dur"] / 1e6
+        s["cpu_s"] += event["args"]["cpu_s"]
+        if event["args"]["peak_rss_mb"] is not None:
+            s["peak_rss_mb"] = max(s["peak_rss_mb"] or 0, event["args"]["peak_rss_mb"])
+
+    for s in summary.values():
+        s["mean_wall_ms"] = s["wall_s"] / s["calls"] * 1e3
+    return dict(sorted(summary.items(), key=lambda item: item[1]["wall_s"], reverse=True))
+
+
+def summaryTable(summary):
+    lines = [f"{'Stage':<20} {'Calls':>8} {'Wall (s)':>10} {'Mean (ms)':>11} {'CPU (s)':>10} {'Peak RSS (MB)':>14}"]
+    for name, s in summary.items():
+        rss = "-" if s["peak_rss_mb"] is None else f"{s['peak_rss_mb']:.0f}"
+        lines.append(f"{name:<20} {s['calls']:>8} {s['wall_s']:>10.2f} {s['mean_wall_ms']:>11.2f} {s['cpu_s']:>10.2f} {rss:>14}")
+    return "\n".join(lines)
+
+
+def writeProfile(profilesPath, runName):
+    profilesPath.mkdir(parents=True, exist_ok=True)
+    tracePath = profilesPath / (runName + "_trace.json")
+    summaryPath = profilesPath / (runName + "_summary.txt")
+
+    with open(tracePath, "w") as traceFile:
+        json.dump({"traceEvents": traceEvents, "displayTimeUnit": "ms"}, traceFile)
+
+    table = summaryTable(stageSummary(traceEvents))
+    with open(summaryPath, "w") as summaryFile:
+        summaryFile.write(table + "\n")
+
+    print("\nProfile of stages:\n")
+    print(table)
+    print(f"\nChrome trace saved in: {tracePath}")
+    return
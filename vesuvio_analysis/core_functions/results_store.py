@@ -0,0 +1,121 @@
+"""
+Chunked and compressed HDF5 store of the results of the iterative fit, selected with resultsFormat = "hdf5".
+Arrays are chunked per iteration and per block of spectra, so that a single iteration or spectrum
+is read from disk without loading the whole array.
+Initial conditions are stored as attributes of the file.
+Results in .npz files can be opened with the same reader, for comparisons with original results.
+"""
+
+from pathlib import Path
+import numpy as np
+import json
+try:
+    import h5py
+except ImportError:     # Only needed for the hdf5 format
+    h5py = None
+
+specChunkSize = 16      # Spectra per chunk, single spectra are read with little overhead
+compression = "gzip"
+compressionLevel = 4
+
+
+def checkH5pyInstalled():
+    assert h5py is not None, "Package h5py needed for resultsFormat='hdf5', install it or use resultsFormat='npz'."
+
+
+def chunkShape(arr):
+    """One iteration and a block of spectra per chunk, remaining axis stored whole."""
+    if arr.ndim < 2:
+        return None
+    return (1, min(specChunkSize, max(arr.shape[1], 1))) + arr.shape[2:]
+
+
+def icMetadata(ic):
+    """Public attributes of the initial conditions that can be written to json."""
+
+    meta = {}
+    for name in dir(ic):
+        if name.startswith("_"):
+            continue
+        value = getattr(ic, name)
+        if isinstance(value, np.ndarray):
+            value = value.tolist()
+        elif isinstance(value, Path):
+            value = str(value)
+        elif isinstance(value, np.generic):
+            value = value.item()
+        try:
+            json.dumps(value)
+        except TypeError:
+            continue
+        meta[name] = value
+    return meta
+
+
+def saveResultsHDF5(savePath, arrays: dict, meta: dict):
+    """Writes each array to a chunked, compressed dataset, written to a temporary file first."""
+
+    checkH5pyInstalled()
+    tmpPath = savePath.with_name(savePath.name + ".tmp")
+    with h5py.File(tmpPath, "w") as file:
+        for name, arr in arrays.items():
+            arr = np.asarray(arr)
+            if arr.dtype.kind in "US":      # Fit messages
+                file.create_dataset(name, data=arr.astype(object), dtype=h5py.string_dtype())
+                continue
+            if arr.size == 0:
+                file.create_dataset(name, data=arr)
+                continue
+            file.create_dataset(name, data=arr, chunks=chunkShape(arr),
+                compression=compression, compression_opts=compressionLevel, shuffle=True)
+        file.attrs["ic"] = json.dumps(meta)
+    tmpPath.replace(savePath)
+    return
+
+
+class StoredResults:
+    """
+    Lazy reader of stored results, works with .h5 and .npz files.
+    Arrays of .h5 files are read only when sliced, for example
+    results["all_ncp_for_each_mass"][iteration] or results["all_tot_ncp"][:, spectrum].
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        if self.path.suffix == ".npz":
+            self.file = np.load(self.path)
+            self.meta = {}
+        else:
+            checkH5pyInstalled()
+            self.file = h5py.File(self.path, "r")
+            self.meta = json.loads(self.file.attrs.get("ic", "{}"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        self.file.close()
+
+    def keys(self):
+        return list(self.file.keys())
+
+    def __getitem__(self, name):
+        return self.file[name]
+
+    def iteration(self, name, i):
+        return np.asarray(self.file[name][i])
+
+    def spectrum(self, name, idx):
+        """All iterations of a single spectrum, idx is the index relative to the first spectrum."""
+        return np.asarray(self.file[name][:, idx])
+
+    def load(self, name):
+        """Whole array in memory, strings decoded as in .npz files."""
+        data = self.file[name]
+        if (h5py is not None) and isinstance(data, h5py.Dataset) and h5py.check_string_dtype(data.dtype):
+            return data.asstr()[()].astype(str)
+        return np.asarray(data[()])
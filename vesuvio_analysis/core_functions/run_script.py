@@ -1,14 +1,23 @@
-
-from matplotlib.afm import CharMetrics
-from vesuvio_analysis.core_functions.ICHelpers import buildFinalWSName, completeICFromInputs, completeBootIC, completeYFitIC
+from vesuvio_analysis.core_functions.ICHelpers import buildFinalWSName, completeICFromInputs, completeBootIC, completeYFitIC, saveMissingInputWS, setUserCtrDefaults
 from vesuvio_analysis.core_functions.bootstrap import runBootstrap
-from vesuvio_analysis.core_functions.fit_in_yspace import fitInYSpaceProcedure
+from vesuvio_analysis.core_functions.fit_in_yspace import fitInYSpaceProcedure, reduceToYSpace, fitYSpace, runGlobalFit
 from vesuvio_analysis.core_functions.procedures import runIndependentIterativeProcedure, runJointBackAndForwardProcedure, runPreProcToEstHRatio, createTableWSHRatios, isHPresent
+from vesuvio_analysis.core_functions.profiling import profileRun
+from vesuvio_analysis.core_functions.workspace_manager import managedWorkspaces
+from vesuvio_analysis.core_functions.plotting import headlessRun, backgroundFigures
+from vesuvio_analysis.core_functions.analysis_functions import setPrintOptions
+from vesuvio_analysis.core_functions.stage_graph import stageKeys, runStage
 from mantid.api import mtd
+import time
 
 
 def runScript(userCtr, scriptName, wsBackIC, wsFrontIC, bckwdIC, fwdIC, yFitIC, bootIC):
 
+    setPrintOptions()
+
+    # Load any missing input workspaces of both modes at once
+    saveMissingInputWS(scriptName, [wsFrontIC, wsBackIC])
+
     # Set extra attributes from user attributes
     completeICFromInputs(fwdIC, scriptName, wsFrontIC)
     completeICFromInputs(bckwdIC, scriptName, wsBackIC)
@@ -19,6 +28,17 @@ def runScript(userCtr, scriptName, wsBackIC, wsFrontIC, bckwdIC, fwdIC, yFitIC,
     checkInputs(bootIC)
     assert not(userCtr.runRoutine & bootIC.runBootstrap), "Main routine and bootstrap both set to run!"
 
+    setUserCtrDefaults(userCtr)
+
+    profilesPath = bckwdIC.runTimesPath.parent / "profiles"
+    with profileRun(userCtr.profiling, profilesPath, time.strftime("%Y%m%d_%H%M%S")), \
+        managedWorkspaces(userCtr.manageWorkspaces, userCtr.workspaceMemoryBudget), \
+        headlessRun(userCtr.headless), backgroundFigures(userCtr.backgroundFigures):
+        return runSelectedProcedures(userCtr, scriptName, bckwdIC, fwdIC, yFitIC, bootIC)
+
+
+def runSelectedProcedures(userCtr, scriptName, bckwdIC, fwdIC, yFitIC, bootIC):
+
     def runProcedure():
         proc = userCtr.procedure  # Shorthad to make it easier to read
 
@@ -52,10 +72,15 @@ def runScript(userCtr, scriptName, wsBackIC, wsFrontIC, bckwdIC, fwdIC, yFitIC,
     # If bootstrap is not None, run bootstrap procedure and finish
     if bootIC.runBootstrap:
         assert (bootIC.procedure=="FORWARD") | (bootIC.procedure=="BACKWARD") | (bootIC.procedure=="JOINT"), "Invalid Bootstrap procedure."
+        if userCtr.reuseStages:
+            return runBootstrapInStages(bckwdIC, fwdIC, bootIC, yFitIC), None
         return runBootstrap(bckwdIC, fwdIC, bootIC, yFitIC), None
     
     # Default workflow for procedure + fit in y space
     if userCtr.runRoutine:
+        if userCtr.reuseStages & (userCtr.procedure!=None):
+            return runRoutineInStages(userCtr, bckwdIC, fwdIC, yFitIC, wsNames, ICs, runProcedure)
+
         # Check if final ws are loaded:
         wsInMtd = [ws in mtd for ws in wsNames]     # Bool list
         if (len(wsInMtd)>0) and all(wsInMtd):       # When wsName is empty list, loop doesn't run
@@ -63,7 +88,8 @@ def runScript(userCtr, scriptName, wsBackIC, wsFrontIC, bckwdIC, fwdIC, yFitIC,
                 resYFit = fitInYSpaceProcedure(yFitIC, IC, mtd[wsName])
             return None, resYFit       # To match return below. 
         
-        checkUserClearWS()      # Check if user is OK with cleaning all workspaces
+        if userCtr.confirmClearWS:
+            checkUserClearWS()      # Check if user is OK with cleaning all workspaces
         res = runProcedure()
 
         resYFit = None
@@ -73,6 +99,74 @@ def runScript(userCtr, scriptName, wsBackIC, wsFrontIC, bckwdIC, fwdIC, yFitIC,
         return res, resYFit   # Return results used only in tests
 
 
+def runRoutineInStages(userCtr, bckwdIC, fwdIC, yFitIC, wsNames, ICs, runProcedure):
+    """
+    Restores outputs of the stages still valid from previous runs and runs only the invalidated stages.
+    Keys are calculated before running, since procedures change initial conditions.
+    """
+
+    proc = userCtr.procedure
+    runICs = {"BACKWARD": [bckwdIC], "FORWARD": [fwdIC], "JOINT": [bckwdIC, fwdIC]}[proc]
+    keys = stageKeys(keyICsOfProcedure(proc, bckwdIC, fwdIC), yFitIC)
+    stagesPath = stagesPathOfSample(bckwdIC)
+
+    for IC in [bckwdIC, fwdIC]:     # Outputs of preprocess stage
+        IC.useInputCache = True
+
+    if userCtr.confirmClearWS:
+        checkUserClearWS()      # Procedure or restore of its outputs clears all workspaces
+    res = runStage(stagesPath, "ncp", proc, keys["ncp"], runProcedure, ICs=[bckwdIC, fwdIC],
+        files=[resultsFilePath(IC) for IC in runICs], clearsWorkspaces=True)
+
+    resYFit = None
+    for wsName, IC in zip(wsNames, ICs):
+        resYFit = fitInYSpaceInStages(stagesPath, keys, yFitIC, IC, wsName)
+    return res, resYFit
+
+
+def fitInYSpaceInStages(stagesPath, keys, yFitIC, IC, wsName):
+    """Same steps as fitInYSpaceProcedure, each run as a stage."""
+
+    mode = IC.modeRunning
+    wsJoY, wsJoYAvg, wsRes, wsResSum = runStage(stagesPath, "y_reduction", mode, keys["y_reduction"],
+        lambda: reduceToYSpace(yFitIC, IC, mtd[wsName]))
+
+    resYFit = runStage(stagesPath, "y_fit", mode, keys["y_fit"],
+        lambda: fitYSpace(yFitIC, IC, mtd[wsName], wsJoYAvg, wsResSum), files=[IC.ySpaceFitSavePath])
+
+    if yFitIC.globalFit:
+        runStage(stagesPath, "global_fit", mode, keys["global_fit"], lambda: runGlobalFit(wsJoY, wsRes, IC, yFitIC))
+    return resYFit
+
+
+def runBootstrapInStages(bckwdIC, fwdIC, bootIC, yFitIC):
+    """Restores samples of a Bootstrap with the same inputs, otherwise runs and stores it."""
+
+    keys = stageKeys(keyICsOfProcedure(bootIC.procedure, bckwdIC, fwdIC), yFitIC, bootIC)
+    files = [path for IC in [bckwdIC, fwdIC] for path in [IC.bootSavePath, IC.bootYFitSavePath]]
+    return runStage(stagesPathOfSample(bckwdIC), "bootstrap", bootIC.procedure, keys["bootstrap"],
+        lambda: runBootstrap(bckwdIC, fwdIC, bootIC, yFitIC), ICs=[bckwdIC, fwdIC, bootIC], files=files, clearsWorkspaces=True)
+
+
+def keyICsOfProcedure(proc, bckwdIC, fwdIC):
+    """Initial conditions the results of the procedure depend on."""
+
+    keyICs = {"BACKWARD": [bckwdIC], "FORWARD": [fwdIC], "JOINT": [bckwdIC, fwdIC]}[proc]
+    if (proc=="BACKWARD") & (bckwdIC.HToMassIdxRatio==None):   # Preliminary procedure might run forward
+        keyICs.append(fwdIC)
+    return keyICs
+
+
+def stagesPathOfSample(bckwdIC):
+    return bckwdIC.runTimesPath.parent / "stages"
+
+
+def resultsFilePath(IC):
+    if IC.resultsFormat == "hdf5":
+        return IC.resultsSavePath.with_suffix(".h5")
+    return IC.resultsSavePath
+
+
 def checkUserClearWS():
     """If any workspace is loaded, check if user is sure to start new procedure."""
 
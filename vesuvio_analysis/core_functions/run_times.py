@@ -0,0 +1,106 @@
+"""
+Run times of each stage of the procedures, recorded automatically during normal runs.
+Records are stored in a json file for each sample and used in a simple cost model
+to estimate the run time of a procedure, or of a full Bootstrap, without running anything.
+Records are added under a file lock, so that concurrent processes of the same sample do not lose records.
+"""
+
+from vesuvio_analysis.core_functions.input_index import fileLock
+import numpy as np
+import json
+import os
+
+maxRecordsPerStage = 100     # Keep only most recent records
+
+# Size of each stage that the run time is assumed to scale linearly with, from the fields of a record
+stageSizes = {
+    "load": lambda r: r["nSpec"] * r["nBins"],
+    "load_cache": lambda r: r["nSpec"] * r["nBins"],     # Preprocessed input read from the input cache
+    "crop": lambda r: r["nSpec"] * r["nBins"],
+    "ncp_fit": lambda r: r["nBins"] * r["nMasses"],     # Time per spectrum
+    "ms": lambda r: r["nSpec"] * r["nEvents"] * r["msOrder"],     # Monte Carlo events of each scattering order
+    "gamma": lambda r: r["nSpec"] * r["nBins"],
+    "y_fit": lambda r: r["nSpec"]
+}
+
+
+def storeRunTime(IC, stage, runTime, nSpec, nBins):
+    """Appends run time in seconds of a stage to the run times file of the sample."""
+
+    assert stage in stageSizes, f"Stage {stage} not recognized. Options: {list(stageSizes)}"
+
+    record = {"time": runTime, **recordSizes(IC, nSpec, nBins)}
+
+    with fileLock(IC.runTimesPath.with_suffix(".lock")):     # Whole read, append and write
+        runTimes = loadRunTimes(IC.runTimesPath)
+        records = runTimes.get(stage, [])
+        records.append(record)
+        runTimes[stage] = records[-maxRecordsPerStage:]
+
+        # Write to temporary file first so that file is never left half written
+        tmpPath = IC.runTimesPath.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmpPath, "w") as jsonFile:
+            json.dump(runTimes, jsonFile)
+        os.replace(tmpPath, IC.runTimesPath)
+    return
+
+
+def loadRunTimes(runTimesPath):
+    if not(runTimesPath.is_file()):
+        return {}
+    with open(runTimesPath, "r") as jsonFile:
+        return json.load(jsonFile)
+
+
+def recordSizes(IC, nSpec, nBins):
+    """Fields of a record that sizes of stages are calculated from."""
+    return {
+        "nSpec": int(nSpec),
+        "nBins": int(nBins),
+        "nMasses": int(IC.noOfMasses),
+        "nEvents": int(IC.number_of_events),
+        "msOrder": int(IC.multiple_scattering_order),
+        "mode": IC.modeRunning
+        }
+
+
+def costCoefficients(runTimes):
+    """Median of time per unit of size for each stage and mode with records."""
+
+    timesPerSize = {}
+    for stage, records in runTimes.items():
+        for r in records:
+            timesPerSize.setdefault((stage, r["mode"]), []).append(r["time"] / stageSizes[stage](r))
+    return {key: np.median(times) for key, times in timesPerSize.items()}
+
+
+def estimateRunTime(IC, noOfMSIterations, fitInYSpace, nWorkers=1):
+    """
+    Estimates run time in seconds of a single procedure from stored run times.
+    Fits of single spectra are assumed to be split between nWorkers.
+    Only records of the same mode as IC are used, loading from the input cache when it is used and recorded.
+    Returns None if any of the required stages was never recorded.
+    """
+
+    coefs = costCoefficients(loadRunTimes(IC.runTimesPath))
+
+    nSpec = IC.lastSpec - IC.firstSpec + 1
+    start, spacing, end = [float(s) for s in IC.tofBinning.split(",")]
+    sizes = recordSizes(IC, nSpec, int((end - start) / spacing))
+
+    loadStage = "load_cache" if getattr(IC, "useInputCache", False) & (("load_cache", IC.modeRunning) in coefs) else "load"
+    stagesToRun = {loadStage: 1, "crop": 1, "ncp_fit": (noOfMSIterations + 1) * nSpec / nWorkers}
+    if noOfMSIterations > 0:
+        if IC.MSCorrectionFlag:
+            stagesToRun["ms"] = noOfMSIterations
+        if IC.GammaCorrectionFlag:
+            stagesToRun["gamma"] = noOfMSIterations
+    if fitInYSpace:
+        stagesToRun["y_fit"] = 1
+
+    runTime = 0
+    for stage, nTimes in stagesToRun.items():
+        if (stage, IC.modeRunning) not in coefs:
+            return None
+        runTime += nTimes * coefs[stage, IC.modeRunning] * stageSizes[stage](sizes)
+    return runTime
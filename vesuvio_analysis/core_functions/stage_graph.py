@@ -0,0 +1,228 @@
+"""
+Graph of the stages run by runScript, enabled with reuseStages = True in UserScriptControls:
+load -> preprocess -> ncp -> y_reduction -> y_fit -> global_fit -> bootstrap.
+Each stage is keyed by a hash of the fields of the initial conditions it depends on and of the key of its parent,
+so that a change of any field invalidates the stage and all stages after it.
+Outputs of completed stages are stored under experiments/<sample>/stages, one directory per key,
+and a rerun restores the outputs of the stages still valid, running only the invalidated ones.
+Outputs of a stage are the workspaces it leaves in the ADS, the files it writes, the attributes it changes
+in the initial conditions and its return value, so that a restored run leaves the same state as a fresh run.
+Outputs of load and preprocess are the input workspaces stored by the input index and the preprocessed arrays
+stored by the input cache, both keyed by the same inputs as these stages, so ncp reads them when it runs again.
+"""
+
+from vesuvio_analysis.core_functions.input_cache import fileHash, atomicDir
+from mantid.api import AnalysisDataService, mtd, Workspace, WorkspaceGroup
+from mantid.simpleapi import Load, SaveNexus, GroupWorkspaces, DeleteWorkspace
+from pathlib import Path
+import numpy as np
+import hashlib
+import inspect
+import pickle
+import shutil
+import json
+
+stageGraph = {      # Parent of each stage, initial conditions it reads and fields it depends on
+    "load": (None, "tof", ["userWsRawPath", "userWsEmptyPath"]),
+    "preprocess": ("load", "tof", ["tofBinning", "scaleRaw", "scaleEmpty", "subEmptyFromRaw"]),
+    "ncp": ("preprocess", "tof", [
+        "masses", "initPars", "bounds", "constraints", "noOfMSIterations", "firstSpec", "lastSpec",
+        "maskedSpecAllNo", "maskTOFRange", "MSCorrectionFlag", "GammaCorrectionFlag", "transmission_guess",
+        "multiple_scattering_order", "number_of_events", "vertical_width", "horizontal_width", "thickness",
+        "HToMassIdxRatio", "noOfHRatioIterations", "massIdx", "InstrParsPath", "mode", "runHistData", "normVoigt"
+        ]),
+    "y_reduction": ("ncp", "yfit", ["rebinParametersForYSpaceFit", "maskTypeProcedure", "symmetrisationFlag"]),
+    "y_fit": ("y_reduction", "yfit", ["fitModel", "runMinos"]),
+    "global_fit": ("y_fit", "yfit", ["globalFit", "nGlobalFitGroups"]),
+    "bootstrap": ("global_fit", "boot", [
+        "bootstrapType", "procedure", "fitInYSpace", "nSamples", "skipMSIterations", "reuseParentCorrections",
+        "jackknifeGroups", "jackknifeGroupMode", "earlyStopTolerance", "earlyStopWindow", "earlyStopCI",
+        "ySpaceResampling"
+        ]),
+}
+
+
+def fieldValue(value):
+    """Value of a field that can be written to json, files by their contents and functions by their source."""
+
+    if isinstance(value, np.ndarray):
+        return fieldValue(value.tolist())
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, Path):
+        return fileHash(value) if value.is_file() else str(value)
+    if isinstance(value, dict):
+        return {str(key): fieldValue(v) for key, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [fieldValue(v) for v in value]
+    if callable(value):     # Functions in constraints
+        try:
+            return inspect.getsource(value).strip()
+        except (OSError, TypeError):
+            return value.__qualname__
+    return value
+
+
+def stageKeys(ICs, yFitIC, bootIC=None):
+    """
+    Key of each stage, in the order of the graph.
+    ICs are all initial conditions the fit in TOF depends on, both of them for the joint procedure.
+    Key of bootstrap is only calculated when bootIC is given.
+    """
+
+    keys = {}
+    for stage, (parent, icGroup, fields) in stageGraph.items():
+        if (icGroup == "boot") & (bootIC is None):
+            continue
+        sources = {"tof": ICs, "yfit": [yFitIC], "boot": [bootIC]}[icGroup]
+        values = [{field: fieldValue(getattr(ic, field, None)) for field in fields} for ic in sources]
+        content = {"stage": stage, "parent": keys.get(parent), "fields": values}
+        keys[stage] = hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()[:16]
+    return keys
+
+
+def stageDir(stagesPath, stage, mode, key):
+    return stagesPath / f"{stage}_{mode.lower()}_{key}"
+
+
+def isStageStored(stagesPath, stage, mode, key):
+    return (stageDir(stagesPath, stage, mode, key) / "manifest.json").is_file()     # Written last
+
+
+def runStage(stagesPath, stage, mode, key, runFunc, ICs=(), files=(), clearsWorkspaces=False):
+    """
+    Runs a stage and stores its outputs, or restores them when stored with the same key.
+    Returns the value returned by runFunc in both cases.
+    ICs are the initial conditions the stage may change, files are written by the stage.
+    Stages that clear the ADS first, like the procedures, store all workspaces left in the ADS.
+    """
+
+    if isStageStored(stagesPath, stage, mode, key):
+        return restoreStage(stagesPath, stage, mode, key, ICs)
+
+    namesBefore = set() if clearsWorkspaces else set(mtd.getObjectNames())
+    statesBefore = [icState(IC) for IC in ICs]
+
+    result = runFunc()
+
+    namesAfter = mtd.getObjectNames()
+    outputs = {
+        "result": storedForm(result),
+        "icChanges": [changedAttributes(before, icState(IC)) for before, IC in zip(statesBefore, ICs)],
+        "deletedWorkspaces": sorted(namesBefore - set(namesAfter)),
+        "clearsWorkspaces": clearsWorkspaces
+        }
+    storeStage(stagesPath, stage, mode, key, [name for name in namesAfter if name not in namesBefore], files, outputs)
+    return result
+
+
+def storeStage(stagesPath, stage, mode, key, wsNames=(), files=(), outputs=None):
+    """
+    Saves workspaces, copies files produced by the stage and pickles its other outputs,
+    written to a temporary directory first. Files the stage did not write are skipped.
+    """
+
+    entryPath = stageDir(stagesPath, stage, mode, key)
+    if entryPath.is_dir():
+        return
+
+    if outputs is None:
+        outputs = {"result": None, "icChanges": [], "deletedWorkspaces": [], "clearsWorkspaces": False}
+    groups = {name: list(mtd[name].getNames()) for name in wsNames if isinstance(mtd[name], WorkspaceGroup)}
+    wsNames = [name for name in wsNames if name not in groups]
+    files = [Path(path) for path in files if Path(path).is_file()]
+
+    with atomicDir(entryPath) as tmpPath:
+        for name in wsNames:
+            SaveNexus(name, str(tmpPath / (name + ".nxs")))
+        storedFiles = {}
+        for i, path in enumerate(files):     # Files of different modes can share names
+            storedFiles[f"{i}_{path.name}"] = str(path)
+            shutil.copy(path, tmpPath / f"{i}_{path.name}")
+        with open(tmpPath / "outputs.pkl", "wb") as outputsFile:
+            pickle.dump(outputs, outputsFile)
+        manifest = {"stage": stage, "mode": mode, "workspaces": wsNames, "groups": groups, "files": storedFiles}
+        with open(tmpPath / "manifest.json", "w") as manifestFile:
+            json.dump(manifest, manifestFile)
+    return
+
+
+def restoreStage(stagesPath, stage, mode, key, ICs=()):
+    """
+    Loads stored workspaces into the ADS, copies stored files back to their original paths
+    and sets the attributes of the initial conditions changed by the stage. Returns value returned by the stage.
+    """
+
+    entryPath = stageDir(stagesPath, stage, mode, key)
+    with open(entryPath / "manifest.json", "r") as manifestFile:
+        manifest = json.load(manifestFile)
+    with open(entryPath / "outputs.pkl", "rb") as outputsFile:
+        outputs = pickle.load(outputsFile)
+
+    if outputs["clearsWorkspaces"]:
+        AnalysisDataService.clear()
+    for name in outputs["deletedWorkspaces"]:
+        if name in mtd:
+            DeleteWorkspace(name)
+
+    for name in manifest["workspaces"]:
+        Load(Filename=str(entryPath / (name + ".nxs")), OutputWorkspace=name)
+    for name, members in manifest["groups"].items():
+        GroupWorkspaces(InputWorkspaces=members, OutputWorkspace=name)
+    for fileName, path in manifest["files"].items():
+        shutil.copy(entryPath / fileName, path)
+
+    for IC, changes in zip(ICs, outputs["icChanges"]):
+        for name, value in changes.items():
+            setattr(IC, name, value)
+
+    print(f"\nStage {stage} of {mode} up to date, restored outputs stored in: {entryPath.name}")
+    return restoredForm(outputs["result"])
+
+
+class StoredWorkspace:
+    """Stands for a workspace in a stored return value, replaced by the workspace of the same name when restored."""
+
+    def __init__(self, name):
+        self.name = name
+
+
+def storedForm(value):
+    """Value with workspaces replaced by their names, workspaces are stored separately."""
+
+    if isinstance(value, Workspace):
+        return StoredWorkspace(value.name())
+    if isinstance(value, (list, tuple)):
+        return type(value)(storedForm(v) for v in value)
+    if isinstance(value, dict):
+        return {key: storedForm(v) for key, v in value.items()}
+    return value
+
+
+def restoredForm(value):
+    if isinstance(value, StoredWorkspace):
+        return mtd[value.name]
+    if isinstance(value, (list, tuple)):
+        return type(value)(restoredForm(v) for v in value)
+    if isinstance(value, dict):
+        return {key: restoredForm(v) for key, v in value.items()}
+    return value
+
+
+def icState(IC):
+    """Pickled public attributes of initial conditions, including inherited ones."""
+
+    state = {}
+    for name in dir(IC):
+        value = getattr(IC, name)
+        if name.startswith("_") or callable(value):
+            continue
+        try:
+            state[name] = pickle.dumps(value)
+        except (pickle.PicklingError, AttributeError, TypeError):     # Functions in constraints are never changed
+            continue
+    return state
+
+
+def changedAttributes(stateBefore, stateAfter):
+    return {name: pickle.loads(value) for name, value in stateAfter.items() if stateBefore.get(name) != value}
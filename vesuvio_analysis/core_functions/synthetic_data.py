@@ -0,0 +1,131 @@
+"""
+Synthetic VESUVIO data built with the same forward model used in the ncp fit.
+Detector layouts are read from an ip file or generated with any number of detectors,
+so that the procedures can be benchmarked at sizes beyond the real instrument
+and fits can be checked against known parameters.
+Arrays are built without Mantid, workspaces are created only when asked for.
+"""
+
+from vesuvio_analysis.core_functions.analysis_functions import loadInstrParsFileIntoArray, loadResolutionPars, \
+    calculateKinematicsArrays, convertDataXToYSpacesForEachMass, reshapeArrayPerSpectrum, calculateNcpSpec, \
+    fitNcpToSingleSpec
+import numpy as np
+
+# Ranges of scattering angles and L1 of each bank, from ip2018_3.par
+detectorRanges = {
+    "BACKWARD": {"theta": (130, 165), "L1": (0.50, 0.72)},
+    "FORWARD": {"theta": (32, 68), "L1": (0.50, 0.82)}
+    }
+
+
+class SyntheticInitialConditions:
+    """Minimal initial conditions used by the forward model and the fit of single spectra."""
+
+    def __init__(self, masses, initPars=None, bounds=None, normVoigt=False):
+        self.masses = np.array(masses, dtype=float)
+        self.noOfMasses = len(self.masses)
+        self.normVoigt = normVoigt
+        self.constraints = ()
+
+        if initPars is None:
+            initPars = np.tile([1, 12, 0.], self.noOfMasses)
+        if bounds is None:
+            bounds = np.tile([[0, np.nan], [3, 30], [-3, 1]], (self.noOfMasses, 1))
+        self.initPars = np.array(initPars, dtype=float)
+        self.bounds = np.array(bounds, dtype=float)
+
+
+def syntheticInstrPars(nSpec, mode="BACKWARD", firstSpec=3, seed=0):
+    """
+    Instrument parameters of a synthetic bank of nSpec detectors, in the same columns as ip files:
+    spectrum, detector, theta, T0, L0, L1.
+    """
+
+    assert (mode=="BACKWARD") | (mode=="FORWARD"), "Mode of synthetic detectors not recognized. Options: 'BACKWARD', 'FORWARD'"
+
+    rng = np.random.default_rng(seed)
+    spectra = np.arange(firstSpec, firstSpec + nSpec)
+    theta = np.linspace(*detectorRanges[mode]["theta"], nSpec)
+    L1 = rng.uniform(*detectorRanges[mode]["L1"], nSpec)
+    T0 = np.full(nSpec, -0.2)
+    L0 = np.full(nSpec, 11.005)
+    return np.vstack((spectra, spectra, theta, T0, L0, L1)).T
+
+
+def saveInstrParsFile(instrPars, savePath):
+    """Writes instrument parameters in the format of ip files, to be used as InstrParsPath."""
+    header = "Det\tPlik\ttheta\t\tt0\tL0\t\tL1"
+    np.savetxt(savePath, instrPars, fmt=["%d", "%d", "%.4f", "%.3f", "%.3f", "%.6f"],
+        delimiter="\t", header=header, comments="")
+    return
+
+
+def generateSyntheticData(masses, intensities, widths, centers=None, instrPars=None, ipFilePath=None,
+    firstSpec=3, lastSpec=134, tofBinning="110,1.,430", noiseLevel=0.01, mode=None, seed=0):
+    """
+    Builds dataX, dataY and dataE of each detector from the ncp of the given masses.
+    Detectors are taken from instrPars, or from the ip file between firstSpec and lastSpec.
+    Noise is Gaussian with standard deviation noiseLevel times the maximum of each spectrum.
+    mode sets resolution of a synthetic layout, by default taken from spectrum numbers as in the fit.
+    Returns data arrays, instrument parameters and true fit parameters.
+    """
+
+    ic = SyntheticInitialConditions(masses)
+    if centers is None:
+        centers = np.zeros(ic.noOfMasses)
+    assert len(intensities)==len(widths)==len(centers)==ic.noOfMasses, "Need one intensity, width and center per mass."
+    truePars = np.vstack((intensities, widths, centers)).T.flatten()
+
+    if instrPars is None:
+        instrPars = loadInstrParsFileIntoArray(ipFilePath, firstSpec, lastSpec)
+    nSpec = len(instrPars)
+
+    start, spacing, end = [float(s) for s in tofBinning.split(",")]
+    dataX = np.tile(np.arange(start, end, spacing) + spacing/2, (nSpec, 1))
+
+    # Resolution depends on spectrum number, synthetic banks can go beyond numbers of the real instrument
+    resSpectra = instrPars.copy()
+    if mode is not None:
+        resSpectra[:, 0] = 3 if mode=="BACKWARD" else 144
+    resolutionPars = loadResolutionPars(resSpectra)
+
+    v0, E0, delta_E, delta_Q = calculateKinematicsArrays(dataX, instrPars)
+    kinematicArrays = reshapeArrayPerSpectrum(np.array([v0, E0, delta_E, delta_Q]))
+    ySpacesForEachMass = reshapeArrayPerSpectrum(convertDataXToYSpacesForEachMass(dataX, ic.masses, delta_Q, delta_E))
+
+    dataY = np.zeros(dataX.shape)
+    for i in range(nSpec):
+        ncpForEachMass, dataY[i] = calculateNcpSpec(
+            ic, truePars, ySpacesForEachMass[i], resolutionPars[i], instrPars[i], kinematicArrays[i]
+            )
+
+    rng = np.random.default_rng(seed)
+    dataE = noiseLevel * np.max(np.abs(dataY), axis=1)[:, np.newaxis] * np.ones(dataY.shape)
+    dataY = dataY + rng.normal(0, 1, dataY.shape) * dataE
+
+    fitArgs = (resolutionPars, instrPars, kinematicArrays, ySpacesForEachMass)
+    return dataX, dataY, dataE, fitArgs, truePars
+
+
+def fitSyntheticData(ic, dataY, dataE, fitArgs):
+    """Fits each synthetic spectrum, returns best fit parameters with shape (no of spectra, no of parameters)."""
+
+    resolutionPars, instrPars, kinematicArrays, ySpacesForEachMass = fitArgs
+    bestPars = np.zeros((len(dataY), len(ic.initPars)))
+    for i in range(len(dataY)):
+        specFitPars, specTelemetry, message = fitNcpToSingleSpec(
+            dataY[i], dataE[i], ySpacesForEachMass[i], resolutionPars[i], instrPars[i], kinematicArrays[i], ic
+            )
+        bestPars[i] = specFitPars[1:-2]
+    return bestPars
+
+
+def createSyntheticWorkspace(dataX, dataY, dataE, instrPars, wsName):
+    """Mantid workspace of point data in TOF, with spectrum numbers of the detectors."""
+    from mantid.simpleapi import CreateWorkspace
+
+    ws = CreateWorkspace(DataX=dataX.flatten(), DataY=dataY.flatten(), DataE=dataE.flatten(),
+        NSpec=len(dataY), UnitX="TOF", OutputWorkspace=wsName)
+    for i, specNo in enumerate(instrPars[:, 0]):
+        ws.getSpectrum(i).setSpectrumNo(int(specNo))
+    return ws
@@ -0,0 +1,101 @@
+"""
+Lifecycle of the intermediate workspaces created by the procedures, enabled with manageWorkspaces = True in UserScriptControls.
+Stages register the workspaces they create as intermediates and release them once no longer needed.
+Released workspaces are deleted right away, or kept for inspection while their total memory stays under
+workspaceMemoryBudget (in MB), deleting the oldest first.
+Workspaces marked as final outputs are never deleted.
+When the manager is disabled, all workspaces are left in the ADS as before.
+"""
+
+from contextlib import contextmanager
+try:
+    from mantid.api import AnalysisDataService
+except ImportError:     # Registry and eviction order can still be used without Mantid
+    AnalysisDataService = None
+
+managerEnabled = False
+memoryBudget = None
+registered = {}     # Names of intermediate workspaces and the stage that created them
+released = []       # Names of workspaces no longer needed, oldest first
+finalOutputs = set()
+deletedCount = 0
+deletedMB = 0
+
+
+def registerIntermediate(stage, *names):
+    if not(managerEnabled):
+        return
+    for name in names:
+        if name not in finalOutputs:
+            registered[name] = stage
+
+
+def registerFinal(*names):
+    if not(managerEnabled):
+        return
+    for name in names:
+        finalOutputs.add(name)
+        registered.pop(name, None)
+        if name in released:
+            released.remove(name)
+
+
+def release(stage):
+    """Intermediates of stage are no longer needed, deleted according to the memory budget."""
+    if not(managerEnabled):
+        return
+    for name in [name for name, s in registered.items() if s == stage]:
+        del registered[name]
+        if name in released:    # Workspace of the same name released before
+            released.remove(name)
+        released.append(name)
+    enforceBudget()
+
+
+def workspacesToEvict(sizes: dict, budget):
+    """Oldest workspaces to delete for the total size to fit the budget, sizes in MB ordered oldest first."""
+
+    if budget is None:
+        return list(sizes)
+
+    toEvict = []
+    total = sum(sizes.values())
+    for name, size in sizes.items():
+        if total <= budget:
+            break
+        toEvict.append(name)
+        total -= size
+    return toEvict
+
+
+def enforceBudget():
+    global deletedCount, deletedMB
+
+    existing = [name for name in released if AnalysisDataService.doesExist(name)]
+    sizes = {name: AnalysisDataService.retrieve(name).getMemorySize() / 1024**2 for name in existing}
+    for name in workspacesToEvict(sizes, memoryBudget):
+        AnalysisDataService.remove(name)
+        deletedCount += 1
+        deletedMB += sizes[name]
+    released[:] = [name for name in existing if AnalysisDataService.doesExist(name)]
+
+
+@contextmanager
+def managedWorkspaces(enabled, budget=None):
+    """Workspaces registered inside the context are managed, registry is cleared at the start."""
+
+    global managerEnabled, memoryBudget, deletedCount, deletedMB
+    if not(enabled):
+        yield
+        return
+
+    registered.clear()
+    released.clear()
+    finalOutputs.clear()
+    deletedCount, deletedMB = 0, 0
+    managerEnabled, memoryBudget = True, budget
+    try:
+        yield
+    finally:
+        managerEnabled = False
+        print(f"\nDeleted {deletedCount} intermediate workspaces, {deletedMB:.0f} MB.")
@@ -0,0 +1,33 @@
+"""
+Runs one half, backward or forward, of a joint Jackknife in its own process, started by
+runJackknifeHalvesConcurrently in bootstrap.py:
+
+    python -m vesuvio_analysis.jackknife_half <state file>
+
+Initial conditions of the main process are rebuilt from the state file,
+and results are written to the path given in the state file.
+"""
+
+from vesuvio_analysis.core_functions import bootstrap, plotting
+from vesuvio_analysis.core_functions.bootstrap_queue import atomicWrite
+from vesuvio_analysis.core_functions.analysis_functions import setPrintOptions
+import pickle
+import sys
+
+
+def runHalf(statePath):
+    with open(statePath, "rb") as stateFile:
+        state = pickle.load(stateFile)
+
+    ICs = {key: type(key, (), attrs) for key, attrs in state["ICs"].items()}
+    plotting.headless = state["headless"]
+    setPrintOptions()
+
+    results = bootstrap.runJackknifeHalf(state["mode"], ICs["bckwdIC"], ICs["fwdIC"], ICs["bootIC"], ICs["yFitIC"])
+    with atomicWrite(state["resultsPath"]) as resultsFile:
+        pickle.dump(results, resultsFile)
+
+
+if __name__ == "__main__":
+    assert len(sys.argv) == 2, "Usage: python -m vesuvio_analysis.jackknife_half <state file>"
+    runHalf(sys.argv[1])
@@ -0,0 +1,42 @@
+from vesuvio_analysis.core_functions.analysis_functions import calculateMeansAndStds, calculateMeansAndStdsBatch, \
+    filterWidthsAndIntensities, filterWidthsAndIntensitiesBatch
+import unittest
+import numpy as np
+import numpy.testing as nptest
+
+np.random.seed(4)   # Set seed so that tests match everytime
+
+nSamples, nMasses, nSpec = 50, 4, 30
+widths = np.random.uniform(3, 15, (nSamples, nMasses, nSpec))
+intensities = np.random.uniform(0, 1, (nSamples, nMasses, nSpec))
+widths[:, :, [2, 11]] = 0        # Masked spectra
+intensities[:, :, [2, 11]] = 0
+widths[7, :, 5] = 0              # Failed fit in a single sample
+intensities[7, :, 5] = 0
+
+
+class BatchIC:
+    runningPreliminary = False
+    noOfMSIterations = 3
+
+
+class TestBatchFilter(unittest.TestCase):
+
+    def test_filter_matches_loop(self):
+        batchW, batchI = filterWidthsAndIntensitiesBatch(widths, intensities, BatchIC)
+        for i in range(nSamples):
+            loopW, loopI = filterWidthsAndIntensities(widths[i], intensities[i], BatchIC)
+            nptest.assert_array_equal(batchW[i], loopW)
+            nptest.assert_array_equal(batchI[i], loopI)
+
+    def test_means_match_loop(self):
+        batchResults = calculateMeansAndStdsBatch(widths, intensities, BatchIC)
+        for i in range(nSamples):
+            loopResults = calculateMeansAndStds(widths[i], intensities[i], BatchIC)
+            for batchRes, loopRes in zip(batchResults, loopResults):
+                nptest.assert_array_equal(batchRes[i], loopRes)
+
+    def test_input_unchanged(self):
+        widthsCopy = widths.copy()
+        filterWidthsAndIntensitiesBatch(widths, intensities, BatchIC)
+        nptest.assert_array_equal(widths, widthsCopy)
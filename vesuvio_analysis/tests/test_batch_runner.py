@@ -0,0 +1,87 @@
+from vesuvio_analysis.batch_runner import readConfig, buildSampleClasses, configPaths, ipFilesPath
+import unittest
+import tempfile
+import numpy as np
+from pathlib import Path
+
+baseConfig = """
+[LoadVesuvioFrontParameters]
+runs = "38543-38564"
+ipfile = "ip2018_3.par"
+
+[GeneralInitialConditions]
+thickness = 0.001
+
+[ForwardInitialConditions]
+masses = [1.0079, 12, 16, 27]
+bounds = [[0, nan], [3, 6], [-3, 1]]
+constraints = []
+maskTOFRange = "None"
+scaleRaw = 1
+
+[UserScriptControls]
+runRoutine = true
+procedure = "FORWARD"
+"""
+
+sampleConfig = """
+extends = "_BaH2_base.toml"
+
+[ForwardInitialConditions]
+scaleRaw = 0.9
+"""
+
+
+class TestBatchRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmpDir.name)
+        (self.path / "_BaH2_base.toml").write_text(baseConfig)
+        (self.path / "BaH2_500C.toml").write_text(sampleConfig)
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def test_configs_in_directory_skip_base(self):
+        self.assertEqual(configPaths([self.path]), [self.path / "BaH2_500C.toml"])
+
+    def test_extended_config_is_merged(self):
+        config = readConfig(self.path / "BaH2_500C.toml")
+        self.assertEqual(config["name"], "BaH2_500C")
+        self.assertEqual(config["ForwardInitialConditions"]["scaleRaw"], 0.9)
+        self.assertEqual(config["UserScriptControls"]["procedure"], "FORWARD")
+
+    def test_classes_match_scripts(self):
+        classes = buildSampleClasses(readConfig(self.path / "BaH2_500C.toml"))
+        fwdIC = classes["ForwardInitialConditions"]
+
+        self.assertIsInstance(fwdIC.masses, np.ndarray)
+        self.assertEqual(fwdIC.bounds.shape, (3, 2))
+        self.assertTrue(np.isnan(fwdIC.bounds[0, 1]))
+        self.assertEqual(fwdIC.constraints, ())
+        self.assertIsNone(fwdIC.maskTOFRange)
+        self.assertEqual(fwdIC.thickness, 0.001)      # From GeneralInitialConditions
+        self.assertEqual(classes["LoadVesuvioFrontParameters"].ipfile, ipFilesPath / "ip2018_3.par")
+
+    def test_prompts_are_disabled(self):
+        classes = buildSampleClasses(readConfig(self.path / "BaH2_500C.toml"))
+        self.assertFalse(classes["UserScriptControls"].confirmClearWS)
+        self.assertFalse(classes["BootstrapInitialConditions"].userConfirmation)
+        self.assertFalse(classes["BootstrapInitialConditions"].runBootstrap)
+
+    def test_unknown_table_fails(self):
+        (self.path / "typo.toml").write_text("[BackwardInitialCondition]\nscaleRaw = 1\n")
+        with self.assertRaises(AssertionError):
+            readConfig(self.path / "typo.toml")
+
+    def test_constraints_fail(self):
+        (self.path / "constrained.toml").write_text(
+            "[BackwardInitialConditions]\nconstraints = [{type = \"eq\", fun = \"lambda par: par[0] - par[3]\"}]\n")
+        with self.assertRaisesRegex(AssertionError, "Constraints can not be set in configs"):
+            buildSampleClasses(readConfig(self.path / "constrained.toml"))
+
+    def test_distributed_bootstrap_fails(self):
+        (self.path / "distributed.toml").write_text("[BootstrapInitialConditions]\nrunBootstrap = true\ndistributed = true\n")
+        with self.assertRaisesRegex(AssertionError, "distributed.py"):
+            buildSampleClasses(readConfig(self.path / "distributed.toml"))
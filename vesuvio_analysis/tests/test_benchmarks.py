@@ -0,0 +1,27 @@
+from vesuvio_analysis.benchmarks.kernels import allCases, caseKey
+from vesuvio_analysis.benchmarks.runner import compareResults
+import unittest
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_cases_run(self):
+        """Each benchmarked kernel runs once on the smallest shapes."""
+        ran = set()
+        for name, pars, setup in allCases():
+            if (name in ran) and (name != "YSpaceModel"):
+                continue
+            if (pars.get("nBins", 145) != 145) or (pars.get("nSpec", 3) > 132):
+                continue
+            setup(**pars)()
+            ran.add(name)
+        self.assertEqual(len(ran), 12)
+
+    def test_unique_keys(self):
+        keys = [caseKey(name, pars) for name, pars, setup in allCases()]
+        self.assertEqual(len(keys), len(set(keys)))
+
+    def test_compare(self):
+        base = {"commit": "a", "results": {"x": {"min_s": 2.}, "y": {"min_s": 1.}}}
+        new = {"commit": "b", "results": {"x": {"min_s": 1.}}}
+        self.assertEqual(compareResults(base, new), {"x": 0.5})
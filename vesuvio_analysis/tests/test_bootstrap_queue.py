@@ -0,0 +1,53 @@
+from vesuvio_analysis.core_functions.bootstrap_queue import BootQueue
+import unittest
+import tempfile
+import os
+import time
+import numpy as np
+import numpy.testing as nptest
+from pathlib import Path
+
+
+class TestBootQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.queue = BootQueue(Path(self.tmpDir.name) / "queue", claimTimeout=60)
+        self.queue.publish(range(2, 6), {"parentWS": {"bckwdWS": Path("Parent_Back.nxs")}, "parentCorr": {}})
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def test_manifest(self):
+        samples, savePaths = self.queue.readManifest()
+        self.assertEqual(samples, [2, 3, 4, 5])
+        self.assertEqual(savePaths["parentWS"]["bckwdWS"], Path("Parent_Back.nxs"))
+        self.assertEqual(savePaths["parentCorr"], {})
+
+    def test_claims_unique(self):
+        otherWorker = BootQueue(self.queue.path, claimTimeout=60)
+        claimed = [self.queue.claim(), otherWorker.claim(), self.queue.claim(), otherWorker.claim()]
+        self.assertEqual(claimed, [2, 3, 4, 5])
+        self.assertIsNone(self.queue.claim())
+        self.assertFalse(self.queue.allDone())
+
+    def test_stale_claim(self):
+        i = self.queue.claim()
+        oldTime = time.time() - 120
+        os.utime(self.queue.claimPath(i), (oldTime, oldTime))
+        self.assertEqual(self.queue.claim(), i)    # Claimed again after timeout
+        self.assertEqual(self.queue.claim(), 3)
+
+    def test_shards(self):
+        for i in [2, 3, 4, 5]:
+            self.assertEqual(self.queue.claim(), i)
+            if i == 4:
+                self.queue.writeFailed(i)
+            else:
+                self.queue.writeShard(i, {"bckwdScat": np.full((3, 4), i)})
+        self.assertTrue(self.queue.allDone())
+
+        shards = dict(self.queue.readShards())
+        self.assertEqual(sorted(shards), [2, 3, 5])
+        nptest.assert_array_equal(shards[5]["bckwdScat"], np.full((3, 4), 5))
+        self.assertEqual([p for p in self.queue.shardsPath.iterdir() if p.suffix == ".tmp"], [])
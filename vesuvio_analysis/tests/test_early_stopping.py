@@ -0,0 +1,49 @@
+from vesuvio_analysis.core_functions.bootstrap import rewriteLogEntry, initializeMonitor
+from vesuvio_analysis.core_functions.bootstrap_analysis import checkLogMatch
+from vesuvio_analysis.core_functions.ICHelpers import header_string
+from xml.dom import NotFoundErr
+import unittest
+import tempfile
+from pathlib import Path
+
+
+class LogIC:
+    bootSavePathLog = "spec_3-134_iter_1_MS_nsampl_650.npz : BOOT_RESIDUALS | BACKWARD | 275.,1.,420 | None"
+
+
+class EarlyStopIC:
+    earlyStopTolerance = 0.01
+    earlyStopWindow = 50
+    earlyStopCI = False
+    bootstrapType = "BOOT_RESIDUALS"
+
+
+class TestEarlyStopping(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.ic = LogIC()
+        self.ic.logFilePath = Path(self.tmpDir.name) / "data_files_log.txt"
+        with open(self.ic.logFilePath, "w") as logFile:
+            logFile.write(header_string() + "\n" + LogIC.bootSavePathLog)
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def test_stopped_run_does_not_match_full_run(self):
+        stoppedLog = LogIC.bootSavePathLog + " | completed samples 120"
+        rewriteLogEntry(self.ic.logFilePath, LogIC.bootSavePathLog, stoppedLog)
+
+        with self.assertRaises(NotFoundErr):
+            checkLogMatch(self.ic, isYFitFile=False)
+
+        self.ic.bootSavePathLog = stoppedLog
+        checkLogMatch(self.ic, isYFitFile=False)
+        with open(self.ic.logFilePath, "r") as logFile:
+            self.assertEqual(logFile.read().count("spec_3-134_iter_1_MS_nsampl_650.npz"), 1)
+
+    def test_no_early_stopping_for_jackknife(self):
+        bootIC = EarlyStopIC()
+        self.assertIsNotNone(initializeMonitor(bootIC))
+        bootIC.bootstrapType = "JACKKNIFE"
+        self.assertIsNone(initializeMonitor(bootIC))
@@ -0,0 +1,25 @@
+from vesuvio_analysis.core_functions.analysis_functions import activeBounds, telemetryColumnNames
+import unittest
+import numpy as np
+import numpy.testing as nptest
+
+bounds = np.array([
+        [0, np.nan], [8, 16], [-3, 1],
+        [0, np.nan], [8, 16], [-3, 1]
+    ])
+
+
+class TestFitTelemetry(unittest.TestCase):
+
+    def test_active_bounds(self):
+        pars = np.array([0, 16, 0.5, 1e9, 8+1e-9, -3])
+        nptest.assert_array_equal(activeBounds(pars, bounds), [-1, 1, 0, 0, -1, -1])
+
+    def test_free_parameters(self):
+        pars = np.array([1, 12, 0, 1, 12.5, 0])
+        nptest.assert_array_equal(activeBounds(pars, bounds), np.zeros(6))
+
+    def test_columns_match_telemetry(self):
+        names = telemetryColumnNames(2)
+        self.assertEqual(len(names), len(bounds)+5)
+        self.assertEqual(names[5:8], ["Bound Intensity 0", "Bound Width 0", "Bound Center 0"])
@@ -0,0 +1,31 @@
+import unittest
+import subprocess
+import sys
+import json
+from pathlib import Path
+
+repoPath = Path(__file__).absolute().parent.parent.parent
+lazyModules = ["matplotlib.pyplot", "iminuit", "jacobi", "scipy.signal"]
+
+importCode = """
+import sys, time, json
+t0 = time.perf_counter()
+import {module}
+print(json.dumps({{"time": time.perf_counter()-t0, "loaded": [m for m in {lazy} if m in sys.modules]}}))
+"""
+
+
+def timeImport(module):
+    """Import time and lazy modules loaded, measured in a fresh interpreter."""
+    out = subprocess.run([sys.executable, "-c", importCode.format(module=module, lazy=lazyModules)],
+        cwd=repoPath, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+class TestImportTime(unittest.TestCase):
+
+    def test_lazy_imports(self):
+        baseline = timeImport("mantid.simpleapi")     # Modules loaded by Mantid itself are not counted
+        for module in ["vesuvio_analysis.core_functions.run_script", "vesuvio_analysis.core_functions.bootstrap_analysis"]:
+            result = timeImport(module)
+            self.assertEqual(sorted(set(result["loaded"]) - set(baseline["loaded"])), [], module)
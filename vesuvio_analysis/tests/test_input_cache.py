@@ -0,0 +1,74 @@
+from vesuvio_analysis.core_functions.input_cache import loadCachedInput, storeCachedInput, cacheEntryPath
+import unittest
+import tempfile
+import numpy as np
+import numpy.testing as nptest
+from pathlib import Path
+
+
+class CacheIC:
+    tofBinning = "275.,1.,420"
+    scaleRaw = 1
+    scaleEmpty = 1
+    subEmptyFromRaw = True
+
+
+class TestInputCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        path = Path(self.tmpDir.name)
+        (path / "raw.nxs").write_bytes(b"raw contents")
+        (path / "empty.nxs").write_bytes(b"empty contents")
+        self.ic = CacheIC()
+        self.ic.userWsRawPath = path / "raw.nxs"
+        self.ic.userWsEmptyPath = path / "empty.nxs"
+        self.ic.inputCachePath = path / "preprocessed_cache"
+        self.arrays = [np.arange(12.).reshape(3, 4), np.ones((3, 4)), np.full((3, 4), 0.1), np.array([3, 4, 5])]
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def store(self):
+        storeCachedInput(self.ic, *self.arrays, {"distribution": False}, lambda path: path.write_bytes(b"template"))
+
+    def test_round_trip(self):
+        self.assertIsNone(loadCachedInput(self.ic))
+        self.store()
+        arrays, meta, templatePath = loadCachedInput(self.ic)
+        for cached, original in zip(arrays, self.arrays):
+            self.assertIsInstance(cached, np.memmap)
+            nptest.assert_array_equal(cached, original)
+        self.assertFalse(meta["distribution"])
+        self.assertTrue(templatePath.is_file())
+
+    def test_key_changes_with_inputs(self):
+        self.store()
+        self.ic.scaleEmpty = 2
+        self.assertIsNone(loadCachedInput(self.ic))
+
+        self.ic.scaleEmpty = 1
+        self.ic.userWsRawPath.write_bytes(b"new raw contents")
+        self.assertIsNone(loadCachedInput(self.ic))
+
+    def test_failed_store_leaves_no_entry(self):
+        def failingTemplate(path):
+            raise RuntimeError("Save failed")
+        with self.assertRaises(RuntimeError):
+            storeCachedInput(self.ic, *self.arrays, {}, failingTemplate)
+        self.assertEqual(list(self.ic.inputCachePath.iterdir()), [])
+        self.assertFalse(cacheEntryPath(self.ic).exists())
+
+    def test_entry_stored_concurrently_is_kept(self):
+        def templateWhileOtherProcessStores(path):
+            path.write_bytes(b"template")
+            cacheEntryPath(self.ic).mkdir(parents=True)
+            (cacheEntryPath(self.ic) / "meta.json").write_text("{}")
+        storeCachedInput(self.ic, *self.arrays, {}, templateWhileOtherProcessStores)
+        self.assertEqual([p.name for p in self.ic.inputCachePath.iterdir()], [cacheEntryPath(self.ic).name])
+
+    def test_disk_errors_are_raised(self):
+        def deniedTemplate(path):
+            raise PermissionError("Permission denied")
+        with self.assertRaises(PermissionError):
+            storeCachedInput(self.ic, *self.arrays, {}, deniedTemplate)
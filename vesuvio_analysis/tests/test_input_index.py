@@ -0,0 +1,45 @@
+from vesuvio_analysis.core_functions.input_index import resolveInputWSDir, readIndex
+import unittest
+import tempfile
+import json
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+backDict = {"runs": "43066-43076", "empty_runs": "41876-41923", "spectra": "3-134", "mode": "DoubleDifference", "ipfile": "ip2019.par"}
+
+
+class TestInputIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.inputWSPath = Path(self.tmpDir.name)
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def test_new_and_matching_inputs(self):
+        wsDir = resolveInputWSDir(self.inputWSPath, "backward", backDict)
+        self.assertEqual(wsDir.name, "backward_1.0")
+        self.assertEqual(resolveInputWSDir(self.inputWSPath, "backward", dict(reversed(backDict.items()))), wsDir)
+
+        otherDir = resolveInputWSDir(self.inputWSPath, "backward", {**backDict, "runs": "43066"})
+        self.assertEqual(otherDir.name, "backward_2.0")
+        self.assertEqual(readIndex(self.inputWSPath)["versions"]["backward"], 2.0)
+
+    def test_index_from_existing_dirs(self):
+        storedDir = self.inputWSPath / "backward_3.0"
+        storedDir.mkdir()
+        with open(storedDir / "sample_backward.json", "w") as jsonFile:
+            json.dump(backDict, jsonFile)
+
+        self.assertEqual(resolveInputWSDir(self.inputWSPath, "backward", backDict), storedDir)
+        self.assertTrue((self.inputWSPath / "index.json").is_file())
+        newDir = resolveInputWSDir(self.inputWSPath, "backward", {**backDict, "runs": "43066"})
+        self.assertEqual(newDir.name, "backward_4.0")
+
+    def test_concurrent_registrations(self):
+        configs = [{**backDict, "runs": str(i)} for i in range(8)] * 2
+        with ThreadPoolExecutor(8) as executor:
+            dirs = list(executor.map(lambda d: resolveInputWSDir(self.inputWSPath, "backward", d), configs))
+        self.assertEqual(dirs[:8], dirs[8:])
+        self.assertEqual(len(set(dirs)), 8)
@@ -0,0 +1,119 @@
+import vesuvio_analysis.core_functions.ICHelpers as ICHelpers
+from vesuvio_analysis.core_functions.ICHelpers import saveAllWSFromLoadVesuvio, saveMissingInputWS
+from unittest.mock import patch
+from pathlib import Path
+import unittest
+import threading
+import tempfile
+import time
+
+
+class LoadVesuvioBackParameters:
+    runs = "43066-43076"
+    empty_runs = "41876-41923"
+    spectra = "3-134"
+    mode = "DoubleDifference"
+    ipfile = "ip2019.par"
+
+
+class LoadVesuvioFrontParameters:
+    runs = "43066-43076"
+    empty_runs = "43868-43911"
+    spectra = "144-182"
+    mode = "SingleDifference"
+    ipfile = "ip2018_3.par"
+
+
+class StubMantid:
+    """Records the time of each load and save, loads sleep to give other threads time to start."""
+
+    def __init__(self, failingRuns=None):
+        self.failingRuns = failingRuns
+        self.loads = []
+        self.saveEnds = []
+        self.lock = threading.Lock()
+
+    def LoadVesuvio(self, Filename, SpectrumList, Mode, InstrumentParFile, OutputWorkspace):
+        t0 = time.time()
+        time.sleep(0.2)
+        if Filename == self.failingRuns:
+            raise RuntimeError(f"Failed to load {Filename}")
+        with self.lock:
+            self.loads.append((t0, time.time()))
+        return OutputWorkspace
+
+    def SaveNexus(self, ws, path):
+        Path(path).write_bytes(ws.encode())
+        with self.lock:
+            self.saveEnds.append(time.time())
+
+
+class TestInputLoading(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmpDir.name)
+        self.stub = StubMantid()
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def saveAll(self, inputs):
+        jsonTimes = []
+        saveJsonFile = ICHelpers.saveJsonFile
+
+        def recordedSaveJsonFile(*args):
+            jsonTimes.append(time.time())
+            saveJsonFile(*args)
+
+        with patch.object(ICHelpers, "LoadVesuvio", self.stub.LoadVesuvio), \
+             patch.object(ICHelpers, "SaveNexus", self.stub.SaveNexus), \
+             patch.object(ICHelpers, "saveJsonFile", recordedSaveJsonFile):
+            saveAllWSFromLoadVesuvio(inputs)
+        return jsonTimes
+
+    def inputs(self):
+        return [
+            (LoadVesuvioBackParameters, self.path / "s_raw_backward.nxs", self.path / "s_empty_backward.nxs"),
+            (LoadVesuvioFrontParameters, self.path / "s_raw_forward.nxs", self.path / "s_empty_forward.nxs")
+            ]
+
+    def test_loads_overlap(self):
+        self.saveAll(self.inputs())
+
+        self.assertEqual(len(self.stub.loads), 4)
+        lastStart = max(start for start, end in self.stub.loads)
+        firstEnd = min(end for start, end in self.stub.loads)
+        self.assertLess(lastStart, firstEnd)        # All loads running at the same time
+
+    def test_json_written_after_all_saves(self):
+        jsonTimes = self.saveAll(self.inputs())
+
+        self.assertEqual(len(jsonTimes), 2)
+        self.assertGreaterEqual(min(jsonTimes), max(self.stub.saveEnds))
+        self.assertTrue((self.path / "s_backward.json").is_file())
+        self.assertTrue((self.path / "s_forward.json").is_file())
+        self.assertEqual(sorted(p.name for p in self.path.glob("*_tmp.nxs")), [])
+
+    def test_failed_load_is_raised(self):
+        self.stub.failingRuns = LoadVesuvioFrontParameters.empty_runs
+
+        with self.assertRaisesRegex(RuntimeError, "Failed to load"):
+            self.saveAll(self.inputs())
+        self.assertEqual(list(self.path.glob("*.json")), [])
+        self.assertFalse((self.path / "s_empty_forward.nxs").exists())
+
+    def test_only_missing_workspaces_are_saved(self):
+        with patch.object(ICHelpers, "experimentsPath", self.path):
+            rawPath, emptyPath = ICHelpers.inputDirsForSample(LoadVesuvioBackParameters, "sample")
+            rawPath.parent.mkdir()
+            rawPath.write_bytes(b"stored")
+            emptyPath.write_bytes(b"stored")
+
+            with patch.object(ICHelpers, "LoadVesuvio", self.stub.LoadVesuvio), \
+                 patch.object(ICHelpers, "SaveNexus", self.stub.SaveNexus):
+                saveMissingInputWS("sample", [LoadVesuvioBackParameters, LoadVesuvioFrontParameters])
+
+        self.assertEqual(len(self.stub.loads), 2)       # Only forward raw and empty
+        self.assertEqual(rawPath.read_bytes(), b"stored")
+        self.assertTrue(any(self.path.glob("sample/input_ws/forward_*/sample_raw_forward.nxs")))
@@ -1,4 +1,7 @@
 from vesuvio_analysis.core_functions.run_script import runScript
+from vesuvio_analysis.core_functions.bootstrap import selectJackknifeCols, JackMaskCol
+from vesuvio_analysis.core_functions.bootstrap_analysis import rescaleJackknifeSamples
+from vesuvio_analysis.core_functions.ICHelpers import noOfJackknifeSamples
 import unittest
 import numpy as np
 import numpy.testing as nptest
@@ -60,4 +63,81 @@ class TestJointBootstrap(unittest.TestCase):
     def testFront(self):
         nptest.assert_array_almost_equal(jackFrontSamples, self.oriJointFront)
 
- 
\ No newline at end of file
+ 
+
+
+class JackGroupsIC:
+    jackknifeGroups = 3
+    jackknifeGroupMode = "CONTIGUOUS"
+    runningTest = False
+
+
+class JackTOFIC:
+    tofBinning = "110,1.,430"      # 320 bins, last one ignored
+
+
+def jackDataY():
+    """Data with columns 2 and 5 masked."""
+    dataY = np.ones((4, 10))
+    dataY[:, [2, 5]] = 0
+    return dataY
+
+
+class TestJackknifeCols(unittest.TestCase):
+
+    def tearDown(self):
+        JackGroupsIC.jackknifeGroups = 3
+        JackGroupsIC.jackknifeGroupMode = "CONTIGUOUS"
+        JackGroupsIC.runningTest = False
+
+    def test_single_column(self):
+        JackGroupsIC.jackknifeGroups = None
+        nptest.assert_array_equal(selectJackknifeCols(jackDataY(), 9, 3, JackGroupsIC), [3])
+        with self.assertRaises(JackMaskCol):
+            selectJackknifeCols(jackDataY(), 9, 2, JackGroupsIC)
+
+    def test_contiguous_groups(self):
+        groups = [selectJackknifeCols(jackDataY(), 9, j, JackGroupsIC) for j in range(3)]
+        nptest.assert_array_equal(groups[0], [0, 1, 3])
+        nptest.assert_array_equal(groups[1], [4, 6])
+        nptest.assert_array_equal(groups[2], [7, 8])
+
+    def test_strided_groups(self):
+        JackGroupsIC.jackknifeGroupMode = "STRIDED"
+        groups = [selectJackknifeCols(jackDataY(), 9, j, JackGroupsIC) for j in range(3)]
+        nptest.assert_array_equal(groups[0], [0, 4, 8])
+        nptest.assert_array_equal(groups[1], [1, 6])
+        nptest.assert_array_equal(groups[2], [3, 7])
+
+    def test_groups_skip_masked_and_ignored_columns(self):
+        for mode in ["CONTIGUOUS", "STRIDED"]:
+            JackGroupsIC.jackknifeGroupMode = mode
+            cols = np.concatenate([selectJackknifeCols(jackDataY(), 9, j, JackGroupsIC) for j in range(3)])
+            nptest.assert_array_equal(np.sort(cols), [0, 1, 3, 4, 6, 7, 8])    # Each unmasked column once, last ignored
+
+    def test_more_groups_than_columns(self):
+        JackGroupsIC.jackknifeGroups = 8
+        with self.assertRaisesRegex(AssertionError, "Number of Jackknife groups"):
+            selectJackknifeCols(jackDataY(), 9, 0, JackGroupsIC)
+
+    def test_no_of_samples(self):
+        self.assertEqual(noOfJackknifeSamples(JackTOFIC, JackGroupsIC), 3)
+        JackGroupsIC.jackknifeGroups = None
+        self.assertEqual(noOfJackknifeSamples(JackTOFIC, JackGroupsIC), 319)
+        JackGroupsIC.runningTest = True
+        self.assertEqual(noOfJackknifeSamples(JackTOFIC, JackGroupsIC), 3)
+
+
+class TestJackknifeRescale(unittest.TestCase):
+
+    def test_nan_replicas_not_counted(self):
+        samples = np.random.uniform(1, 10, (2, 10))
+        samples[1, [3, 7]] = np.nan      # Failed fits of second parameter
+
+        rescaled = rescaleJackknifeSamples(samples, "Test")
+
+        for i, g in enumerate([10, 8]):
+            finite = samples[i][np.isfinite(samples[i])]
+            expected = finite.mean() + np.sqrt(g-1) * (finite - finite.mean())
+            nptest.assert_array_almost_equal(rescaled[i][np.isfinite(samples[i])], expected)
+        self.assertTrue(np.all(np.isnan(rescaled[1, [3, 7]])))
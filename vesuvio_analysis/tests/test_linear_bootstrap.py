@@ -0,0 +1,51 @@
+from vesuvio_analysis.core_functions.bootstrap import linearBootSpec, numericalJacobian, constraintsNullSpace
+import unittest
+import numpy as np
+import numpy.testing as nptest
+
+np.random.seed(2)   # Set seed so that tests match everytime
+
+
+class LinearIC:
+    bounds = np.array([[0, np.nan], [2, 2], [-3, 3]])
+    constraints = ()
+
+
+x = np.linspace(-5, 5, 200)
+design = np.vstack((np.exp(-x**2/2), x, np.ones(x.size))).T
+
+def linearModel(pars):
+    return design @ pars
+
+bestPars = np.array([1, 2, 0.5])
+dataE = np.full(x.size, 0.05)
+dataY = linearModel(bestPars) + np.random.normal(0, 0.05, x.size)
+
+
+class TestLinearBootstrap(unittest.TestCase):
+
+    def test_jacobian(self):
+        nptest.assert_allclose(numericalJacobian(linearModel, bestPars), design, atol=1e-6)
+
+    def test_null_space_fixed_par(self):
+        nullSpace = constraintsNullSpace(bestPars, LinearIC)
+        self.assertEqual(nullSpace.shape, (3, 2))
+        nptest.assert_allclose(nullSpace[1], 0, atol=1e-12)
+
+    def test_null_space_eq_constraint(self):
+        class ConstrIC(LinearIC):
+            bounds = np.array([[0, np.nan], [0, 5], [-3, 3]])
+            constraints = ({'type': 'eq', 'fun': lambda par: par[0] - 2*par[2]},)
+        nullSpace = constraintsNullSpace(bestPars, ConstrIC)
+        nptest.assert_allclose(nullSpace[0] - 2*nullSpace[2], 0, atol=1e-8)
+
+    def test_boot_samples(self):
+        bootPars, bootChi2 = linearBootSpec(linearModel, bestPars, dataY, dataE, LinearIC, 2000)
+        self.assertEqual(bootPars.shape, (2000, 3))
+        self.assertEqual(bootChi2.shape, (2000,))
+        # Fixed parameter is not perturbed
+        nptest.assert_allclose(bootPars[:, 1], 2)
+        # Spread of samples matches covariance of weighted least squares
+        freeDesign = design[:, [0, 2]]
+        cov = np.linalg.inv(freeDesign.T @ freeDesign / 0.05**2)
+        nptest.assert_allclose(np.std(bootPars[:, [0, 2]], axis=0), np.sqrt(np.diag(cov)), rtol=0.1)
@@ -0,0 +1,51 @@
+from vesuvio_analysis.core_functions import plotting
+from vesuvio_analysis.core_functions.plotting import submitFigure, flushFigures, backgroundFigures
+import unittest
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+
+def slowRender(savePath, text, threadNames):
+    time.sleep(0.05)
+    threadNames.append(threading.current_thread().name)
+    savePath.write_text(text)
+
+
+def failingRender(savePath):
+    raise RuntimeError("Render failed")
+
+
+class TestBackgroundFigures(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmpDir.name)
+        plotting.styleApplied = True     # Style needs matplotlib, not used by these renders
+
+    def tearDown(self):
+        plotting.styleApplied = False
+        self.tmpDir.cleanup()
+
+    def test_rendered_in_place_without_queue(self):
+        threadNames = []
+        submitFigure(slowRender, self.path / "fig.pdf", "ncp", threadNames)
+        self.assertEqual((self.path / "fig.pdf").read_text(), "ncp")
+        self.assertEqual(threadNames, [threading.current_thread().name])
+
+    def test_flushed_at_exit(self):
+        threadNames = []
+        with backgroundFigures(True):
+            for i in range(3):
+                submitFigure(slowRender, self.path / f"fig_{i}.pdf", str(i), threadNames)
+            self.assertLess(len(threadNames), 3)     # Pipeline continues while rendering
+        self.assertEqual([(self.path / f"fig_{i}.pdf").read_text() for i in range(3)], ["0", "1", "2"])
+        self.assertNotIn(threading.current_thread().name, threadNames)
+        self.assertIsNone(plotting.figureQueue)
+
+    def test_failed_figure_does_not_stop_run(self):
+        with backgroundFigures(True):
+            submitFigure(failingRender, self.path / "fig.pdf")
+            flushFigures()
+            self.assertEqual(plotting.pendingFigures, [])
@@ -0,0 +1,58 @@
+from vesuvio_analysis.core_functions import profiling
+from vesuvio_analysis.core_functions.profiling import profileRun, profiled, stage
+import unittest
+import tempfile
+import json
+from pathlib import Path
+
+
+@profiled("square")
+def square(x):
+    return x**2
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.profilesPath = Path(self.tmpDir.name) / "profiles"
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def test_disabled(self):
+        with profileRun(False, self.profilesPath, "test"):
+            self.assertEqual(square(3), 9)
+            with stage("outer"):
+                pass
+        self.assertFalse(self.profilesPath.exists())
+        self.assertIs(stage("outer"), profiling.nullStage)
+
+    def test_trace_and_summary(self):
+        with profileRun(True, self.profilesPath, "test"):
+            with stage("outer"):
+                for i in range(4):
+                    self.assertEqual(square(i), i**2)
+        self.assertFalse(profiling.profilingEnabled)
+
+        with open(self.profilesPath / "test_trace.json", "r") as traceFile:
+            events = json.load(traceFile)["traceEvents"]
+        self.assertEqual([e["name"] for e in events], ["square"]*4 + ["outer", "run"])
+
+        outer = events[4]
+        for e in events[:4]:      # Nested inside outer stage
+            self.assertTrue(outer["ts"] <= e["ts"])
+            self.assertTrue(e["ts"] + e["dur"] <= outer["ts"] + outer["dur"])
+
+        summary = profiling.stageSummary(events)
+        self.assertEqual(summary["square"]["calls"], 4)
+        self.assertEqual(list(summary)[0], "run")
+        self.assertTrue((self.profilesPath / "test_summary.txt").is_file())
+
+    def test_written_on_error(self):
+        with self.assertRaises(ValueError):
+            with profileRun(True, self.profilesPath, "test"):
+                with stage("failing"):
+                    raise ValueError()
+        self.assertFalse(profiling.profilingEnabled)
+        self.assertTrue((self.profilesPath / "test_trace.json").is_file())
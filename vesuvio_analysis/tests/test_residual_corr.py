@@ -0,0 +1,28 @@
+from vesuvio_analysis.core_functions.analysis_functions import residualAutoCorr
+import unittest
+import numpy as np
+import numpy.testing as nptest
+from scipy import stats
+
+np.random.seed(5)   # Set seed so that tests match everytime
+
+residuals = np.random.normal(0, 1, (12, 150))
+residuals[3] += np.sin(np.linspace(0, 20, 150))     # Correlated residuals
+residuals[7] = 0                                    # Masked spectrum
+lags = [1, 2, 5]
+
+
+class TestResidualCorr(unittest.TestCase):
+
+    def test_matches_pearsonr(self):
+        corr = residualAutoCorr(residuals, lags)
+        self.assertEqual(corr.shape, (12, 3, 2))
+        for i, row in enumerate(residuals):
+            if i == 7:
+                continue
+            for j, lag in enumerate(lags):
+                nptest.assert_allclose(corr[i, j], stats.pearsonr(row[:-lag], row[lag:]), rtol=1e-8, atol=1e-12)
+
+    def test_masked_spectrum(self):
+        corr = residualAutoCorr(residuals, lags)
+        self.assertTrue(np.all(np.isnan(corr[7])))
@@ -0,0 +1,88 @@
+from vesuvio_analysis.core_functions.results_store import saveResultsHDF5, StoredResults, icMetadata, h5py
+from vesuvio_analysis.core_functions.analysis_functions import resultsObject
+import unittest
+import tempfile
+import numpy as np
+import numpy.testing as nptest
+from pathlib import Path
+
+
+class StoreIC:
+    masses = np.array([12, 16, 27])
+    firstSpec = 3
+    noOfMSIterations = 2
+    userWsRawPath = Path("input_ws") / "starch_raw_backward.nxs"
+    fitFunction = staticmethod(np.sum)    # Not stored
+    noOfMasses = 3
+    maskedDetectorIdx = np.array([1])
+    resultsFormat = "npz"
+
+
+@unittest.skipIf(h5py is None, "h5py not installed")
+class TestResultsStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.savePath = Path(self.tmpDir.name) / "results.h5"
+        rng = np.random.default_rng(0)
+        self.arrays = {
+            "all_ncp_for_each_mass": rng.random((3, 40, 3, 50)),
+            "all_mean_widths": rng.random((3, 3)),
+            "all_fit_messages": np.array([["Success"] * 40] * 3)
+            }
+        saveResultsHDF5(self.savePath, self.arrays, icMetadata(StoreIC))
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def test_round_trip(self):
+        with StoredResults(self.savePath) as results:
+            for name, arr in self.arrays.items():
+                nptest.assert_array_equal(results.load(name), arr)
+            self.assertEqual(results.meta["masses"], [12, 16, 27])
+            self.assertEqual(results.meta["userWsRawPath"], str(StoreIC.userWsRawPath))
+            self.assertNotIn("fitFunction", results.meta)
+
+    def test_lazy_slices(self):
+        ncp = self.arrays["all_ncp_for_each_mass"]
+        with StoredResults(self.savePath) as results:
+            self.assertEqual(results["all_ncp_for_each_mass"].chunks, (1, 16, 3, 50))
+            nptest.assert_array_equal(results.iteration("all_ncp_for_each_mass", 1), ncp[1])
+            nptest.assert_array_equal(results.spectrum("all_ncp_for_each_mass", 20), ncp[:, 20])
+
+    def test_reads_npz(self):
+        npzPath = self.savePath.with_suffix(".npz")
+        np.savez(npzPath, **self.arrays)
+        with StoredResults(npzPath) as results:
+            nptest.assert_array_equal(results.spectrum("all_ncp_for_each_mass", 5), self.arrays["all_ncp_for_each_mass"][:, 5])
+
+
+class TestResultsAccumulator(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        StoreIC.resultsSavePath = Path(self.tmpDir.name) / "results.npz"
+        self.results = resultsObject(StoreIC)
+        rng = np.random.default_rng(0)
+        for j in range(StoreIC.noOfMSIterations + 1):
+            ncpForEachMass = rng.random((4, 3, 10))
+            self.results.addFit(rng.random((4, 11)), rng.random((4, 12)), rng.random((4, 14)),
+                ["Success"] * 4, ncpForEachMass, ncpForEachMass.sum(axis=1))
+            self.results.addMeans(*rng.random((4, 3)))
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def test_shapes(self):
+        self.assertEqual(self.results.all_ncp_for_each_mass.shape, (3, 4, 3, 10))
+        self.assertEqual(self.results.all_tot_ncp.shape, (3, 4, 10))
+        self.assertEqual(self.results.all_mean_widths.shape, (3, 3))
+        self.assertEqual(self.results.all_fit_messages.shape, (3, 4))
+        nptest.assert_array_equal(self.results.all_tot_ncp[:, 1], 0)    # Masked as in ncp workspaces
+
+    def test_save(self):
+        self.results.save()
+        with np.load(StoreIC.resultsSavePath) as stored:
+            self.assertEqual(sorted(stored.keys()), sorted(self.results.arrays().keys()))
+            self.assertTrue(np.all(np.isnan(stored["all_spec_best_par_chi_nit"][:, 1])))
+            nptest.assert_array_equal(stored["all_mean_widths"], self.results.all_mean_widths)
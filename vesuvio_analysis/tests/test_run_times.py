@@ -0,0 +1,93 @@
+from vesuvio_analysis.core_functions.run_times import storeRunTime, loadRunTimes, estimateRunTime, maxRecordsPerStage
+from concurrent.futures import ThreadPoolExecutor
+import unittest
+import tempfile
+from pathlib import Path
+
+
+class RunTimesIC:
+    firstSpec = 3
+    lastSpec = 12                 # 10 spectra
+    tofBinning = "100,1,200"      # 100 bins
+    noOfMasses = 2
+    modeRunning = "BACKWARD"
+    MSCorrectionFlag = True
+    GammaCorrectionFlag = False
+    number_of_events = 1.0e5
+    multiple_scattering_order = 2
+    useInputCache = False
+
+
+class TestRunTimes(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        RunTimesIC.runTimesPath = Path(self.tmpDir.name) / "running_times.json"
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+        RunTimesIC.modeRunning = "BACKWARD"
+        RunTimesIC.number_of_events = 1.0e5
+        RunTimesIC.useInputCache = False
+
+    def storeStages(self):
+        storeRunTime(RunTimesIC, "load", 2, 20, 100)       # 1e-3 s per spectrum and bin
+        storeRunTime(RunTimesIC, "crop", 1, 10, 100)       # 1e-3 s per spectrum and bin
+        storeRunTime(RunTimesIC, "ncp_fit", 0.4, 10, 100)  # 2e-3 s per bin and mass
+        storeRunTime(RunTimesIC, "ms", 5, 10, 100)         # 0.5 s per spectrum
+
+    def test_no_records(self):
+        self.assertIsNone(estimateRunTime(RunTimesIC, 1, False))
+
+    def test_missing_stage(self):
+        self.storeStages()
+        self.assertIsNone(estimateRunTime(RunTimesIC, 1, True))
+
+    def test_estimate(self):
+        self.storeStages()
+        # load + crop + 2 ncp fits of all spectra + 1 MS correction
+        self.assertAlmostEqual(estimateRunTime(RunTimesIC, 1, False), 1 + 1 + 2*10*0.4 + 5)
+        self.assertAlmostEqual(estimateRunTime(RunTimesIC, 0, False), 1 + 1 + 10*0.4)
+        self.assertAlmostEqual(estimateRunTime(RunTimesIC, 1, False, nWorkers=4), 1 + 1 + 2*10*0.4/4 + 5)
+
+    def test_estimate_uses_records_of_same_mode(self):
+        self.storeStages()
+        RunTimesIC.modeRunning = "FORWARD"
+        self.assertIsNone(estimateRunTime(RunTimesIC, 1, False))
+
+        storeRunTime(RunTimesIC, "load", 4, 10, 100)
+        storeRunTime(RunTimesIC, "crop", 4, 10, 100)
+        storeRunTime(RunTimesIC, "ncp_fit", 4, 10, 100)
+        storeRunTime(RunTimesIC, "ms", 4, 10, 100)
+        self.assertAlmostEqual(estimateRunTime(RunTimesIC, 1, False), 4 + 4 + 2*10*4 + 4)
+
+    def test_ms_scales_with_events(self):
+        self.storeStages()
+        RunTimesIC.number_of_events = 2.0e5
+        self.assertAlmostEqual(estimateRunTime(RunTimesIC, 1, False), 1 + 1 + 2*10*0.4 + 2*5)
+
+    def test_cache_loads_recorded_separately(self):
+        self.storeStages()
+        storeRunTime(RunTimesIC, "load_cache", 0.1, 10, 100)
+        self.assertEqual(len(loadRunTimes(RunTimesIC.runTimesPath)["load"]), 1)
+
+        self.assertAlmostEqual(estimateRunTime(RunTimesIC, 0, False), 1 + 1 + 10*0.4)
+        RunTimesIC.useInputCache = True
+        self.assertAlmostEqual(estimateRunTime(RunTimesIC, 0, False), 0.1 + 1 + 10*0.4)
+
+    def test_records_bounded(self):
+        for i in range(maxRecordsPerStage + 10):
+            storeRunTime(RunTimesIC, "crop", i, 10, 100)
+        records = loadRunTimes(RunTimesIC.runTimesPath)["crop"]
+        self.assertEqual(len(records), maxRecordsPerStage)
+        self.assertEqual(records[-1]["time"], maxRecordsPerStage + 9)
+
+    def test_concurrent_records_not_lost(self):
+        def storeMany(worker):
+            for i in range(20):
+                storeRunTime(RunTimesIC, "crop", worker, 10, 100)
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(storeMany, range(4)))
+        records = loadRunTimes(RunTimesIC.runTimesPath)["crop"]
+        self.assertEqual(len(records), 80)
@@ -0,0 +1,195 @@
+from vesuvio_analysis.core_functions.stage_graph import stageKeys, storeStage, restoreStage, isStageStored, runStage
+from mantid.api import AnalysisDataService, mtd
+from mantid.simpleapi import CreateWorkspace, CreateEmptyTableWorkspace, GroupWorkspaces
+import unittest
+import tempfile
+import numpy as np
+import numpy.testing as nptest
+from pathlib import Path
+
+
+class StageIC:
+    tofBinning = "275.,1.,420"
+    scaleRaw = 1
+    scaleEmpty = 1
+    subEmptyFromRaw = True
+    masses = np.array([12, 16, 27])
+    initPars = np.array([1, 12, 0., 1, 12, 0., 1, 12.5, 0.])
+    bounds = np.array([[0, np.nan], [8, 16], [-3, 1]] * 3)
+    constraints = ()
+    noOfMSIterations = 1
+
+
+class StageYFitIC:
+    rebinParametersForYSpaceFit = "-25, 0.5, 25"
+    fitModel = "SINGLE_GAUSSIAN"
+    globalFit = True
+
+
+class StageBootIC:
+    bootstrapType = "BOOT_RESIDUALS"
+    procedure = "FORWARD"
+    fitInYSpace = "FORWARD"
+    nSamples = 40
+
+
+class TestStageKeys(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        path = Path(self.tmpDir.name)
+        (path / "raw.nxs").write_bytes(b"raw contents")
+        (path / "empty.nxs").write_bytes(b"empty contents")
+        self.ic = StageIC()
+        self.ic.userWsRawPath = path / "raw.nxs"
+        self.ic.userWsEmptyPath = path / "empty.nxs"
+        self.yFitIC = StageYFitIC()
+        self.keys = stageKeys([self.ic], self.yFitIC)
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def changedStages(self):
+        newKeys = stageKeys([self.ic], self.yFitIC)
+        return [stage for stage in self.keys if self.keys[stage] != newKeys[stage]]
+
+    def test_keys_are_stable(self):
+        self.assertEqual(self.changedStages(), [])
+
+    def test_yfit_field_invalidates_only_yfit_stages(self):
+        self.yFitIC.rebinParametersForYSpaceFit = "-20, 0.5, 20"
+        self.assertEqual(self.changedStages(), ["y_reduction", "y_fit", "global_fit"])
+
+    def test_global_fit_field_invalidates_only_global_fit(self):
+        self.yFitIC.nGlobalFitGroups = 8
+        self.assertEqual(self.changedStages(), ["global_fit"])
+
+    def test_bootstrap_keyed_after_global_fit(self):
+        bootIC = StageBootIC()
+        keys = stageKeys([self.ic], self.yFitIC, bootIC)
+        self.assertNotIn("bootstrap", self.keys)
+        bootIC.nSamples = 100
+        self.assertNotEqual(stageKeys([self.ic], self.yFitIC, bootIC)["bootstrap"], keys["bootstrap"])
+        self.yFitIC.nGlobalFitGroups = 8
+        self.assertNotEqual(stageKeys([self.ic], self.yFitIC, StageBootIC())["bootstrap"], keys["bootstrap"])
+
+    def test_ncp_field_invalidates_suffix(self):
+        self.ic.initPars = self.ic.initPars.copy()
+        self.ic.initPars[1] = 13
+        self.assertEqual(self.changedStages(), ["ncp", "y_reduction", "y_fit", "global_fit"])
+
+    def test_h_ratio_iterations_invalidate_ncp(self):
+        self.ic.HToMassIdxRatio = None
+        self.keys = stageKeys([self.ic], self.yFitIC)
+        self.ic.noOfHRatioIterations = 2
+        self.assertEqual(self.changedStages(), ["ncp", "y_reduction", "y_fit", "global_fit"])
+
+    def test_input_contents_invalidate_all_stages(self):
+        self.ic.userWsRawPath.write_bytes(b"new raw contents")
+        self.assertEqual(self.changedStages(), ["load", "preprocess", "ncp", "y_reduction", "y_fit", "global_fit"])
+
+    def test_joint_keys_depend_on_both_ics(self):
+        otherIC = StageIC()
+        otherIC.userWsRawPath, otherIC.userWsEmptyPath = self.ic.userWsRawPath, self.ic.userWsEmptyPath
+        otherIC.noOfMSIterations = 0
+        self.assertNotEqual(stageKeys([self.ic, otherIC], self.yFitIC)["ncp"], self.keys["ncp"])
+
+
+class TestStageStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmpDir.name)
+        self.resultsPath = self.path / "results.npz"
+        self.resultsPath.write_bytes(b"results")
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def test_files_restored_to_original_path(self):
+        stagesPath = self.path / "stages"
+        self.assertFalse(isStageStored(stagesPath, "y_fit", "FORWARD", "key"))
+        storeStage(stagesPath, "y_fit", "FORWARD", "key", files=[self.resultsPath])
+        self.assertTrue(isStageStored(stagesPath, "y_fit", "FORWARD", "key"))
+        self.assertFalse(isStageStored(stagesPath, "y_fit", "BACKWARD", "key"))
+
+        self.resultsPath.write_bytes(b"results of other inputs")
+        restoreStage(stagesPath, "y_fit", "FORWARD", "key")
+        self.assertEqual(self.resultsPath.read_bytes(), b"results")
+
+
+
+class TestRunStage(unittest.TestCase):
+    """A restored stage leaves the same workspaces, initial conditions and return value as a fresh run."""
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.stagesPath = Path(self.tmpDir.name) / "stages"
+        self.runs = 0
+        self.clearsWorkspaces = False
+        AnalysisDataService.clear()
+
+    def tearDown(self):
+        AnalysisDataService.clear()
+        self.tmpDir.cleanup()
+
+    def procedure(self, ic):
+        self.runs += 1
+        if self.clearsWorkspaces:       # As the procedures
+            AnalysisDataService.clear()
+        ws = CreateWorkspace(DataX=[1., 2., 3.], DataY=[4., 5., 6.], DataE=[.1, .2, .3], OutputWorkspace="ws_final")
+        CreateWorkspace(DataX=[1., 2.], DataY=[7., 8.], OutputWorkspace="ws_ncp_0")
+        CreateWorkspace(DataX=[1., 2.], DataY=[9., 1.], OutputWorkspace="ws_ncp_1")
+        GroupWorkspaces(InputWorkspaces=["ws_ncp_0", "ws_ncp_1"], OutputWorkspace="ws_ncp")
+        table = CreateEmptyTableWorkspace(OutputWorkspace="ws_means")
+        table.addColumn(type="float", name="Mean Width")
+        table.addRow([4.7])
+        ic.HToMassIdxRatio = 19.06
+        ic.initPars = ic.initPars.copy()
+        ic.initPars[1] = 4.7
+        return ws, {"widths": np.array([4.7, 12.])}
+
+    def adsState(self):
+        state = {}
+        for name in sorted(mtd.getObjectNames()):
+            ws = mtd[name]
+            if hasattr(ws, "extractY"):
+                state[name] = ws.extractY().tolist()
+            elif hasattr(ws, "column"):
+                state[name] = ws.column(0)
+            else:
+                state[name] = sorted(ws.getNames())
+        return state
+
+    def runTwice(self):
+        results, states, ics = [], [], []
+        for run in range(2):
+            AnalysisDataService.clear()
+            CreateWorkspace(DataX=[1., 2.], DataY=[3., 3.], OutputWorkspace="ws_loaded_before")
+            ic = StageIC()
+            runFunc = lambda: self.procedure(ic)
+            ws, arrays = runStage(self.stagesPath, "ncp", "FORWARD", "key", runFunc, ICs=[ic], clearsWorkspaces=self.clearsWorkspaces)
+            results.append((ws.name(), ws.extractY(), arrays))     # Workspace handles do not outlive the ADS
+            states.append(self.adsState())
+            ics.append(ic)
+        return results, states, ics
+
+    def assertSameRuns(self, results, states, ics):
+        self.assertEqual(self.runs, 1)      # Second run restored
+        self.assertEqual(states[1], states[0])
+        self.assertEqual(results[1][0], "ws_final")
+        nptest.assert_array_equal(results[1][1], results[0][1])
+        nptest.assert_array_equal(results[1][2]["widths"], results[0][2]["widths"])
+        self.assertEqual(ics[1].HToMassIdxRatio, 19.06)
+        nptest.assert_array_equal(ics[1].initPars, ics[0].initPars)
+
+    def test_restored_stage_matches_fresh_run(self):
+        results, states, ics = self.runTwice()
+        self.assertSameRuns(results, states, ics)
+        self.assertIn("ws_loaded_before", states[1])
+
+    def test_restored_procedure_clears_workspaces(self):
+        self.clearsWorkspaces = True
+        results, states, ics = self.runTwice()
+        self.assertSameRuns(results, states, ics)
+        self.assertNotIn("ws_loaded_before", states[1])
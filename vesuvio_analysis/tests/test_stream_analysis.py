@@ -0,0 +1,62 @@
+from vesuvio_analysis.core_functions.bootstrap_analysis import analysisOfBootData, streamedAnalysisOfBootData, memmapNpzArray, OnlineMean
+import unittest
+import tempfile
+import numpy as np
+import numpy.testing as nptest
+from pathlib import Path
+
+np.random.seed(3)   # Set seed so that tests match everytime
+
+nSamples, nSpec, nMasses = 250, 60, 3
+
+
+def fakeBootSamples():
+    """Samples in same format as stored by Bootstrap, with a masked spectrum and a failed sample."""
+    samples = np.random.uniform(1, 10, (nSamples, nSpec, 1+3*nMasses+2))
+    samples[:, 4, 1:] = np.nan
+    samples[17] = np.nan
+    parent = np.random.uniform(1, 10, (nSpec, 1+3*nMasses+2))
+    return samples, parent
+
+
+class StreamIC:
+    masses = np.array([1.0079, 12, 16])
+    runningPreliminary = False
+    noOfMSIterations = 3
+
+
+class AnalysisIC:
+    filterAvg = True
+    plotRawWidthsIntensities = False
+    chunkSize = 40
+
+
+class TestStreamAnalysis(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.samples, parent = fakeBootSamples()
+        StreamIC.bootSavePath = Path(self.tmpDir.name) / "boot_data.npz"
+        np.savez(StreamIC.bootSavePath, boot_samples=self.samples, parent_result=parent)
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def test_memmap(self):
+        nptest.assert_array_equal(memmapNpzArray(StreamIC.bootSavePath, "boot_samples"), self.samples)
+
+    def test_online_mean(self):
+        onlineMean = OnlineMean()
+        for start in range(0, nSamples, 40):
+            onlineMean.update(self.samples[start : start+40])
+        nptest.assert_allclose(onlineMean.mean, np.mean(self.samples, axis=0))
+
+    def test_same_means(self):
+        for filterAvg in [False, True]:
+            AnalysisIC.filterAvg = filterAvg
+            meanW, meanI, parent = analysisOfBootData(AnalysisIC, StreamIC)
+            meanWStream, meanIStream, parentStream = streamedAnalysisOfBootData(AnalysisIC, StreamIC)
+            self.assertEqual(meanWStream.shape, (nMasses, nSamples-1))
+            nptest.assert_allclose(meanWStream, meanW)
+            nptest.assert_allclose(meanIStream, meanI)
+            nptest.assert_array_equal(parentStream, parent)
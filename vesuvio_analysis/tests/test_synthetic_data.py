@@ -0,0 +1,40 @@
+from vesuvio_analysis.core_functions.synthetic_data import generateSyntheticData, syntheticInstrPars, \
+    saveInstrParsFile, fitSyntheticData, SyntheticInitialConditions
+from vesuvio_analysis.core_functions.analysis_functions import loadInstrParsFileIntoArray
+import unittest
+import tempfile
+import numpy as np
+import numpy.testing as nptest
+from pathlib import Path
+
+masses = np.array([1.0079, 12, 16])
+intensities = np.array([0.5, 0.3, 0.2])
+widths = np.array([4.5, 12, 13])
+
+
+class TestSyntheticData(unittest.TestCase):
+
+    def test_shapes_synthetic_layout(self):
+        instrPars = syntheticInstrPars(1320, "BACKWARD")
+        dataX, dataY, dataE, fitArgs, truePars = generateSyntheticData(
+            masses, intensities, widths, instrPars=instrPars, tofBinning="275,1.,420", mode="BACKWARD")
+        self.assertEqual(dataY.shape, (1320, 145))
+        self.assertEqual(dataE.shape, dataY.shape)
+        nptest.assert_array_equal(truePars, [0.5, 4.5, 0, 0.3, 12, 0, 0.2, 13, 0])
+        self.assertTrue(np.all(np.isfinite(dataY)))
+
+    def test_ip_file_round_trip(self):
+        instrPars = syntheticInstrPars(20, "FORWARD", firstSpec=144)
+        with tempfile.TemporaryDirectory() as tmpDir:
+            ipPath = Path(tmpDir) / "synthetic.par"
+            saveInstrParsFile(instrPars, ipPath)
+            loaded = loadInstrParsFileIntoArray(ipPath, 144, 163)
+        nptest.assert_allclose(loaded, instrPars, atol=1e-4)
+
+    def test_fit_recovers_truth(self):
+        # Noise close to real data, much smaller errors scale chi2 beyond what SLSQP steps from initPars
+        ipPath = Path(__file__).absolute().parent.parent / "ip_files" / "ip2018_3.par"
+        dataX, dataY, dataE, fitArgs, truePars = generateSyntheticData(
+            masses, intensities, widths, ipFilePath=ipPath, firstSpec=144, lastSpec=146, noiseLevel=0.05)
+        bestPars = fitSyntheticData(SyntheticInitialConditions(masses), dataY, dataE, fitArgs)
+        nptest.assert_allclose(bestPars[:, 1], widths[0], rtol=0.05)     # H width, well separated in forward spectra
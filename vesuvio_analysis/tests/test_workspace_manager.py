@@ -0,0 +1,31 @@
+from vesuvio_analysis.core_functions import workspace_manager
+from vesuvio_analysis.core_functions.workspace_manager import workspacesToEvict, registerIntermediate, registerFinal, managedWorkspaces
+import unittest
+
+
+class TestWorkspaceManager(unittest.TestCase):
+
+    def setUp(self):
+        self.sizes = {"ws_0_Sum": 1, "ws_0_TOF_Fitted_Profile_0": 40, "ws_JoY": 80, "ws_JoY_Rebinned": 20}
+
+    def test_no_budget_evicts_all(self):
+        self.assertEqual(workspacesToEvict(self.sizes, None), list(self.sizes))
+
+    def test_budget_evicts_oldest_first(self):
+        self.assertEqual(workspacesToEvict(self.sizes, 100), ["ws_0_Sum", "ws_0_TOF_Fitted_Profile_0"])
+        self.assertEqual(workspacesToEvict(self.sizes, 141), [])
+        self.assertEqual(workspacesToEvict(self.sizes, 0), list(self.sizes))
+
+    def test_registry(self):
+        registerIntermediate("load", "ws_raw")      # Ignored when disabled
+        self.assertEqual(workspace_manager.registered, {})
+
+        with managedWorkspaces(True):
+            registerFinal("ws_3")
+            registerIntermediate("ws_3", "ws_3", "ws_3_Sum")
+            registerIntermediate("load", "ws_raw", "ws_empty")
+            self.assertEqual(workspace_manager.registered, {"ws_3_Sum": "ws_3", "ws_raw": "load", "ws_empty": "load"})
+
+            registerFinal("ws_raw")
+            self.assertNotIn("ws_raw", workspace_manager.registered)
+        self.assertFalse(workspace_manager.managerEnabled)
@@ -0,0 +1,48 @@
+from vesuvio_analysis.core_functions.fit_in_yspace import resampleJoYRows, meanYAtPoints
+import unittest
+import numpy as np
+import numpy.testing as nptest
+
+np.random.seed(6)   # Set seed so that tests match everytime
+
+xp = np.linspace(-10, 10, 21)
+dataY = np.random.uniform(0.1, 1, (8, 21))
+dataE = np.random.uniform(0.01, 0.1, (8, 21))
+dataY[:, [0, 20]] = 0        # Cut-offs
+dataE[:, [0, 20]] = 0
+dataY[4] = 0                 # Masked spectrum
+dataE[4] = 0
+dataX = np.repeat(xp[np.newaxis, :], 8, axis=0)
+meanY = np.random.uniform(0.1, 1, 21)
+
+
+class TestYSpaceBoot(unittest.TestCase):
+
+    def test_spectra_rows(self):
+        bootX, bootY, bootE = resampleJoYRows(dataX, dataY, dataE, None, "SPECTRA")
+        self.assertEqual(bootY.shape, dataY.shape)
+        for row, rowE in zip(bootY, bootE):      # Each row is a whole spectrum of original data
+            idx = np.argwhere(np.all(dataY==row, axis=1)).flatten()
+            self.assertTrue(len(idx) > 0)
+            nptest.assert_array_equal(rowE, dataE[idx[0]])
+
+    def test_residuals_keep_masks(self):
+        meanAtPoints = meanYAtPoints(dataX, meanY, xp, isXBinned=False)
+        bootX, bootY, bootE = resampleJoYRows(dataX, dataY, dataE, meanAtPoints, "RESIDUALS")
+        nptest.assert_array_equal(bootY==0, dataY==0)
+        nptest.assert_array_equal(bootE, dataE)
+
+        # Resampled values come from residuals of the same spectrum
+        for i in [0, 3]:
+            bootRes = np.sort((bootY - meanAtPoints)[i, 1:20])
+            residuals = (dataY - meanAtPoints)[i, 1:20]
+            self.assertTrue(np.all(np.isin(np.round(bootRes, 12), np.round(residuals, 12))))
+
+    def test_mean_at_xbinned_points(self):
+        xBinned = dataX.copy()
+        xBinned[:, 5] = xp[6]        # Several points in the same bin
+        xBinned[:, 0] = np.nan       # Points outside range
+        meanAtPoints = meanYAtPoints(xBinned, meanY, xp, isXBinned=True)
+        nptest.assert_array_equal(meanAtPoints[:, 5], meanY[6])
+        nptest.assert_array_equal(meanAtPoints[:, 0], 0)
+        nptest.assert_array_equal(meanAtPoints[:, 10], meanY[10])